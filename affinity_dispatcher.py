@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Daur MedIA - Affinity Dispatcher
+Распределение задач генерации между воркерами с учетом прогретого состояния
+
+Задача, попавшая на воркер без нужной модели, ждет ее загрузки (минуты),
+а задача с новой корзиной размеров - компиляции графов. Диспетчер знает,
+какие модели загружены у каждого воркера и какие корзины на них уже
+выполнялись или прогреты, и отдает воркеру в первую очередь задачи,
+для которых он прогрет (модель и корзина, затем только модель). Холодный
+воркер не забирает задачи, для которых прогрет другой, занятый воркер.
+
+Чтобы занятый прогретый воркер не держал задачу бесконечно, действует
+предел ожидания: задача, прождавшая дольше него, отдается первому
+освободившемуся воркеру независимо от прогрева.
+
+Воркеры добавляются и выводятся на ходу (автомасштабирование): выводимый
+воркер дорабатывает текущую задачу и новых не получает.
+"""
+
+import os
+import time
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+DEFAULT_MAX_WAIT_SECONDS = 300.0
+
+# Степень прогрева воркера для задачи
+COLD, MODEL_WARM, BUCKET_WARM = 0, 1, 2
+
+
+class _PendingTask:
+    __slots__ = ('task_id', 'model', 'bucket', 'submitted_at')
+
+    def __init__(self, task_id: str, model: Optional[str], bucket: Optional[str]):
+        self.task_id = task_id
+        self.model = model
+        self.bucket = bucket
+        self.submitted_at = time.time()
+
+
+class _Worker:
+    __slots__ = ('worker_id', 'task_id', 'warm', 'dispatched', 'warm_hits', 'idle_since', 'draining')
+
+    def __init__(self, worker_id: int):
+        self.worker_id = worker_id
+        self.task_id: Optional[str] = None
+        self.idle_since = time.time()
+        self.draining = False
+        # Загруженные модели -> прогретые корзины
+        self.warm: Dict[str, Set[str]] = {}
+        self.dispatched = 0
+        self.warm_hits = 0
+
+
+class AffinityDispatcher:
+    """Очередь задач генерации, общая для воркеров, с выбором по прогреву"""
+
+    def __init__(self, worker_count: int = 1, max_wait_seconds: float = DEFAULT_MAX_WAIT_SECONDS):
+        """
+        Args:
+            worker_count: Число воркеров генерации
+            max_wait_seconds: Предел ожидания прогретого воркера; дольше
+                ждавшую задачу берет любой свободный воркер
+        """
+        if worker_count < 1:
+            raise ValueError("Нужен хотя бы один воркер генерации")
+        self.max_wait_seconds = max_wait_seconds
+        self._condition = threading.Condition()
+        # В порядке поступления
+        self._pending: List[_PendingTask] = []
+        self._workers: Dict[int, _Worker] = {worker_id: _Worker(worker_id) for worker_id in range(worker_count)}
+        self._next_worker_id = worker_count
+        # Счетчик изменений очереди и состава воркеров (для кешей прогноза);
+        # читается без блокировки
+        self.version = 0
+        self.metrics = {
+            'dispatched': 0,
+            'warm_hits': 0,
+            'model_hits': 0,
+            'cold_starts': 0,
+            'starvation_overrides': 0,
+            'wait_seconds': 0.0
+        }
+
+    @classmethod
+    def from_env(cls, worker_count: Optional[int] = None) -> 'AffinityDispatcher':
+        """
+        Диспетчер из окружения: DAUR_MEDIA_GENERATION_WORKERS (число воркеров,
+        если не задано явно), DAUR_MEDIA_AFFINITY_MAX_WAIT (предел ожидания
+        прогретого воркера, с)
+        """
+        return cls(
+            worker_count=worker_count or int(os.environ.get('DAUR_MEDIA_GENERATION_WORKERS', '1')),
+            max_wait_seconds=float(os.environ.get('DAUR_MEDIA_AFFINITY_MAX_WAIT', DEFAULT_MAX_WAIT_SECONDS))
+        )
+
+    @property
+    def worker_count(self) -> int:
+        """Число воркеров, получающих задачи (без выводимых)"""
+        return len(self.worker_ids())
+
+    def worker_ids(self) -> List[int]:
+        with self._condition:
+            return [worker_id for worker_id, worker in self._workers.items() if not worker.draining]
+
+    def add_worker(self) -> int:
+        """Новый воркер; возвращает его номер"""
+        with self._condition:
+            worker_id = self._next_worker_id
+            self._next_worker_id += 1
+            self._workers[worker_id] = _Worker(worker_id)
+            self.version += 1
+            return worker_id
+
+    def retire_worker(self, worker_id: int) -> bool:
+        """
+        Вывод воркера: текущая задача дорабатывается, новых он не получает,
+        а next_task возвращает ему None
+        """
+        with self._condition:
+            worker = self._workers.get(worker_id)
+            if worker is None or worker.draining:
+                return False
+            worker.draining = True
+            self.version += 1
+            self._condition.notify_all()
+            return True
+
+    def remove_worker(self, worker_id: int) -> None:
+        """Удаление завершившегося воркера"""
+        with self._condition:
+            self._workers.pop(worker_id, None)
+            self.version += 1
+            self._condition.notify_all()
+
+    def submit(self, task_id: str, model: Optional[str], bucket: Optional[str]) -> None:
+        """Постановка задачи в очередь"""
+        with self._condition:
+            self._pending.append(_PendingTask(task_id, model, bucket))
+            self.version += 1
+            self._condition.notify_all()
+
+    def queued_ids(self) -> List[str]:
+        """Ожидающие задачи в порядке поступления"""
+        with self._condition:
+            return [task.task_id for task in self._pending]
+
+    def next_task(self, worker_id: int, timeout: Optional[float] = None) -> Optional[str]:
+        """
+        Следующая задача для воркера (блокирует, пока подходящей нет)
+
+        Args:
+            worker_id: Номер воркера
+            timeout: Предел ожидания; None - без предела
+
+        Returns:
+            Optional[str]: id задачи или None по истечении timeout
+            и для выводимого воркера
+        """
+        deadline = time.time() + timeout if timeout is not None else None
+        worker = self._workers[worker_id]
+        with self._condition:
+            while True:
+                if worker.draining:
+                    return None
+                now = time.time()
+                task, affinity, overridden, wake_in = self._select(worker, now)
+                if task is not None:
+                    self._pending.remove(task)
+                    self.version += 1
+                    self._record_dispatch(worker, task, affinity, overridden, now)
+                    return task.task_id
+                if deadline is not None:
+                    if now >= deadline:
+                        return None
+                    wake_in = min(wake_in, deadline - now) if wake_in is not None else deadline - now
+                self._condition.wait(wake_in)
+
+    def task_done(
+        self,
+        worker_id: int,
+        loaded: Dict[str, Iterable[str]],
+        model: Optional[str] = None,
+        bucket: Optional[str] = None
+    ) -> None:
+        """
+        Воркер освободился
+
+        Args:
+            worker_id: Номер воркера
+            loaded: Модели, загруженные у воркера, -> корзины, прогретые самой
+                моделью (например, компиляцией при загрузке)
+            model: Модель выполненной задачи
+            bucket: Корзина выполненной задачи (None - задача не выполнилась)
+        """
+        with self._condition:
+            worker = self._workers[worker_id]
+            worker.task_id = None
+            worker.idle_since = time.time()
+            self._update_warm(worker, loaded)
+            if bucket is not None and model in worker.warm:
+                worker.warm[model].add(bucket)
+            self._condition.notify_all()
+
+    def report_warm(self, worker_id: int, loaded: Dict[str, Iterable[str]]) -> None:
+        """Обновление загруженных моделей воркера вне задач (загрузка, выгрузка)"""
+        with self._condition:
+            worker = self._workers.get(worker_id)
+            if worker is not None:
+                self._update_warm(worker, loaded)
+                self._condition.notify_all()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Состояние воркеров, очередь и доля задач, попавших на прогретый воркер"""
+        with self._condition:
+            dispatched = self.metrics['dispatched']
+            now = time.time()
+            return {
+                'workers': [
+                    {
+                        'worker_id': worker.worker_id,
+                        'busy': worker.task_id is not None,
+                        'task_id': worker.task_id,
+                        'draining': worker.draining,
+                        'idle_seconds': round(now - worker.idle_since, 1) if worker.task_id is None else 0.0,
+                        'warm': {model: sorted(buckets) for model, buckets in worker.warm.items()},
+                        'dispatched': worker.dispatched,
+                        'warm_hit_ratio': round(worker.warm_hits / worker.dispatched, 3) if worker.dispatched else None
+                    }
+                    for worker in self._workers.values()
+                ],
+                'queued': len(self._pending),
+                'max_wait_seconds': self.max_wait_seconds,
+                'metrics': dict(self.metrics, wait_seconds=round(self.metrics['wait_seconds'], 1)),
+                'warm_hit_ratio': round(self.metrics['warm_hits'] / dispatched, 3) if dispatched else None,
+                'model_hit_ratio': round(
+                    (self.metrics['warm_hits'] + self.metrics['model_hits']) / dispatched, 3
+                ) if dispatched else None
+            }
+
+    @staticmethod
+    def _update_warm(worker: _Worker, loaded: Dict[str, Iterable[str]]) -> None:
+        # Выгруженные модели забываются вместе с их корзинами
+        worker.warm = {
+            model: worker.warm.get(model, set()) | set(buckets)
+            for model, buckets in loaded.items()
+        }
+
+    @staticmethod
+    def _affinity(worker: _Worker, task: _PendingTask) -> int:
+        buckets = worker.warm.get(task.model)
+        if buckets is None:
+            return COLD
+        return BUCKET_WARM if task.bucket in buckets else MODEL_WARM
+
+    def _select(self, worker: _Worker, now: float) -> Tuple[Optional[_PendingTask], int, bool, Optional[float]]:
+        """
+        Выбор задачи для воркера
+
+        Returns:
+            (задача, прогрев, взята по пределу ожидания, через сколько секунд
+            проверить снова, если задачи нет)
+        """
+        if not self._pending:
+            return None, COLD, False, None
+
+        oldest = self._pending[0]
+        waited = now - oldest.submitted_at
+        best, best_affinity = None, COLD
+        for task in self._pending:
+            affinity = self._affinity(worker, task)
+            if affinity > best_affinity:
+                best, best_affinity = task, affinity
+                if affinity == BUCKET_WARM:
+                    break
+
+        # Выводимый воркер задач больше не возьмет - их не ждут
+        others = [other for other in self._workers.values() if other is not worker and not other.draining]
+        if waited >= self.max_wait_seconds and best is not oldest:
+            # Предел ожидания: старейшая задача важнее прогрева
+            overridden = best is not None or any(self._affinity(other, oldest) for other in others)
+            return oldest, self._affinity(worker, oldest), overridden, None
+        if best is not None:
+            return best, best_affinity, False, None
+
+        # Воркер холоден для всех задач: берет старейшую из тех,
+        # которые не ждут другого, прогретого воркера
+        for task in self._pending:
+            if not any(self._affinity(other, task) for other in others):
+                return task, COLD, False, None
+        return None, COLD, False, self.max_wait_seconds - waited
+
+    def _record_dispatch(self, worker: _Worker, task: _PendingTask, affinity: int, overridden: bool, now: float) -> None:
+        worker.task_id = task.task_id
+        worker.dispatched += 1
+        self.metrics['dispatched'] += 1
+        self.metrics['wait_seconds'] += now - task.submitted_at
+        if overridden:
+            self.metrics['starvation_overrides'] += 1
+        if affinity == BUCKET_WARM:
+            worker.warm_hits += 1
+            self.metrics['warm_hits'] += 1
+        elif affinity == MODEL_WARM:
+            self.metrics['model_hits'] += 1
+        else:
+            self.metrics['cold_starts'] += 1
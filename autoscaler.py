@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Daur MedIA - Autoscaler
+Число воркеров генерации по очереди задач и ресурсам хоста
+
+Раз в интервал автоскейлер снимает состояние: глубину очереди, оценку
+работы в очереди (секунды по модели стоимости), загрузку CPU и свободную
+память. Воркер добавляется, когда работы на каждый воркер больше порога
+и есть ресурсы; выводится, когда очередь пуста, а воркер простаивает
+дольше порога. Пороги добавления и вывода разные, а после каждого
+решения действует пауза - число воркеров не колеблется на границе.
+
+Выводимый воркер дорабатывает текущую задачу (drain) и только потом
+завершается. Каждое решение, в том числе отказ от добавления из-за
+нехватки CPU или памяти, пишется в журнал с причиной.
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+GB = 1024 ** 3
+
+
+class AutoscalerConfig:
+    """Параметры автомасштабирования"""
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        min_workers: int = 1,
+        max_workers: int = 4,
+        interval: float = 10.0,
+        scale_up_backlog_seconds: float = 600.0,
+        scale_down_idle_seconds: float = 300.0,
+        cooldown_seconds: float = 60.0,
+        max_cpu_percent: float = 90.0,
+        min_free_memory_gb: float = 4.0
+    ):
+        """
+        Args:
+            enabled: Автомасштабирование включено
+            min_workers: Минимум воркеров
+            max_workers: Максимум воркеров
+            interval: Период проверки, с
+            scale_up_backlog_seconds: Работа в очереди на воркер, при которой
+                добавляется воркер
+            scale_down_idle_seconds: Простой воркера при пустой очереди,
+                после которого он выводится
+            cooldown_seconds: Пауза после решения (кроме выхода за min/max)
+            max_cpu_percent: Загрузка CPU, выше которой воркеры не добавляются
+            min_free_memory_gb: Свободная память, которая должна остаться
+                после добавления воркера
+        """
+        if min_workers < 1 or max_workers < min_workers:
+            raise ValueError(f"Некорректные пределы воркеров: {min_workers}..{max_workers}")
+        self.enabled = enabled
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.interval = interval
+        self.scale_up_backlog_seconds = scale_up_backlog_seconds
+        self.scale_down_idle_seconds = scale_down_idle_seconds
+        self.cooldown_seconds = cooldown_seconds
+        self.max_cpu_percent = max_cpu_percent
+        self.min_free_memory_gb = min_free_memory_gb
+
+    @classmethod
+    def from_env(cls) -> 'AutoscalerConfig':
+        """
+        Параметры из окружения: DAUR_MEDIA_AUTOSCALE (1/0), DAUR_MEDIA_MIN_WORKERS,
+        DAUR_MEDIA_MAX_WORKERS, DAUR_MEDIA_AUTOSCALE_INTERVAL,
+        DAUR_MEDIA_SCALE_UP_BACKLOG, DAUR_MEDIA_SCALE_DOWN_IDLE,
+        DAUR_MEDIA_SCALE_COOLDOWN, DAUR_MEDIA_SCALE_MAX_CPU, DAUR_MEDIA_SCALE_MIN_FREE_GB
+        """
+        def _float(name, default):
+            return float(os.environ.get(name, default))
+
+        min_workers = int(os.environ.get('DAUR_MEDIA_MIN_WORKERS', '1'))
+        return cls(
+            enabled=os.environ.get('DAUR_MEDIA_AUTOSCALE', '0').lower() in ('1', 'true', 'yes'),
+            min_workers=min_workers,
+            max_workers=int(os.environ.get('DAUR_MEDIA_MAX_WORKERS', str(max(4, min_workers)))),
+            interval=_float('DAUR_MEDIA_AUTOSCALE_INTERVAL', 10.0),
+            scale_up_backlog_seconds=_float('DAUR_MEDIA_SCALE_UP_BACKLOG', 600.0),
+            scale_down_idle_seconds=_float('DAUR_MEDIA_SCALE_DOWN_IDLE', 300.0),
+            cooldown_seconds=_float('DAUR_MEDIA_SCALE_COOLDOWN', 60.0),
+            max_cpu_percent=_float('DAUR_MEDIA_SCALE_MAX_CPU', 90.0),
+            min_free_memory_gb=_float('DAUR_MEDIA_SCALE_MIN_FREE_GB', 4.0)
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'enabled': self.enabled,
+            'min_workers': self.min_workers,
+            'max_workers': self.max_workers,
+            'interval': self.interval,
+            'scale_up_backlog_seconds': self.scale_up_backlog_seconds,
+            'scale_down_idle_seconds': self.scale_down_idle_seconds,
+            'cooldown_seconds': self.cooldown_seconds,
+            'max_cpu_percent': self.max_cpu_percent,
+            'min_free_memory_gb': self.min_free_memory_gb
+        }
+
+
+class Autoscaler:
+    """
+    Фоновое масштабирование воркеров
+
+    Состояние и действия приходят от вызывающего кода через функции,
+    поэтому автоскейлер не зависит от того, потоки это или процессы.
+    """
+
+    def __init__(
+        self,
+        config: AutoscalerConfig,
+        observe: Callable[[], Dict[str, Any]],
+        scale_up: Callable[[], Any],
+        scale_down: Callable[[int], bool],
+        history_size: int = 100
+    ):
+        """
+        Args:
+            config: Параметры
+            observe: Снимок состояния: workers (число получающих задачи),
+                queued, backlog_seconds, cpu_percent, memory_available_bytes,
+                worker_memory_bytes (память под новый воркер) и
+                idle_workers - [(номер, секунд простоя)] выводимых кандидатов
+            scale_up: Запуск воркера
+            scale_down: Вывод воркера по номеру (False - не удалось)
+            history_size: Сколько последних решений хранить
+        """
+        self.config = config
+        self.observe = observe
+        self.scale_up = scale_up
+        self.scale_down = scale_down
+        self.history = deque(maxlen=history_size)
+        self._last_action = 0.0
+        self._last_hold_reason: Optional[str] = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.metrics = {'checks': 0, 'scale_ups': 0, 'scale_downs': 0, 'holds': 0, 'errors': 0}
+
+    def start(self) -> None:
+        """Запуск фонового потока"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='autoscaler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Остановка фонового потока"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def decide(self, state: Dict[str, Any], now: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Решение по снимку состояния (без действий)
+
+        Returns:
+            Dict: action ('scale_up', 'scale_down', 'hold' или None - ничего
+            не требуется), reason, worker_id (для scale_down)
+        """
+        now = time.time() if now is None else now
+        config = self.config
+        workers = state['workers']
+        if workers < config.min_workers:
+            return {'action': 'scale_up', 'reason': f"воркеров {workers} меньше минимума {config.min_workers}"}
+        if workers > config.max_workers:
+            candidates = state.get('idle_workers') or []
+            if candidates:
+                return {
+                    'action': 'scale_down', 'worker_id': candidates[0][0],
+                    'reason': f"воркеров {workers} больше максимума {config.max_workers}"
+                }
+        if now - self._last_action < config.cooldown_seconds:
+            return {'action': None, 'reason': 'пауза после прошлого решения'}
+
+        backlog_per_worker = state['backlog_seconds'] / max(workers, 1)
+        if state['queued'] and backlog_per_worker > config.scale_up_backlog_seconds:
+            demand = (
+                f"в очереди {state['queued']} задач, ~{backlog_per_worker:.0f} с работы на воркер "
+                f"(порог {config.scale_up_backlog_seconds:.0f} с)"
+            )
+            if workers >= config.max_workers:
+                return {'action': 'hold', 'reason': f"{demand}, но достигнут максимум {config.max_workers}"}
+            if state['cpu_percent'] >= config.max_cpu_percent:
+                return {
+                    'action': 'hold',
+                    'reason': f"{demand}, но CPU загружен на {state['cpu_percent']:.0f}% "
+                              f"(порог {config.max_cpu_percent:.0f}%)"
+                }
+            free_after = state['memory_available_bytes'] - state['worker_memory_bytes']
+            if free_after < config.min_free_memory_gb * GB:
+                return {
+                    'action': 'hold',
+                    'reason': f"{demand}, но после запуска воркера останется {free_after / GB:.1f} ГБ "
+                              f"(нужно {config.min_free_memory_gb:.1f} ГБ)"
+                }
+            return {'action': 'scale_up', 'reason': demand}
+
+        if not state['queued'] and workers > config.min_workers:
+            idle = [item for item in state.get('idle_workers') or [] if item[1] >= config.scale_down_idle_seconds]
+            if idle:
+                worker_id, idle_seconds = max(idle, key=lambda item: item[1])
+                return {
+                    'action': 'scale_down', 'worker_id': worker_id,
+                    'reason': f"очередь пуста, воркер {worker_id} простаивает {idle_seconds:.0f} с "
+                              f"(порог {config.scale_down_idle_seconds:.0f} с)"
+                }
+        return {'action': None, 'reason': 'нагрузка в пределах порогов'}
+
+    def check(self) -> Dict[str, Any]:
+        """Один проход: снимок, решение и его выполнение"""
+        with self._lock:
+            state = self.observe()
+            now = time.time()
+            decision = self.decide(state, now)
+            self.metrics['checks'] += 1
+            action = decision['action']
+            if action is None:
+                self._last_hold_reason = None
+                return decision
+
+            if action == 'hold':
+                self.metrics['holds'] += 1
+                # Повторяющийся отказ пишется в журнал один раз
+                if decision['reason'] != self._last_hold_reason:
+                    logger.info(f"Автомасштабирование: воркер не добавлен - {decision['reason']}")
+                    self._record(decision, state, now)
+                self._last_hold_reason = decision['reason']
+                return decision
+
+            self._last_hold_reason = None
+            if action == 'scale_up':
+                decision['worker_id'] = self.scale_up()
+                self.metrics['scale_ups'] += 1
+                logger.info(f"Автомасштабирование: добавлен воркер {decision['worker_id']} - {decision['reason']}")
+            elif self.scale_down(decision['worker_id']):
+                self.metrics['scale_downs'] += 1
+                logger.info(f"Автомасштабирование: выводится воркер {decision['worker_id']} - {decision['reason']}")
+            else:
+                decision['action'] = None
+                return decision
+            self._last_action = now
+            self._record(decision, state, now)
+            return decision
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'config': self.config.to_dict(),
+                'metrics': dict(self.metrics),
+                'decisions': list(self.history)
+            }
+
+    def _record(self, decision: Dict[str, Any], state: Dict[str, Any], now: float) -> None:
+        self.history.append({
+            'at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(now)),
+            'action': decision['action'],
+            'worker_id': decision.get('worker_id'),
+            'reason': decision['reason'],
+            'workers': state['workers'],
+            'queued': state['queued'],
+            'backlog_seconds': round(state['backlog_seconds'], 1),
+            'cpu_percent': state['cpu_percent'],
+            'memory_available_gb': round(state['memory_available_bytes'] / GB, 1)
+        })
+
+    def _run(self) -> None:
+        """Цикл фонового потока"""
+        while not self._stop_event.is_set():
+            try:
+                self.check()
+            except Exception as e:
+                self.metrics['errors'] += 1
+                logger.error(f"Ошибка автомасштабирования: {e}")
+            self._stop_event.wait(self.config.interval)
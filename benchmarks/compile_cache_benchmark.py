@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк кеша скомпилированных графов: задержка первой задачи после перезапуска
+
+DiT со случайными весами устроен как HunyuanVideo (списки double_blocks и
+single_blocks), у VAE есть decoder - compile_cache компилирует их так же,
+как настоящую модель. Каждый режим - отдельный процесс, как перезапуск
+сервера:
+- eager: без компиляции
+- cold: компиляция с пустым каталогом кеша
+- warm: повторный запуск с кешем, оставшимся от cold
+"""
+
+import os
+import sys
+import argparse
+import subprocess
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def build_models(hidden, depth):
+    """DiT и VAE со случайными весами"""
+    import torch
+    from torch import nn
+
+    class Block(nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.heads = hidden // 64
+            self.norm1 = nn.LayerNorm(hidden)
+            self.qkv = nn.Linear(hidden, hidden * 3)
+            self.proj = nn.Linear(hidden, hidden)
+            self.norm2 = nn.LayerNorm(hidden)
+            self.mlp = nn.Sequential(nn.Linear(hidden, hidden * 4), nn.GELU(approximate='tanh'), nn.Linear(hidden * 4, hidden))
+
+        def forward(self, x):
+            b, n, _ = x.shape
+            q, k, v = self.qkv(self.norm1(x)).reshape(b, n, 3, self.heads, 64).permute(2, 0, 3, 1, 4)
+            attention = torch.nn.functional.scaled_dot_product_attention(q, k, v)
+            x = x + self.proj(attention.transpose(1, 2).reshape(b, n, hidden))
+            return x + self.mlp(self.norm2(x))
+
+    class FakeDiT(nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.embed = nn.Linear(16 * 4, hidden)
+            self.double_blocks = nn.ModuleList([Block() for _ in range(depth)])
+            self.single_blocks = nn.ModuleList([Block() for _ in range(depth)])
+            self.head = nn.Linear(hidden, 16 * 4)
+
+        def forward(self, latents):
+            b, c, t, h, w = latents.shape
+            x = latents.reshape(b, c, t, h // 2, 2, w // 2, 2).permute(0, 2, 3, 5, 1, 4, 6)
+            x = self.embed(x.reshape(b, t * (h // 2) * (w // 2), c * 4))
+            for block in [*self.double_blocks, *self.single_blocks]:
+                x = block(x)
+            x = self.head(x).reshape(b, t, h // 2, w // 2, c, 2, 2)
+            return x.permute(0, 4, 1, 2, 5, 3, 6).reshape(b, c, t, h, w)
+
+    class FakeVAE(nn.Module):
+        def __init__(self):
+            super().__init__()
+            layers = [nn.Conv3d(16, 64, 3, padding=1), nn.SiLU()]
+            for _ in range(3):
+                layers += [nn.Upsample(scale_factor=(1, 2, 2), mode='nearest'), nn.Conv3d(64, 64, 3, padding=1), nn.SiLU()]
+            self.decoder = nn.Sequential(*layers, nn.Conv3d(64, 3, 3, padding=1))
+
+        def decode(self, latents):
+            return self.decoder(latents)
+
+    torch.manual_seed(0)
+    return FakeDiT().eval(), FakeVAE().eval()
+
+
+def run_single(mode, cache_dir, buckets, steps, hidden, depth):
+    """Замер в текущем процессе: первая задача и установившийся шаг каждой корзины"""
+    import torch
+    from compile_cache import CompileCache, CompileConfig
+
+    started = time.time()
+    dit, vae = build_models(hidden, depth)
+    cache = CompileCache(CompileConfig(enabled=mode != 'eager', cache_dir=cache_dir))
+    if cache.config.enabled:
+        cache.compile({'transformer': dit, 'vae': vae}, bucket_count=len(buckets), extra={'benchmark': True})
+
+    def generate(latents):
+        x = latents
+        for _ in range(steps):
+            x = x - 0.1 * dit(x)
+        return vae.decode(x)
+
+    first_runs = []
+    with torch.inference_mode():
+        for key in buckets:
+            width, height, video_length = (int(value) for value in key.split('x'))
+            latents = torch.randn(1, 16, (video_length - 1) // 4 + 1, height // 8, width // 8)
+            run_started = time.time()
+            cache.run(key, lambda: generate(latents), warmup=True)
+            first_runs.append(time.time() - run_started)
+        run_started = time.time()
+        generate(latents)
+        steady = time.time() - run_started
+    total = time.time() - started
+    print(f"{sum(first_runs):.2f} {steady:.3f} {total:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк кеша torch.compile по корзинам")
+    parser.add_argument("--buckets", nargs='+', default=['256x144x9', '144x256x9', '192x192x17'], help="Корзины WxHxL")
+    parser.add_argument("--steps", type=int, default=4, help="Шагов денойзинга")
+    parser.add_argument("--hidden", type=int, default=256, help="Размер скрытого слоя DiT")
+    parser.add_argument("--depth", type=int, default=2, help="Блоков каждого типа")
+    parser.add_argument("--single", nargs=2, metavar=('MODE', 'CACHE_DIR'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        run_single(args.single[0], args.single[1], args.buckets, args.steps, args.hidden, args.depth)
+        return
+
+    options = ['--buckets', *args.buckets, '--steps', str(args.steps), '--hidden', str(args.hidden), '--depth', str(args.depth)]
+    with tempfile.TemporaryDirectory() as cache_dir:
+        # Свой каталог Inductor, чтобы cold не подхватил кеш прошлых запусков
+        env = dict(os.environ)
+        env.pop('TORCHINDUCTOR_CACHE_DIR', None)
+        for mode in ('eager', 'cold', 'warm'):
+            result = subprocess.run(
+                [sys.executable, __file__, '--single', mode, cache_dir, *options],
+                check=True, capture_output=True, text=True, env=env
+            )
+            first_runs, steady, total = result.stdout.split()[-3:]
+            print(
+                f"{mode:>5}: первые задачи {len(args.buckets)} корзин {first_runs} с, "
+                f"установившаяся задача {steady} с, процесс целиком {total} с"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк CPU-режима: настройки PyTorch по умолчанию против cpu_runtime
+
+Вместо HunyuanVideo используются уменьшенные модели со случайными весами
+той же формы вычислений: DiT из блоков внимания над латентными патчами
+и декодер VAE из 3D-сверток с повышением разрешения. Каждый режим
+запускается в отдельном процессе, потому что число потоков PyTorch
+задается один раз на процесс.
+"""
+
+import os
+import sys
+import argparse
+import subprocess
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def build_models(hidden, depth):
+    """DiT и декодер VAE со случайными весами"""
+    import torch
+    from torch import nn
+
+    class Block(nn.Module):
+        """Блок в духе single-stream блоков HunyuanVideo: qkv, внимание, MLP"""
+
+        def __init__(self):
+            super().__init__()
+            self.heads = hidden // 64
+            self.norm1 = nn.LayerNorm(hidden)
+            self.qkv = nn.Linear(hidden, hidden * 3)
+            self.proj = nn.Linear(hidden, hidden)
+            self.norm2 = nn.LayerNorm(hidden)
+            self.mlp = nn.Sequential(nn.Linear(hidden, hidden * 4), nn.GELU(approximate='tanh'), nn.Linear(hidden * 4, hidden))
+
+        def forward(self, x):
+            b, n, _ = x.shape
+            q, k, v = self.qkv(self.norm1(x)).reshape(b, n, 3, self.heads, 64).permute(2, 0, 3, 1, 4)
+            attention = torch.nn.functional.scaled_dot_product_attention(q, k, v)
+            x = x + self.proj(attention.transpose(1, 2).reshape(b, n, hidden))
+            return x + self.mlp(self.norm2(x))
+
+    class FakeDiT(nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.embed = nn.Linear(16 * 4, hidden)
+            self.blocks = nn.ModuleList([Block() for _ in range(depth)])
+            self.head = nn.Linear(hidden, 16 * 4)
+
+        def forward(self, latents):
+            b, c, t, h, w = latents.shape
+            # Патчи 1x2x2, как в HunyuanVideo
+            x = latents.reshape(b, c, t, h // 2, 2, w // 2, 2).permute(0, 2, 3, 5, 1, 4, 6)
+            x = self.embed(x.reshape(b, t * (h // 2) * (w // 2), c * 4))
+            for block in self.blocks:
+                x = block(x)
+            x = self.head(x).reshape(b, t, h // 2, w // 2, c, 2, 2)
+            return x.permute(0, 4, 1, 2, 5, 3, 6).reshape(b, c, t, h, w)
+
+    def up_block(channels_in, channels_out):
+        return nn.Sequential(
+            nn.Upsample(scale_factor=(1, 2, 2), mode='nearest'),
+            nn.Conv3d(channels_in, channels_out, 3, padding=1),
+            nn.SiLU()
+        )
+
+    vae = nn.Sequential(
+        nn.Conv3d(16, 128, 3, padding=1),
+        nn.SiLU(),
+        up_block(128, 128),
+        up_block(128, 64),
+        up_block(64, 32),
+        nn.Conv3d(32, 3, 3, padding=1)
+    )
+    torch.manual_seed(0)
+    return FakeDiT().eval(), vae.eval()
+
+
+def run_single(mode, steps, frames, height, width, hidden, depth):
+    """Замер в текущем процессе"""
+    import torch
+    from cpu_runtime import CPUConfig, apply_channels_last, configure_cpu_runtime, cpu_autocast, to_channels_last
+    from contextlib import nullcontext
+
+    config = None
+    if mode == 'fast':
+        config = CPUConfig()
+        configure_cpu_runtime(config)
+
+    dit, vae = build_models(hidden, depth)
+    latents = torch.randn(1, 16, (frames - 1) // 4 + 1, height // 8, width // 8)
+    if config is not None and config.channels_last:
+        vae = apply_channels_last(vae)
+
+    autocast = cpu_autocast(config) if config is not None else nullcontext()
+    with torch.inference_mode(), autocast:
+        dit(latents)  # прогрев
+        started = time.time()
+        x = latents
+        for _ in range(steps):
+            x = x - 0.1 * dit(x)
+        steps_per_second = steps / (time.time() - started)
+
+        decode_input = to_channels_last(x) if config is not None and config.channels_last else x
+        vae(decode_input[:, :, :1])  # прогрев
+        started = time.time()
+        vae(decode_input)
+        decode_seconds = time.time() - started
+
+    print(f"{steps_per_second:.3f} {decode_seconds:.3f} {torch.get_num_threads()} {int(bool(config and config.bf16))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк CPU-режима на модели со случайными весами")
+    parser.add_argument("--steps", type=int, default=5, help="Шагов денойзинга")
+    parser.add_argument("--frames", type=int, default=17, help="Длина видео в кадрах")
+    parser.add_argument("--height", type=int, default=256, help="Высота")
+    parser.add_argument("--width", type=int, default=448, help="Ширина")
+    parser.add_argument("--hidden", type=int, default=512, help="Размер скрытого слоя DiT")
+    parser.add_argument("--depth", type=int, default=4, help="Блоков DiT")
+    parser.add_argument("--single", choices=['baseline', 'fast'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    options = [
+        '--steps', str(args.steps), '--frames', str(args.frames),
+        '--height', str(args.height), '--width', str(args.width),
+        '--hidden', str(args.hidden), '--depth', str(args.depth)
+    ]
+    if args.single:
+        run_single(args.single, args.steps, args.frames, args.height, args.width, args.hidden, args.depth)
+        return
+
+    results = {}
+    for mode in ('baseline', 'fast'):
+        result = subprocess.run(
+            [sys.executable, __file__, '--single', mode, *options],
+            check=True, capture_output=True, text=True
+        )
+        steps_per_second, decode_seconds, threads, bf16 = result.stdout.split()[-4:]
+        results[mode] = float(steps_per_second)
+        print(
+            f"{mode:>9}: {steps_per_second} шагов/с, декодирование VAE {decode_seconds} с "
+            f"(потоков {threads}, bf16={'да' if bf16 == '1' else 'нет'})"
+        )
+
+    print(f"Ускорение шагов: x{results['fast'] / results['baseline']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк размещения воркеров по ядрам: лучшее деление воркеры x потоки
+
+Для корзины размеров перебираются деления физических ядер хоста:
+1 воркер на все ядра, 2 воркера по половине и так далее. Воркеры
+порождаются зиготой и привязываются к своим слотам (cpu_placement),
+общий поток задач раздается им параллельно. Для каждого деления
+измеряются пропускная способность (задач в минуту) и средняя задержка
+задачи; для сравнения те же воркеры запускаются без привязки, каждый с
+потоками по числу всех ядер (как без слоя размещения).
+
+Нагрузка по умолчанию - DiT со случайными весами (внимание и MLP) на
+латентных токенах корзины; --token-scale уменьшает их число для быстрых
+прогонов. С --real задачи выполняет модель HunyuanVideo из реестра
+(DAUR_MEDIA_MODELS, --model) с --steps шагами.
+"""
+
+import os
+import sys
+import argparse
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cpu_placement import CPUTopology, partition_cores
+from memory_planner import latent_tokens
+from model_pool import ModelPool
+from shape_buckets import ShapeBuckets
+from zygote import Zygote, create_hunyuan_generator
+
+HEAD_DIM = 64
+
+
+class _CPUConfig:
+    def __init__(self, threads):
+        self.intra_op_threads = threads
+
+
+class FakeGenerator:
+    """Генератор с интерфейсом HunyuanVideoGenerator поверх случайного DiT"""
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.model = None
+        # Без слота воркер берет потоки по всем ядрам, как HunyuanVideoGenerator
+        self.cpu_config = _CPUConfig(spec['threads'])
+
+    def initialize(self, warmup=True):
+        import torch
+        from torch import nn
+
+        hidden = self.spec['hidden']
+        torch.manual_seed(0)
+        self.model = nn.ModuleList([
+            nn.ModuleDict({
+                'qkv': nn.Linear(hidden, hidden * 3),
+                'proj': nn.Linear(hidden, hidden),
+                'mlp': nn.Sequential(nn.Linear(hidden, hidden * 4), nn.GELU(), nn.Linear(hidden * 4, hidden))
+            })
+            for _ in range(self.spec['depth'])
+        ]).eval()
+        return True
+
+    def unload(self):
+        self.model = None
+
+    def get_model_info(self):
+        return {'parameters': sum(p.numel() for p in self.model.parameters())}
+
+    def generate_video(self, tokens=256, infer_steps=1, **kwargs):
+        import torch
+        import torch.nn.functional as F
+
+        hidden = self.spec['hidden']
+        heads = hidden // HEAD_DIM
+        with torch.inference_mode():
+            x = torch.randn(1, tokens, hidden)
+            for _ in range(infer_steps):
+                for block in self.model:
+                    q, k, v = block['qkv'](x).reshape(1, tokens, 3, heads, HEAD_DIM).permute(2, 0, 3, 1, 4)
+                    attn = F.scaled_dot_product_attention(q, k, v).transpose(1, 2).reshape(1, tokens, hidden)
+                    x = x + block['proj'](attn)
+                    x = x + block['mlp'](x)
+        return {'success': True, 'threads': torch.get_num_threads()}
+
+
+def create_fake_generator(spec):
+    return FakeGenerator(spec)
+
+
+def splits(cores):
+    """Деления ядер: (воркеров, ядер на воркер) без неиспользуемых ядер сверх остатка"""
+    seen = set()
+    for workers in range(1, cores + 1):
+        threads = cores // workers
+        if (workers, threads) not in seen:
+            seen.add((workers, threads))
+            yield workers, threads
+
+
+def run_split(zygote, name, placements, jobs, job_kwargs):
+    """
+    Задачи раздаются воркерам по мере освобождения
+
+    Returns:
+        (секунд на все задачи, средняя задержка задачи)
+    """
+    workers = [zygote.fork_worker(name, placement) for placement in placements]
+    # Прогревочная задача: пул потоков и первые аллокации не в счет
+    for conn, _ in workers:
+        conn.send(job_kwargs)
+    for conn, _ in workers:
+        result = conn.recv()
+        if not result.get('success'):
+            raise RuntimeError(result.get('error'))
+
+    lock = threading.Lock()
+    remaining = [jobs]
+    latencies = []
+
+    def serve(conn):
+        while True:
+            with lock:
+                if not remaining[0]:
+                    return
+                remaining[0] -= 1
+            started = time.time()
+            conn.send(job_kwargs)
+            conn.recv()
+            with lock:
+                latencies.append(time.time() - started)
+
+    started = time.time()
+    threads = [threading.Thread(target=serve, args=(conn,)) for conn, _ in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - started
+    for conn, _ in workers:
+        conn.send(None)
+        conn.close()
+    return elapsed, sum(latencies) / len(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Поиск деления воркеры x потоки для корзины размеров")
+    parser.add_argument("--bucket", default="960x544x33", help="Корзина: ширинаxвысотаxкадров")
+    parser.add_argument("--jobs", type=int, default=0, help="Задач на деление (по умолчанию - по 2 на воркер)")
+    parser.add_argument("--steps", type=int, default=1, help="Шагов денойзинга на задачу")
+    parser.add_argument("--token-scale", type=float, default=1 / 16, help="Доля латентных токенов корзины (синтетическая модель)")
+    parser.add_argument("--hidden", type=int, default=512, help="Размер скрытого слоя (синтетическая модель)")
+    parser.add_argument("--depth", type=int, default=8, help="Блоков (синтетическая модель)")
+    parser.add_argument("--max-workers", type=int, default=0, help="Предел числа воркеров")
+    parser.add_argument("--no-baseline", action="store_true", help="Без прогона воркеров без привязки")
+    parser.add_argument("--real", action="store_true", help="Задачи выполняет HunyuanVideo")
+    parser.add_argument("--model", default=None, help="Модель из реестра для --real (по умолчанию - основная)")
+    args = parser.parse_args()
+
+    width, height, video_length = (int(value) for value in args.bucket.split('x'))
+    bucket = ShapeBuckets.from_env().canonicalize(width, height, video_length)
+    topology = CPUTopology.detect()
+    cores = topology.physical_cores
+    print(f"Корзина {bucket.key}, топология: {topology.to_dict()}")
+
+    if args.real:
+        zygote = Zygote(create_hunyuan_generator)
+        registry = ModelPool.from_env(None)
+        spec = registry.specs[registry.resolve(args.model)].to_dict()
+        job_kwargs = {
+            'prompt': 'benchmark', 'video_size': (bucket.height, bucket.width),
+            'video_length': bucket.video_length, 'infer_steps': args.steps, 'seed': 0
+        }
+    else:
+        zygote = Zygote(create_fake_generator)
+        spec = {'name': 'fake', 'hidden': args.hidden, 'depth': args.depth, 'threads': cores}
+        tokens = max(1, int(latent_tokens(bucket.height, bucket.width, bucket.video_length) * args.token_scale))
+        job_kwargs = {'tokens': tokens, 'infer_steps': args.steps}
+        print(f"Синтетический DiT: {tokens} токенов, hidden {args.hidden}, {args.depth} блоков")
+    zygote.load(spec)
+
+    results = []
+    for workers, threads in splits(cores):
+        if args.max_workers and workers > args.max_workers:
+            break
+        jobs = args.jobs or 2 * workers
+        placements = [placement.to_dict() for placement in partition_cores(topology, workers, threads)]
+        elapsed, latency = run_split(zygote, spec['name'], placements, jobs, job_kwargs)
+        throughput = jobs / elapsed * 60
+        results.append((throughput, workers, threads))
+        nodes = sorted({str(placement['node']) for placement in placements})
+        print(
+            f"  {workers} x {threads} потоков (узлы {', '.join(nodes)}): {throughput:.2f} задач/мин, "
+            f"задержка {latency:.2f} с"
+        )
+        if workers > 1 and not args.no_baseline:
+            elapsed, latency = run_split(zygote, spec['name'], [None] * workers, jobs, job_kwargs)
+            print(
+                f"  {workers} x {cores} потоков без привязки: {jobs / elapsed * 60:.2f} задач/мин, "
+                f"задержка {latency:.2f} с"
+            )
+    zygote.stop()
+
+    throughput, workers, threads = max(results)
+    print(f"Лучшее деление для {bucket.key}: {workers} воркеров x {threads} потоков ({throughput:.2f} задач/мин)")
+    print(
+        f"  DAUR_MEDIA_ZYGOTE=1 DAUR_MEDIA_CPU_PLACEMENT=1 DAUR_MEDIA_GENERATION_WORKERS={workers} "
+        f"DAUR_MEDIA_CPU_CORES_PER_WORKER={threads}"
+    )
+
+
+if __name__ == "__main__":
+    main()
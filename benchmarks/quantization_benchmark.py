@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк int8-квантизации DiT на CPU: скорость, размер весов и точность
+
+Используется та же модель со случайными весами, что и в
+cpu_fast_path_benchmark. Для каждого режима денойзинг запускается с
+фиксированными сидами и сравнивается с результатом float32-модели.
+"""
+
+import os
+import sys
+import argparse
+import copy
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cpu_fast_path_benchmark import build_models
+
+
+def denoise(dit, latents, steps):
+    x = latents
+    for _ in range(steps):
+        x = x - 0.1 * dit(x)
+    return x
+
+
+def main():
+    import torch
+    from quantization import compare_outputs, module_bytes, quantize_linear_layers
+
+    parser = argparse.ArgumentParser(description="Бенчмарк int8-квантизации DiT")
+    parser.add_argument("--steps", type=int, default=5, help="Шагов денойзинга")
+    parser.add_argument("--frames", type=int, default=17, help="Длина видео в кадрах")
+    parser.add_argument("--height", type=int, default=256, help="Высота")
+    parser.add_argument("--width", type=int, default=448, help="Ширина")
+    parser.add_argument("--hidden", type=int, default=512, help="Размер скрытого слоя DiT")
+    parser.add_argument("--depth", type=int, default=4, help="Блоков DiT")
+    parser.add_argument("--seeds", type=int, nargs='+', default=[0, 1, 2], help="Сиды для проверки точности")
+    args = parser.parse_args()
+
+    reference, _ = build_models(args.hidden, args.depth)
+    shape = (1, 16, (args.frames - 1) // 4 + 1, args.height // 8, args.width // 8)
+
+    def latents(seed):
+        generator = torch.Generator().manual_seed(seed)
+        return torch.randn(shape, generator=generator)
+
+    with torch.inference_mode():
+        reference_outputs = {seed: denoise(reference, latents(seed), args.steps) for seed in args.seeds}
+
+        results = {}
+        for mode in ('fp32', 'dynamic', 'weight_only'):
+            model = copy.deepcopy(reference)
+            if mode != 'fp32':
+                # Входная и выходная проекции, как img_in/final_layer у HunyuanVideo
+                quantize_linear_layers(model, mode, skip_patterns=['embed', 'head'])
+
+            denoise(model, latents(args.seeds[0]), 1)  # прогрев
+            started = time.time()
+            outputs = {seed: denoise(model, latents(seed), args.steps) for seed in args.seeds}
+            steps_per_second = args.steps * len(args.seeds) / (time.time() - started)
+
+            metrics = [compare_outputs(reference_outputs[seed], outputs[seed]) for seed in args.seeds]
+            results[mode] = steps_per_second
+            print(
+                f"{mode:>11}: {steps_per_second:.3f} шагов/с, веса {module_bytes(model) / 1024**2:.1f} MB, "
+                f"отн. ошибка {max(m['relative_error'] for m in metrics):.4f}, "
+                f"косинус {min(m['cosine_similarity'] for m in metrics):.5f}, "
+                f"PSNR {min(m['psnr_db'] for m in metrics):.1f} дБ"
+            )
+
+    for mode in ('dynamic', 'weight_only'):
+        print(f"Ускорение {mode}: x{results[mode] / results['fp32']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк параллелизма по последовательности на CPU (gloo)
+
+DiT со случайными весами повторяет устройство блоков HunyuanVideo:
+токены видео с RoPE и текстовые токены (значимые и паддинг) в общем
+внимании, атрибут hybrid_seq_parallel_attn и выход {'x': ...}. Для
+каждой конфигурации ulysses x ring денойзинг выполняется в отдельных
+процессах через parallelize_transformer, результат сравнивается с
+однопроцессным.
+"""
+
+import os
+import sys
+import argparse
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psutil
+import torch
+import torch.multiprocessing as mp
+import torch.nn.functional as F
+from torch import nn
+
+from sequence_parallel import ParallelConfig, SequenceParallelGroup, parallel_attention, parallelize_transformer
+
+HEAD_DIM = 64
+TEXT_TOKENS = 64
+TEXT_VALID = 40
+
+
+def _rope(x, cos, sin):
+    """RoPE для токенов видео: x [b, n, H, d], cos/sin [n, d]"""
+    x1, x2 = x.chunk(2, dim=-1)
+    rotated = torch.cat([-x2, x1], dim=-1)
+    return x * cos[None, :, None] + rotated * sin[None, :, None]
+
+
+class Block(nn.Module):
+    """Блок с общим вниманием токенов видео и текста"""
+
+    def __init__(self, hidden):
+        super().__init__()
+        self.heads = hidden // HEAD_DIM
+        self.norm1 = nn.LayerNorm(hidden)
+        self.qkv = nn.Linear(hidden, hidden * 3)
+        self.proj = nn.Linear(hidden, hidden)
+        self.norm2 = nn.LayerNorm(hidden)
+        self.mlp = nn.Sequential(nn.Linear(hidden, hidden * 4), nn.GELU(approximate='tanh'), nn.Linear(hidden * 4, hidden))
+        self.hybrid_seq_parallel_attn = None
+
+    def forward(self, img, txt, freqs_cos, freqs_sin):
+        image_len = img.shape[1]
+        x = torch.cat([img, txt], dim=1)
+        b, n, _ = x.shape
+        q, k, v = self.qkv(self.norm1(x)).reshape(b, n, 3, self.heads, HEAD_DIM).unbind(2)
+        q = torch.cat([_rope(q[:, :image_len], freqs_cos, freqs_sin), q[:, image_len:]], dim=1)
+        k = torch.cat([_rope(k[:, :image_len], freqs_cos, freqs_sin), k[:, image_len:]], dim=1)
+
+        cu_seqlens = torch.tensor([0, image_len + TEXT_VALID, n])
+        if self.hybrid_seq_parallel_attn is None:
+            # Как varlen-внимание HunyuanVideo: паддинг текста отделен от остальных токенов
+            q, k, v = (t.transpose(1, 2) for t in (q, k, v))
+            end = image_len + TEXT_VALID
+            attn = torch.cat([
+                F.scaled_dot_product_attention(q[:, :, :end], k[:, :, :end], v[:, :, :end]),
+                F.scaled_dot_product_attention(q[:, :, end:], k[:, :, end:], v[:, :, end:])
+            ], dim=2).transpose(1, 2).reshape(b, n, -1)
+        else:
+            attn = parallel_attention(
+                self.hybrid_seq_parallel_attn, q, k, v, image_len, image_len, cu_seqlens, cu_seqlens
+            )
+        x = x + self.proj(attn)
+        x = x + self.mlp(self.norm2(x))
+        return x[:, :image_len], x[:, image_len:]
+
+
+class FakeDiT(nn.Module):
+    def __init__(self, hidden, depth):
+        super().__init__()
+        self.embed = nn.Linear(16 * 4, hidden)
+        self.txt_in = nn.Linear(hidden, hidden)
+        self.blocks = nn.ModuleList([Block(hidden) for _ in range(depth)])
+        self.head = nn.Linear(hidden, 16 * 4)
+
+    def forward(self, x, t, text_states=None, freqs_cos=None, freqs_sin=None, return_dict=True):
+        b, c, frames, h, w = x.shape
+        img = x.reshape(b, c, frames, h // 2, 2, w // 2, 2).permute(0, 2, 3, 5, 1, 4, 6)
+        img = self.embed(img.reshape(b, frames * (h // 2) * (w // 2), c * 4))
+        txt = self.txt_in(text_states) + t
+        for block in self.blocks:
+            img, txt = block(img, txt, freqs_cos, freqs_sin)
+        img = self.head(img).reshape(b, frames, h // 2, w // 2, c, 2, 2)
+        return {'x': img.permute(0, 4, 1, 2, 5, 3, 6).reshape(b, c, frames, h, w)}
+
+
+def make_inputs(args):
+    """Модель и входы с фиксированным сидом (одинаковые во всех процессах)"""
+    torch.manual_seed(0)
+    model = FakeDiT(args.hidden, args.depth).eval()
+    frames, h, w = (args.frames - 1) // 4 + 1, args.height // 8, args.width // 8
+    latents = torch.randn(1, 16, frames, h, w)
+    text_states = torch.randn(1, TEXT_TOKENS, args.hidden)
+    positions = torch.arange(frames * (h // 2) * (w // 2), dtype=torch.float32)[:, None]
+    angles = positions / 10000 ** (torch.arange(HEAD_DIM // 2) / (HEAD_DIM // 2))
+    angles = torch.cat([angles, angles], dim=-1)
+    return model, latents, text_states, angles.cos(), angles.sin()
+
+
+def denoise(model, latents, text_states, freqs_cos, freqs_sin, steps):
+    x = latents
+    for step in range(steps):
+        t = torch.tensor(1.0 - step / steps)
+        x = x - 0.1 * model(x, t, text_states=text_states, freqs_cos=freqs_cos, freqs_sin=freqs_sin)['x']
+    return x
+
+
+def run_rank(rank, config, args, threads, result_path):
+    """Один процесс параллельного денойзинга"""
+    torch.set_num_threads(threads)
+    group = SequenceParallelGroup(config, rank)
+    model, latents, text_states, freqs_cos, freqs_sin = make_inputs(args)
+    parallelize_transformer(model, group)
+    with torch.inference_mode():
+        denoise(model, latents, text_states, freqs_cos, freqs_sin, 1)  # прогрев
+        torch.distributed.barrier()
+        started = time.time()
+        output = denoise(model, latents, text_states, freqs_cos, freqs_sin, args.steps)
+        elapsed = time.time() - started
+    if rank == 0:
+        torch.save({'output': output, 'seconds': elapsed}, result_path)
+    group.destroy()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк параллелизма по последовательности на CPU")
+    parser.add_argument("--steps", type=int, default=3, help="Шагов денойзинга")
+    parser.add_argument("--frames", type=int, default=33, help="Длина видео в кадрах")
+    parser.add_argument("--height", type=int, default=256, help="Высота")
+    parser.add_argument("--width", type=int, default=448, help="Ширина")
+    parser.add_argument("--hidden", type=int, default=512, help="Размер скрытого слоя DiT")
+    parser.add_argument("--depth", type=int, default=2, help="Блоков DiT")
+    parser.add_argument(
+        "--configs", nargs='+', default=['2x1', '1x2', '2x2'],
+        help="Конфигурации ulysses x ring"
+    )
+    parser.add_argument("--port", type=int, default=29531, help="Порт gloo")
+    args = parser.parse_args()
+
+    cores = psutil.cpu_count(logical=False) or os.cpu_count() or 1
+    torch.set_num_threads(cores)
+    model, latents, text_states, freqs_cos, freqs_sin = make_inputs(args)
+    with torch.inference_mode():
+        denoise(model, latents, text_states, freqs_cos, freqs_sin, 1)
+        started = time.time()
+        reference = denoise(model, latents, text_states, freqs_cos, freqs_sin, args.steps)
+        baseline = time.time() - started
+    tokens = latents.shape[2] * (latents.shape[3] // 2) * (latents.shape[4] // 2)
+    print(f"{tokens} токенов видео, {TEXT_TOKENS} текстовых, ядер {cores}")
+    print(f"  1 процесс: {baseline:.2f} с")
+
+    for index, spec in enumerate(args.configs):
+        ulysses, ring = (int(value) for value in spec.split('x'))
+        config = ParallelConfig(ulysses, ring, master_port=args.port + index)
+        threads = max(1, cores // config.world_size)
+        with tempfile.TemporaryDirectory() as tmp:
+            result_path = os.path.join(tmp, 'result.pt')
+            mp.spawn(run_rank, args=(config, args, threads, result_path), nprocs=config.world_size)
+            result = torch.load(result_path)
+        error = (result['output'] - reference).norm() / reference.norm()
+        print(
+            f"  ulysses={ulysses} ring={ring}: {result['seconds']:.2f} с "
+            f"(x{baseline / result['seconds']:.2f}, потоков на процесс {threads}), "
+            f"отн. отклонение от 1 процесса {error.item():.2e}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк хранилища задач: dict + task_lock против TaskStore
+
+Измеряет память на одну задачу и пропускную способность чтения списка
+задач (как в /api/tasks) при параллельной записи статусов воркерами.
+"""
+
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+import argparse
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from task_store import TaskStore, TaskRecord, TaskStatus
+
+
+def make_task_dict(i):
+    """Задача в старом формате (как в daur_media_web.py до TaskStore)"""
+    return {
+        'id': str(uuid.uuid4()),
+        'prompt': f"A cat walking on grass, realistic style #{i}",
+        'video_width': 1280,
+        'video_height': 720,
+        'video_length': 129,
+        'infer_steps': 50,
+        'cfg_scale': 6.0,
+        'seed': None,
+        'status': 'pending',
+        'created_at': datetime.now().isoformat(),
+        'platform': 'Daur MedIA'
+    }
+
+
+def measure_memory(count):
+    """Память на задачу в байтах для обоих вариантов"""
+    prototypes = [make_task_dict(i) for i in range(count)]
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    dicts = {p['id']: dict(p) for p in prototypes}
+    after = tracemalloc.take_snapshot()
+    dict_bytes = sum(s.size_diff for s in after.compare_to(before, 'filename'))
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    records = {p['id']: TaskRecord.from_dict(p) for p in prototypes}
+    after = tracemalloc.take_snapshot()
+    record_bytes = sum(s.size_diff for s in after.compare_to(before, 'filename'))
+    tracemalloc.stop()
+
+    del dicts, records
+    return dict_bytes / count, record_bytes / count
+
+
+def bench_dict_reads(count, readers, duration, write_interval):
+    """Старый вариант: каждое чтение берет task_lock и сортирует список"""
+    tasks = {}
+    task_lock = threading.Lock()
+    for i in range(count):
+        task = make_task_dict(i)
+        tasks[task['id']] = task
+    ids = list(tasks)
+    stop = threading.Event()
+    reads = [0] * readers
+
+    def reader(n):
+        while not stop.is_set():
+            with task_lock:
+                task_list = list(tasks.values())
+            task_list.sort(key=lambda x: x['created_at'], reverse=True)
+            reads[n] += 1
+
+    def writer():
+        i = 0
+        while not stop.is_set():
+            with task_lock:
+                tasks[ids[i % count]]['status'] = 'processing'
+            i += 1
+            time.sleep(write_interval)
+
+    return _run(reader, writer, readers, duration, stop, reads)
+
+
+def bench_store_reads(count, readers, duration, write_interval):
+    """Новый вариант: чтение готового снимка без блокировки"""
+    store = TaskStore()
+    for i in range(count):
+        store.add(TaskRecord.from_dict(make_task_dict(i)))
+    ids = [record.id for record in store.snapshot()]
+    stop = threading.Event()
+    reads = [0] * readers
+
+    def reader(n):
+        while not stop.is_set():
+            store.snapshot().as_sorted_dicts()
+            reads[n] += 1
+
+    def writer():
+        i = 0
+        while not stop.is_set():
+            store.update(ids[i % count], status=TaskStatus.PROCESSING)
+            i += 1
+            time.sleep(write_interval)
+
+    return _run(reader, writer, readers, duration, stop, reads)
+
+
+def _run(reader, writer, readers, duration, stop, reads):
+    threads = [threading.Thread(target=reader, args=(n,)) for n in range(readers)]
+    threads.append(threading.Thread(target=writer))
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return sum(reads) / duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк хранилища задач Daur MedIA")
+    parser.add_argument("--tasks", type=int, default=500, help="Количество задач")
+    parser.add_argument("--readers", type=int, default=4, help="Количество потоков-читателей")
+    parser.add_argument("--duration", type=float, default=3.0, help="Длительность замера, сек")
+    parser.add_argument("--write-interval", type=float, default=0.01, help="Пауза между записями, сек")
+    args = parser.parse_args()
+
+    dict_mem, record_mem = measure_memory(max(args.tasks, 1000))
+    print(f"Память на задачу: dict={dict_mem:.0f} B, TaskRecord={record_mem:.0f} B "
+          f"({(1 - record_mem / dict_mem) * 100:.0f}% меньше)")
+
+    before = bench_dict_reads(args.tasks, args.readers, args.duration, args.write_interval)
+    after = bench_store_reads(args.tasks, args.readers, args.duration, args.write_interval)
+    print(f"Чтений списка задач в секунду ({args.tasks} задач, {args.readers} читателей): "
+          f"dict+lock={before:.0f}, TaskStore={after:.0f} (x{after / before:.1f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк записи видео: save_videos_grid против save_video_streaming
+
+Каждый вариант запускается в отдельном процессе, чтобы пиковый RSS
+не смешивался. В конце сравниваются SHA-256 получившихся файлов.
+"""
+
+import os
+import sys
+import hashlib
+import argparse
+import subprocess
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def save_videos_grid_reference(videos, path, fps=24):
+    """Копия hyvideo.utils.file_utils.save_videos_grid для одного видео (n_rows=1)"""
+    import numpy as np
+    import imageio
+    import torch
+
+    videos = videos.permute(2, 0, 1, 3, 4)  # b c t h w -> t b c h w
+    outputs = []
+    for x in videos:
+        x = x[0]  # make_grid для батча из одного кадра
+        x = x.transpose(0, 1).transpose(1, 2).squeeze(-1)
+        x = torch.clamp(x, 0, 1)
+        x = (x * 255).numpy().astype(np.uint8)
+        outputs.append(x)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    imageio.mimsave(path, outputs, fps=fps)
+
+
+def run_single(mode, path, frames, height, width, chunk_frames):
+    """Запись одного видео в текущем процессе"""
+    import resource
+    import torch
+    from video_encoder import save_video_streaming
+
+    torch.manual_seed(0)
+    video = torch.rand(1, 3, frames, height, width)
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    started = time.time()
+    if mode == 'grid':
+        save_videos_grid_reference(video, path)
+    else:
+        save_video_streaming(video, path, chunk_frames=chunk_frames)
+    elapsed = time.time() - started
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{elapsed:.2f} {peak_rss - base_rss:.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк потоковой записи видео")
+    parser.add_argument("--frames", type=int, default=129, help="Длина видео в кадрах")
+    parser.add_argument("--height", type=int, default=720, help="Высота")
+    parser.add_argument("--width", type=int, default=1280, help="Ширина")
+    parser.add_argument("--chunk-frames", type=int, default=16, help="Кадров в чанке")
+    parser.add_argument("--single", choices=['grid', 'streaming'], help=argparse.SUPPRESS)
+    parser.add_argument("--path", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        run_single(args.single, args.path, args.frames, args.height, args.width, args.chunk_frames)
+        return
+
+    out_dir = tempfile.mkdtemp(prefix='daur_media_bench_')
+    digests = {}
+    for mode in ('grid', 'streaming'):
+        path = os.path.join(out_dir, f'{mode}.mp4')
+        result = subprocess.run(
+            [sys.executable, __file__, '--single', mode, '--path', path,
+             '--frames', str(args.frames), '--height', str(args.height),
+             '--width', str(args.width), '--chunk-frames', str(args.chunk_frames)],
+            check=True, capture_output=True, text=True
+        )
+        elapsed, rss = result.stdout.split()[-2:]
+        with open(path, 'rb') as f:
+            digests[mode] = hashlib.sha256(f.read()).hexdigest()
+        print(f"{mode:>10}: {elapsed} s, прирост пикового RSS {rss} MB")
+
+    same = digests['grid'] == digests['streaming']
+    print(f"Файлы {'совпадают побитово' if same else 'РАЗЛИЧАЮТСЯ'}: {digests['streaming'][:16]}")
+    sys.exit(0 if same else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк зиготы: запуск воркера с нуля против fork из зиготы
+
+Модель - DiT со случайными весами заданного размера. Холодный запуск -
+новый процесс (spawn): импорт torch, создание весов, первая задача.
+Воркер зиготы - fork процесса, где веса уже созданы, и та же задача.
+Для воркеров зиготы показывается уникальная память (USS): веса делятся
+с зиготой copy-on-write и в нее не входят.
+"""
+
+import os
+import sys
+import argparse
+import multiprocessing
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psutil
+
+from zygote import Zygote
+
+MB = 1024 ** 2
+
+
+class FakeGenerator:
+    """Генератор с интерфейсом HunyuanVideoGenerator поверх случайного DiT"""
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.model = None
+
+    def initialize(self, warmup=True):
+        import torch
+        from torch import nn
+
+        hidden = self.spec['hidden']
+        torch.manual_seed(0)
+        self.model = nn.Sequential(*[
+            nn.Sequential(nn.Linear(hidden, hidden * 4), nn.GELU(), nn.Linear(hidden * 4, hidden))
+            for _ in range(self.spec['depth'])
+        ]).eval()
+        return True
+
+    def unload(self):
+        self.model = None
+
+    def get_model_info(self):
+        return {'parameters': sum(p.numel() for p in self.model.parameters())}
+
+    def generate_video(self, steps=1, tokens=256, **kwargs):
+        import torch
+
+        with torch.inference_mode():
+            x = torch.randn(1, tokens, self.spec['hidden'])
+            for _ in range(steps):
+                x = x - 0.1 * self.model(x)
+        process = psutil.Process()
+        return {
+            'success': True,
+            'threads': torch.get_num_threads(),
+            'uss_mb': process.memory_full_info().uss / MB,
+            'rss_mb': process.memory_info().rss / MB
+        }
+
+
+def create_fake_generator(spec):
+    return FakeGenerator(spec)
+
+
+def cold_worker(spec, conn):
+    """Воркер без зиготы: импорт, загрузка и задача в новом процессе"""
+    generator = create_fake_generator(spec)
+    generator.initialize()
+    conn.send(generator.generate_video())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк запуска воркеров через зиготу")
+    parser.add_argument("--hidden", type=int, default=1024, help="Размер скрытого слоя")
+    parser.add_argument("--depth", type=int, default=24, help="Блоков MLP")
+    parser.add_argument("--workers", type=int, default=3, help="Воркеров для запуска")
+    args = parser.parse_args()
+    spec = {'name': 'fake', 'hidden': args.hidden, 'depth': args.depth}
+    weights_mb = args.depth * 8 * args.hidden * args.hidden * 4 / MB
+    print(f"Веса модели: {weights_mb:.0f} МБ")
+
+    context = multiprocessing.get_context('spawn')
+    started = time.time()
+    conn, child_conn = context.Pipe()
+    process = context.Process(target=cold_worker, args=(spec, child_conn))
+    process.start()
+    result = conn.recv()
+    process.join()
+    print(f"  холодный запуск: {time.time() - started:.2f} с до результата первой задачи, RSS {result['rss_mb']:.0f} МБ")
+
+    zygote = Zygote(create_fake_generator)
+    started = time.time()
+    zygote.load(spec)
+    print(f"  зигота: запуск и загрузка {time.time() - started:.2f} с (один раз)")
+    connections = []
+    for index in range(args.workers):
+        started = time.time()
+        conn, pid = zygote.fork_worker('fake')
+        forked = time.time() - started
+        conn.send({})
+        result = conn.recv()
+        print(
+            f"  воркер {index + 1} (pid {pid}): fork {forked * 1000:.0f} мс, "
+            f"{time.time() - started:.2f} с до результата, потоков {result['threads']}, "
+            f"USS {result['uss_mb']:.0f} МБ из RSS {result['rss_mb']:.0f} МБ"
+        )
+        connections.append(conn)
+    for conn in connections:
+        conn.send(None)
+        conn.close()
+    zygote.stop()
+
+
+if __name__ == "__main__":
+    main()
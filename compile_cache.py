@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+Daur MedIA - Compile Cache
+torch.compile для DiT и VAE с постоянным кешем графов по корзинам размеров
+
+Компиляция включается явно (DAUR_MEDIA_COMPILE=1). Графы специализируются
+под размеры (dynamic=False): после приведения запросов к корзинам
+(shape_buckets) их конечное число, и каждая корзина компилируется один раз.
+Компилируются блоки DiT по отдельности (блоки одного типа используют общий
+граф), а у VAE - декодер.
+
+Кеш на диске:
+- <cache_dir>/inductor - кеш Inductor (FX-графы, AOTAutograd, собранные
+  ядра); без него каждый перезапуск компилирует все заново
+- <cache_dir>/<хеш модели>/<корзина>.bin - артефакты торч-компиляции
+  корзины (torch.compiler.save_cache_artifacts): переносимы между хостами
+  и восстанавливают кеш Inductor, если каталог inductor очищен
+
+Запись артефактов (CacheArtifactManager) - общее состояние процесса,
+поэтому первый запуск корзины с записью ее файла выполняется под общей
+для процесса блокировкой: при нескольких воркерах-потоках один не
+сбрасывает запись другого, а в файл корзины не попадают графы другой
+корзины, компилируемой в это же время.
+
+Хеш модели учитывает чекпойнт, структуру модулей (в том числе замену
+слоев квантизацией), точность, устройство и версию PyTorch: артефакты
+другой модели или другой сборки не подхватываются.
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+import torch
+from torch import nn
+
+logger = logging.getLogger(__name__)
+
+COMPILE_MODULES = ('transformer', 'vae')
+
+# Списки блоков DiT HunyuanVideo: компилируется каждый блок, а не вся модель
+BLOCK_LISTS = ('double_blocks', 'single_blocks')
+
+# Графов на корзину с запасом: типы блоков DiT, декодер VAE и тайлы разных размеров
+GRAPHS_PER_BUCKET = 8
+
+# Загрузка, запись и сохранение артефактов корзины - по одной на процесс
+_artifacts_lock = threading.Lock()
+
+
+class CompileConfig:
+    """Параметры компиляции"""
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        mode: str = 'default',
+        cache_dir: str = './compile_cache',
+        modules: Sequence[str] = COMPILE_MODULES,
+        warmup_buckets: Optional[Sequence[str]] = None
+    ):
+        """
+        Args:
+            enabled: Компилировать DiT и VAE
+            mode: Режим torch.compile (default, reduce-overhead, max-autotune)
+            cache_dir: Каталог кеша скомпилированных графов
+            modules: Что компилировать: transformer и/или vae
+            warmup_buckets: Корзины ('1280x720x129', ...) для прогрева при
+                загрузке модели; None - корзины профилей генерации
+        """
+        unknown = set(modules) - set(COMPILE_MODULES)
+        if unknown:
+            raise ValueError(f"Неизвестные модули для компиляции: {sorted(unknown)}")
+        self.enabled = enabled
+        self.mode = mode
+        self.cache_dir = cache_dir
+        self.modules = tuple(modules)
+        self.warmup_buckets = list(warmup_buckets) if warmup_buckets is not None else None
+
+    @classmethod
+    def from_env(cls) -> 'CompileConfig':
+        """
+        Параметры из окружения: DAUR_MEDIA_COMPILE (1/0), DAUR_MEDIA_COMPILE_MODE,
+        DAUR_MEDIA_COMPILE_CACHE_DIR, DAUR_MEDIA_COMPILE_MODULES (через запятую),
+        DAUR_MEDIA_COMPILE_WARMUP (ключи корзин через запятую, 'none' - без прогрева)
+        """
+        def _list(name):
+            value = os.environ.get(name)
+            return [item.strip() for item in value.split(',') if item.strip()] if value else None
+
+        warmup = _list('DAUR_MEDIA_COMPILE_WARMUP')
+        if warmup == ['none']:
+            warmup = []
+        return cls(
+            enabled=os.environ.get('DAUR_MEDIA_COMPILE', '0').lower() in ('1', 'true', 'yes'),
+            mode=os.environ.get('DAUR_MEDIA_COMPILE_MODE', 'default'),
+            cache_dir=os.environ.get('DAUR_MEDIA_COMPILE_CACHE_DIR', './compile_cache'),
+            modules=_list('DAUR_MEDIA_COMPILE_MODULES') or COMPILE_MODULES,
+            warmup_buckets=warmup
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'enabled': self.enabled,
+            'mode': self.mode,
+            'cache_dir': self.cache_dir,
+            'modules': list(self.modules),
+            'warmup_buckets': self.warmup_buckets
+        }
+
+
+def _file_signature(path: Optional[str]) -> Any:
+    """Размер и время изменения файла весов (содержимое в десятки ГБ не хешируется)"""
+    if not path or not os.path.exists(path):
+        return path
+    stat = os.stat(path)
+    return [os.path.abspath(path), stat.st_size, int(stat.st_mtime)]
+
+
+def model_fingerprint(modules: Dict[str, nn.Module], extra: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Хеш модели для ключа кеша компиляции
+
+    Args:
+        modules: Компилируемые модули по именам
+        extra: Прочее, от чего зависят графы: чекпойнт, точность, устройство,
+            ранг процесса и т.д. (значения, сериализуемые в JSON)
+
+    Returns:
+        str: 16 шестнадцатеричных символов
+    """
+    digest = hashlib.sha256()
+    header = dict(extra or {}, torch=torch.__version__)
+    for key in ('model_base', 'dit_weight'):
+        if key in header:
+            header[key] = _file_signature(header[key])
+    digest.update(json.dumps(header, sort_keys=True, default=str).encode())
+    for name in sorted(modules):
+        digest.update(name.encode())
+        for module_name, module in modules[name].named_modules():
+            digest.update(f"{module_name}:{type(module).__name__}".encode())
+        for tensor_name, tensor in modules[name].state_dict(keep_vars=True).items():
+            shape = tuple(getattr(tensor, 'shape', ()))
+            dtype = getattr(tensor, 'dtype', type(tensor).__name__)
+            digest.update(f"{tensor_name}:{shape}:{dtype}".encode())
+    return digest.hexdigest()[:16]
+
+
+def _compile_targets(name: str, module: nn.Module) -> List[nn.Module]:
+    """Модули для torch.compile: блоки DiT или декодер VAE"""
+    if name == 'vae':
+        return [getattr(module, 'decoder', module)]
+    blocks = [block for attribute in BLOCK_LISTS for block in getattr(module, attribute, ())]
+    return blocks or [module]
+
+
+def _clear_recorded_artifacts() -> None:
+    """Сброс накопленных артефактов, чтобы в файл корзины попали только ее графы"""
+    try:
+        from torch.compiler._cache import CacheArtifactManager
+    except ImportError:
+        return
+    CacheArtifactManager.clear()
+
+
+class CompileCache:
+    """Компиляция модулей модели и учет прогретых корзин"""
+
+    def __init__(self, config: CompileConfig):
+        self.config = config
+        self.model_hash: Optional[str] = None
+        self.directory: Optional[str] = None
+        # Корзины, уже скомпилированные (или загруженные) в этом процессе
+        self.warm: Dict[str, Dict[str, Any]] = {}
+        self.compiled_modules: Dict[str, int] = {}
+        self.metrics = {
+            'compiled': 0, 'loaded_from_disk': 0, 'load_failures': 0,
+            'compile_seconds': 0.0, 'warmup_seconds': 0.0
+        }
+
+    def compile(self, modules: Dict[str, nn.Module], bucket_count: int, extra: Optional[Dict[str, Any]] = None) -> None:
+        """
+        torch.compile модулей модели на месте
+
+        Вызывается после квантизации и прочих замен слоев: хеш считается
+        по итоговой структуре.
+
+        Args:
+            modules: {'transformer': ..., 'vae': ...}; компилируются те, что
+                перечислены в настройках
+            bucket_count: Число корзин размеров (предел перекомпиляций dynamo)
+            extra: См. model_fingerprint
+        """
+        modules = {name: module for name, module in modules.items() if name in self.config.modules and module is not None}
+        self.model_hash = model_fingerprint(modules, dict(extra or {}, mode=self.config.mode))
+        self.directory = os.path.join(self.config.cache_dir, self.model_hash)
+        os.makedirs(self.directory, exist_ok=True)
+
+        # Кеш Inductor - общий для всех моделей: его ключи - хеши графов.
+        # Явно заданный TORCHINDUCTOR_CACHE_DIR не переопределяется
+        os.environ.setdefault('TORCHINDUCTOR_CACHE_DIR', os.path.join(os.path.abspath(self.config.cache_dir), 'inductor'))
+        torch._inductor.config.fx_graph_cache = True
+        if hasattr(torch._functorch.config, 'enable_autograd_cache'):
+            torch._functorch.config.enable_autograd_cache = True
+        # Каждая корзина - свой набор графов; по умолчанию dynamo после
+        # 8 перекомпиляций переходит на eager
+        dynamo_config = torch._dynamo.config
+        limit_name = 'recompile_limit' if hasattr(dynamo_config, 'recompile_limit') else 'cache_size_limit'
+        limit = max(getattr(dynamo_config, limit_name), bucket_count * GRAPHS_PER_BUCKET)
+        setattr(dynamo_config, limit_name, limit)
+        if hasattr(dynamo_config, 'accumulated_recompile_limit'):
+            dynamo_config.accumulated_recompile_limit = max(dynamo_config.accumulated_recompile_limit, limit * 4)
+
+        for name, module in modules.items():
+            targets = _compile_targets(name, module)
+            for target in targets:
+                target.compile(mode=self.config.mode, dynamic=False)
+            self.compiled_modules[name] = len(targets)
+        logger.info(f"torch.compile: {self.compiled_modules}, хеш модели {self.model_hash}, кеш {self.directory}")
+
+    @property
+    def active(self) -> bool:
+        return self.model_hash is not None
+
+    def run(self, bucket_key: str, fn: Callable[[], Any], warmup: bool = False) -> Any:
+        """
+        Выполнение генерации корзины
+
+        При первом запуске корзины в процессе артефакты загружаются с диска,
+        а если их нет - графы компилируются и сохраняются.
+
+        Args:
+            bucket_key: Ключ корзины ('WxHxL', как ShapeBucket.key)
+            fn: Генерация
+            warmup: Запуск ради прогрева (учитывается отдельно)
+        """
+        if not self.active or bucket_key in self.warm:
+            return fn()
+
+        # Первые запуски корзин в других потоках ждут: запись артефактов
+        # между сбросом и сохранением общая для процесса
+        with _artifacts_lock:
+            loaded = self._load(bucket_key)
+            _clear_recorded_artifacts()
+            started = time.time()
+            result = fn()
+            elapsed = time.time() - started
+            if not loaded:
+                self._save(bucket_key)
+        if not loaded:
+            self.metrics['compiled'] += 1
+            self.metrics['compile_seconds'] += elapsed
+        self.warm[bucket_key] = {
+            'source': 'disk' if loaded else 'compiled',
+            'first_run_seconds': round(elapsed, 1),
+            'warmup': warmup
+        }
+        if warmup:
+            self.metrics['warmup_seconds'] += elapsed
+        return result
+
+    def is_cached(self, bucket_key: str) -> bool:
+        """Есть ли артефакты корзины на диске"""
+        return self.directory is not None and os.path.exists(self._path(bucket_key))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'config': self.config.to_dict(),
+            'model_hash': self.model_hash,
+            'compiled_modules': dict(self.compiled_modules),
+            'warm_buckets': dict(self.warm),
+            'metrics': dict(
+                self.metrics,
+                compile_seconds=round(self.metrics['compile_seconds'], 1),
+                warmup_seconds=round(self.metrics['warmup_seconds'], 1)
+            )
+        }
+
+    def _path(self, bucket_key: str) -> str:
+        return os.path.join(self.directory, f"{bucket_key}.bin")
+
+    def _load(self, bucket_key: str) -> bool:
+        if not self.is_cached(bucket_key):
+            return False
+        try:
+            with open(self._path(bucket_key), 'rb') as f:
+                torch.compiler.load_cache_artifacts(f.read())
+        except Exception as e:
+            # Поврежденный или несовместимый файл: корзина компилируется заново
+            logger.warning(f"Артефакты компиляции {bucket_key} не загружены: {e}")
+            self.metrics['load_failures'] += 1
+            os.remove(self._path(bucket_key))
+            return False
+        self.metrics['loaded_from_disk'] += 1
+        return True
+
+    def _save(self, bucket_key: str) -> None:
+        artifacts = torch.compiler.save_cache_artifacts()
+        if not artifacts:
+            return
+        data, _ = artifacts
+        # Через временный файл: прерванная запись не оставляет битых артефактов
+        temporary = f"{self._path(bucket_key)}.{os.getpid()}.tmp"
+        with open(temporary, 'wb') as f:
+            f.write(data)
+        os.replace(temporary, self._path(bucket_key))
+
+
+def warmup_keys(config: CompileConfig, default_params: Iterable[Dict[str, Any]], canonicalize: Callable) -> List[str]:
+    """
+    Ключи корзин для прогрева
+
+    Args:
+        config: Настройки компиляции (warmup_buckets)
+        default_params: Параметры генерации, корзины которых прогреваются,
+            если корзины не заданы явно (профили генерации)
+        canonicalize: ShapeBuckets.canonicalize
+
+    Raises:
+        ValueError: ключ корзины некорректен
+    """
+    if config.warmup_buckets is None:
+        shapes = [(p['video_width'], p['video_height'], p['video_length']) for p in default_params]
+    else:
+        shapes = []
+        for key in config.warmup_buckets:
+            parts = key.split('x')
+            if len(parts) != 3 or not all(part.isdigit() for part in parts):
+                raise ValueError(f"Корзина задается как 'ШИРИНАxВЫСОТАxДЛИНА': {key}")
+            shapes.append(tuple(int(part) for part in parts))
+    keys = []
+    for width, height, video_length in shapes:
+        key = canonicalize(width, height, video_length).key
+        if key not in keys:
+            keys.append(key)
+    return keys
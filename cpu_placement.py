@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Daur MedIA - CPU Placement
+Раздельные наборы ядер для воркеров генерации на одном хосте
+
+Без размещения каждый воркер берет потоки по числу всех физических ядер:
+N воркеров запускают N x ядер потоков OpenMP, которые вытесняют друг
+друга с одних и тех же ядер и делят кеши. Слой размещения делит
+физические ядра хоста на непересекающиеся слоты, привязывает процесс
+воркера к ядрам его слота (sched_setaffinity) и задает torch столько
+intra-op потоков, сколько в слоте физических ядер.
+
+Топология берется из sysfs: узлы NUMA (/sys/devices/system/node) и
+физические ядра с их гиперпотоками (topology/core_id). Слот по
+возможности не выходит за один узел NUMA, а слоты разных узлов выдаются
+воркерам по очереди - два воркера не делят память одного узла, пока
+есть свободный. Если sysfs недоступен, каждый доступный процессу
+логический CPU считается отдельным ядром одного узла.
+
+Привязка работает для процессов-воркеров (режим зиготы): число потоков
+torch задается на процесс, и потоки генерации внутри одного процесса
+ядра не разделят. Память воркера (активации) выделяется первым касанием
+на его узле; веса, общие с зиготой, остаются там, где она их загрузила.
+"""
+
+import os
+import glob
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SYSFS_NODES = '/sys/devices/system/node'
+SYSFS_CPUS = '/sys/devices/system/cpu'
+
+
+def parse_cpulist(text: str) -> List[int]:
+    """Список CPU в формате sysfs ("0-3,8,10-11")"""
+    cpus = []
+    for part in text.strip().split(','):
+        if not part:
+            continue
+        if '-' in part:
+            start, end = part.split('-')
+            cpus.extend(range(int(start), int(end) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+class CPUTopology:
+    """Узлы NUMA и физические ядра, доступные процессу"""
+
+    def __init__(self, nodes: Dict[int, List[List[int]]]):
+        """
+        Args:
+            nodes: Номер узла NUMA -> физические ядра, ядро - список его
+                логических CPU (гиперпотоков)
+        """
+        self.nodes = {node: cores for node, cores in sorted(nodes.items()) if cores}
+        if not self.nodes:
+            raise ValueError("Нет доступных ядер")
+
+    @classmethod
+    def detect(cls, sysfs_nodes: str = SYSFS_NODES, sysfs_cpus: str = SYSFS_CPUS) -> 'CPUTopology':
+        """Топология хоста с учетом маски процесса (cgroups, taskset)"""
+        allowed = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count() or 1))
+
+        node_cpus: Dict[int, List[int]] = {}
+        for path in glob.glob(os.path.join(sysfs_nodes, 'node[0-9]*')):
+            cpulist = _read(os.path.join(path, 'cpulist'))
+            if cpulist:
+                node_cpus[int(os.path.basename(path)[4:])] = parse_cpulist(cpulist)
+        if not node_cpus:
+            node_cpus = {0: allowed}
+
+        nodes: Dict[int, List[List[int]]] = {}
+        allowed_set = set(allowed)
+        for node, cpus in node_cpus.items():
+            cores: Dict[Any, List[int]] = {}
+            for cpu in cpus:
+                if cpu not in allowed_set:
+                    continue
+                topology = os.path.join(sysfs_cpus, f'cpu{cpu}', 'topology')
+                package = _read(os.path.join(topology, 'physical_package_id'))
+                core = _read(os.path.join(topology, 'core_id'))
+                # Без данных о ядре логический CPU считается отдельным ядром
+                key = (package, core) if core is not None else ('cpu', cpu)
+                cores.setdefault(key, []).append(cpu)
+            nodes[node] = sorted(cores.values())
+        return cls(nodes)
+
+    @property
+    def physical_cores(self) -> int:
+        return sum(len(cores) for cores in self.nodes.values())
+
+    @property
+    def logical_cpus(self) -> int:
+        return sum(len(core) for cores in self.nodes.values() for core in cores)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'numa_nodes': len(self.nodes),
+            'physical_cores': self.physical_cores,
+            'logical_cpus': self.logical_cpus,
+            'nodes': {str(node): [core[0] for core in cores] for node, cores in self.nodes.items()}
+        }
+
+
+class Placement:
+    """Ядра одного слота"""
+
+    def __init__(self, slot: int, cores: List[List[int]], node: Optional[int]):
+        """
+        Args:
+            slot: Номер слота
+            cores: Физические ядра слота (списки логических CPU)
+            node: Узел NUMA или None, если слот занимает несколько узлов
+        """
+        self.slot = slot
+        self.cores = cores
+        self.node = node
+
+    @property
+    def cpus(self) -> List[int]:
+        """Логические CPU для маски: гиперпотоки ядер слота тоже его"""
+        return sorted(cpu for core in self.cores for cpu in core)
+
+    @property
+    def threads(self) -> int:
+        """intra-op потоков - по одному на физическое ядро"""
+        return len(self.cores)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'slot': self.slot, 'node': self.node, 'cpus': self.cpus, 'threads': self.threads}
+
+
+def partition_cores(
+    topology: CPUTopology,
+    slots: int,
+    cores_per_slot: Optional[int] = None
+) -> List[Placement]:
+    """
+    Деление физических ядер на непересекающиеся слоты
+
+    Слоты сначала занимают целые узлы NUMA; ядра, оставшиеся на узлах
+    после этого, собираются в слоты через узлы. Порядок результата
+    чередует узлы, чтобы первые воркеры попали на разные узлы.
+
+    Args:
+        topology: Топология хоста
+        slots: Число слотов (воркеров)
+        cores_per_slot: Физических ядер на слот (по умолчанию - поровну)
+
+    Raises:
+        ValueError: ядер меньше, чем требуется слотам
+    """
+    if slots < 1:
+        raise ValueError("Нужен хотя бы один слот")
+    total = topology.physical_cores
+    per_slot = cores_per_slot or total // slots
+    if per_slot < 1 or per_slot * slots > total:
+        raise ValueError(f"{slots} слотов по {max(per_slot, 1)} ядер не помещаются в {total} физических ядер")
+
+    by_node: Dict[int, List[Placement]] = {}
+    leftover: List[List[int]] = []
+    remaining = slots
+    free = {node: list(cores) for node, cores in topology.nodes.items()}
+    # Поровну между узлами пропорционально их ядрам, затем остаток
+    for node, cores in free.items():
+        share = min(len(cores) // per_slot, -(-slots * len(cores) // total), remaining)
+        for _ in range(share):
+            by_node.setdefault(node, []).append(Placement(0, [cores.pop(0) for _ in range(per_slot)], node))
+        remaining -= share
+    for node, cores in free.items():
+        while remaining and len(cores) >= per_slot:
+            by_node.setdefault(node, []).append(Placement(0, [cores.pop(0) for _ in range(per_slot)], node))
+            remaining -= 1
+        leftover.extend(cores)
+
+    placements: List[Placement] = []
+    queues = [list(items) for items in by_node.values()]
+    while any(queues):
+        for queue in queues:
+            if queue:
+                placements.append(queue.pop(0))
+    for _ in range(remaining):
+        placements.append(Placement(0, [leftover.pop(0) for _ in range(per_slot)], None))
+    for slot, placement in enumerate(placements):
+        placement.slot = slot
+    return placements
+
+
+def apply_placement(placement: Dict[str, Any]) -> None:
+    """
+    Привязка текущего процесса к ядрам слота и число потоков torch
+
+    Вызывается в однопоточном процессе воркера до первой параллельной
+    операции: потоки OpenMP, созданные позже, наследуют маску.
+
+    Args:
+        placement: Placement.to_dict()
+    """
+    import torch
+
+    os.sched_setaffinity(0, placement['cpus'])
+    torch.set_num_threads(placement['threads'])
+
+
+class CorePlacer:
+    """Выдача слотов ядер воркерам, которые запускаются и выводятся на ходу"""
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        slots: int = 1,
+        cores_per_slot: Optional[int] = None,
+        topology: Optional[CPUTopology] = None
+    ):
+        """
+        Args:
+            enabled: Размещение включено
+            slots: Число слотов - максимум одновременно работающих воркеров
+            cores_per_slot: Физических ядер на слот (по умолчанию - поровну)
+            topology: Топология (по умолчанию - определяется по хосту)
+        """
+        self.enabled = enabled
+        self.topology = topology or CPUTopology.detect()
+        self.cores_per_slot = cores_per_slot
+        requested = slots
+        slots = min(slots, self.topology.physical_cores // (cores_per_slot or 1))
+        if enabled and slots < requested:
+            logger.warning(
+                f"Слотов ядер {slots} вместо {requested}: физических ядер {self.topology.physical_cores}; "
+                f"воркеры сверх этого работают без привязки"
+            )
+        self.placements = partition_cores(self.topology, max(slots, 1), cores_per_slot) if enabled else []
+        self._owners: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, slots: int) -> 'CorePlacer':
+        """
+        Параметры из окружения: DAUR_MEDIA_CPU_PLACEMENT (1/0),
+        DAUR_MEDIA_CPU_SLOTS (по умолчанию - максимум воркеров),
+        DAUR_MEDIA_CPU_CORES_PER_WORKER
+
+        Args:
+            slots: Максимум одновременно работающих воркеров
+        """
+        cores = os.environ.get('DAUR_MEDIA_CPU_CORES_PER_WORKER')
+        return cls(
+            enabled=os.environ.get('DAUR_MEDIA_CPU_PLACEMENT', '0').lower() in ('1', 'true', 'yes'),
+            slots=int(os.environ.get('DAUR_MEDIA_CPU_SLOTS', slots)),
+            cores_per_slot=int(cores) if cores else None
+        )
+
+    def acquire(self, worker_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Свободный слот для воркера (повторный вызов возвращает тот же)
+
+        Returns:
+            Optional[Dict]: Placement.to_dict() или None - размещение
+            выключено или свободных слотов нет
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            slot = self._owners.get(worker_id)
+            if slot is None:
+                taken = set(self._owners.values())
+                slot = next((p.slot for p in self.placements if p.slot not in taken), None)
+                if slot is None:
+                    logger.warning(f"Для воркера {worker_id} нет свободного слота ядер, он работает без привязки")
+                    return None
+                self._owners[worker_id] = slot
+            return self.placements[slot].to_dict()
+
+    def release(self, worker_id: int) -> None:
+        """Освобождение слота завершившегося воркера"""
+        with self._lock:
+            self._owners.pop(worker_id, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            owners = {slot: worker_id for worker_id, slot in self._owners.items()}
+            return {
+                'enabled': self.enabled,
+                'topology': self.topology.to_dict(),
+                'slots': [
+                    dict(placement.to_dict(), worker_id=owners.get(placement.slot))
+                    for placement in self.placements
+                ]
+            }
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Daur MedIA - CPU Runtime
+Настройка PyTorch для инференса на CPU
+
+- intra-op потоки по числу физических ядер (гиперпотоки только мешают
+  GEMM), inter-op - один поток: граф модели последовательный
+- bfloat16 autocast, если oneDNN поддерживает bf16 на этом процессоре
+  (AVX512-BF16/AMX); иначе вычисления остаются в float32
+- channels-last для сверток VAE (oneDNN выбирает блочные ядра без
+  переупаковки тензоров на каждом слое)
+- fusion oneDNN для графов TorchScript
+"""
+
+import os
+import logging
+from contextlib import nullcontext
+from typing import Any, Dict, Optional
+
+import psutil
+import torch
+
+logger = logging.getLogger(__name__)
+
+_configured = False
+
+
+def cpu_supports_bf16() -> bool:
+    """Есть ли у oneDNN быстрые bf16-ядра на этом процессоре"""
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+
+class CPUConfig:
+    """Параметры CPU-режима"""
+
+    def __init__(
+        self,
+        intra_op_threads: Optional[int] = None,
+        inter_op_threads: int = 1,
+        bf16: Optional[bool] = None,
+        channels_last: bool = True,
+        onednn_fusion: bool = True
+    ):
+        """
+        Args:
+            intra_op_threads: Потоков внутри операций (по умолчанию - физические ядра)
+            inter_op_threads: Потоков между независимыми операциями
+            bf16: bfloat16 autocast (None - если поддерживается процессором)
+            channels_last: channels-last для сверток VAE
+            onednn_fusion: fusion oneDNN для TorchScript
+        """
+        self.intra_op_threads = intra_op_threads or psutil.cpu_count(logical=False) or os.cpu_count() or 1
+        self.inter_op_threads = inter_op_threads
+        self.bf16 = cpu_supports_bf16() if bf16 is None else bf16
+        self.channels_last = channels_last
+        self.onednn_fusion = onednn_fusion
+
+    @classmethod
+    def from_env(cls) -> 'CPUConfig':
+        """
+        Параметры из окружения: DAUR_MEDIA_CPU_THREADS, DAUR_MEDIA_CPU_INTEROP_THREADS,
+        DAUR_MEDIA_CPU_BF16 (1/0/auto), DAUR_MEDIA_CPU_CHANNELS_LAST, DAUR_MEDIA_CPU_ONEDNN_FUSION
+        """
+        def _flag(name, default):
+            value = os.environ.get(name, default).lower()
+            return None if value == 'auto' else value in ('1', 'true', 'yes')
+
+        threads = os.environ.get('DAUR_MEDIA_CPU_THREADS')
+        return cls(
+            intra_op_threads=int(threads) if threads else None,
+            inter_op_threads=int(os.environ.get('DAUR_MEDIA_CPU_INTEROP_THREADS', '1')),
+            bf16=_flag('DAUR_MEDIA_CPU_BF16', 'auto'),
+            channels_last=_flag('DAUR_MEDIA_CPU_CHANNELS_LAST', '1'),
+            onednn_fusion=_flag('DAUR_MEDIA_CPU_ONEDNN_FUSION', '1')
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'intra_op_threads': self.intra_op_threads,
+            'inter_op_threads': self.inter_op_threads,
+            'bf16': self.bf16,
+            'channels_last': self.channels_last,
+            'onednn_fusion': self.onednn_fusion
+        }
+
+
+def configure_cpu_runtime(config: CPUConfig) -> None:
+    """
+    Глобальная настройка потоков и oneDNN
+
+    Число inter-op потоков PyTorch позволяет задать только до первой
+    параллельной операции, поэтому функцию нужно вызывать до загрузки модели.
+    """
+    global _configured
+
+    torch.set_num_threads(config.intra_op_threads)
+    if not _configured:
+        try:
+            torch.set_num_interop_threads(config.inter_op_threads)
+        except RuntimeError as e:
+            logger.warning(f"Число inter-op потоков не изменено: {e}")
+    torch.backends.mkldnn.enabled = True
+    if config.onednn_fusion:
+        torch.jit.enable_onednn_fusion(True)
+    _configured = True
+    logger.info(f"CPU-режим: {config.to_dict()}")
+
+
+def apply_channels_last(module: torch.nn.Module) -> torch.nn.Module:
+    """Перевод весов сверток модуля в channels-last (2D или 3D по виду сверток)"""
+    has_conv3d = any(isinstance(m, torch.nn.Conv3d) for m in module.modules())
+    has_conv2d = any(isinstance(m, torch.nn.Conv2d) for m in module.modules())
+    if has_conv3d:
+        module = module.to(memory_format=torch.channels_last_3d)
+    elif has_conv2d:
+        module = module.to(memory_format=torch.channels_last)
+    return module
+
+
+def to_channels_last(tensor: torch.Tensor) -> torch.Tensor:
+    """Входной тензор свертки в channels-last"""
+    if tensor.dim() == 5:
+        return tensor.contiguous(memory_format=torch.channels_last_3d)
+    if tensor.dim() == 4:
+        return tensor.contiguous(memory_format=torch.channels_last)
+    return tensor
+
+
+def cpu_autocast(config: CPUConfig):
+    """Контекст bfloat16 autocast (пустой, если bf16 выключен)"""
+    if not config.bf16:
+        return nullcontext()
+    return torch.autocast(device_type='cpu', dtype=torch.bfloat16)
@@ -8,10 +8,13 @@ from flask_cors import CORS
 from src.models.user import db
 from src.models.video_task import VideoTask, db as video_db
 from src.routes.user import user_bp
-from src.routes.video import video_bp
+from src.routes.video import video_bp, init_task_writer
+from src.task_writer import SQLITE_ENGINE_OPTIONS, configure_sqlite_engine
+from src.video_delivery import configure_video_delivery
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
+configure_video_delivery(app)
 
 # Включаем CORS для всех доменов
 CORS(app)
@@ -22,10 +25,15 @@ app.register_blueprint(video_bp, url_prefix='/api/video')
 # uncomment if you need to use database
 app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = SQLITE_ENGINE_OPTIONS
 db.init_app(app)
 with app.app_context():
+    configure_sqlite_engine(db.engine)
     db.create_all()
 
+# Статусы задач пишет один фоновый поток пакетами
+init_task_writer(app, flush_interval=float(os.environ.get('TASK_WRITER_FLUSH_INTERVAL', 0.5)))
+
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def serve(path):
@@ -4,10 +4,13 @@ API маршруты для генерации видео
 
 import os
 import sys
+import atexit
 import threading
 from datetime import datetime
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, request, jsonify
 from src.models.video_task import db, VideoTask, TaskStatus
+from src.task_writer import TaskStatusWriter
+from src.video_delivery import send_video
 
 # Импорт HunyuanVideo API
 from src.hunyuan_api import HunyuanVideoAPI
@@ -17,6 +20,9 @@ video_bp = Blueprint('video', __name__)
 # Глобальный экземпляр API
 hunyuan_api = None
 
+# Единственный писатель статусов задач в базу (создается в init_task_writer)
+task_writer = None
+
 def initialize_hunyuan_api():
     """Инициализация HunyuanVideo API"""
     global hunyuan_api
@@ -24,20 +30,29 @@ def initialize_hunyuan_api():
         hunyuan_api = HunyuanVideoAPI()
         hunyuan_api.initialize()
 
-def process_video_task(task_id):
-    """Обработка задачи генерации видео в отдельном потоке"""
+def init_task_writer(app, flush_interval=0.5):
+    """Запуск фонового писателя статусов задач"""
+    global task_writer
+    if task_writer is None:
+        task_writer = TaskStatusWriter(app, db, VideoTask, flush_interval=flush_interval)
+        task_writer.start()
+        # Поток писателя - демон: последние (в том числе финальные) статусы
+        # сбрасываются при выходе
+        atexit.register(task_writer.stop)
+    return task_writer
+
+def process_video_task(task_id, params):
+    """
+    Обработка задачи генерации видео в отдельном потоке
+
+    Поток не обращается к базе напрямую: параметры задачи передаются
+    при запуске, а все изменения статуса уходят через task_writer.
+    """
     global hunyuan_api
     
-    # Получаем задачу из базы данных
-    task = VideoTask.query.get(task_id)
-    if not task:
-        return
-    
     try:
         # Обновляем статус на "обработка"
-        task.status = TaskStatus.PROCESSING
-        task.started_at = datetime.utcnow()
-        db.session.commit()
+        task_writer.update(task_id, status=TaskStatus.PROCESSING, started_at=datetime.utcnow())
         
         # Инициализируем API если нужно
         if hunyuan_api is None:
@@ -45,34 +60,42 @@ def process_video_task(task_id):
         
         # Генерируем видео
         result = hunyuan_api.generate_video(
-            prompt=task.prompt,
-            video_size=(task.video_height, task.video_width),
-            video_length=task.video_length,
-            infer_steps=task.infer_steps,
-            seed=task.seed,
-            save_path="/home/ubuntu/Daur-MedIA/generated_videos"
+            prompt=params['prompt'],
+            video_size=(params['video_height'], params['video_width']),
+            video_length=params['video_length'],
+            infer_steps=params['infer_steps'],
+            seed=params['seed'],
+            save_path="/home/ubuntu/Daur-MedIA/generated_videos",
+            progress_callback=lambda step, total: task_writer.set_progress(task_id, step * 100.0 / total)
         )
         
         if result.get('success'):
             # Успешная генерация
-            task.status = TaskStatus.COMPLETED
-            task.output_path = result['output_path']
-            task.generation_time = result.get('generation_time')
-            task.seed = result.get('seed')
+            task_writer.update(
+                task_id,
+                status=TaskStatus.COMPLETED,
+                output_path=result['output_path'],
+                generation_time=result.get('generation_time'),
+                seed=result.get('seed'),
+                completed_at=datetime.utcnow()
+            )
         else:
             # Ошибка генерации
-            task.status = TaskStatus.FAILED
-            task.error_message = result.get('error', 'Неизвестная ошибка')
-        
-        task.completed_at = datetime.utcnow()
-        db.session.commit()
+            task_writer.update(
+                task_id,
+                status=TaskStatus.FAILED,
+                error_message=result.get('error', 'Неизвестная ошибка'),
+                completed_at=datetime.utcnow()
+            )
         
     except Exception as e:
         # Обработка исключений
-        task.status = TaskStatus.FAILED
-        task.error_message = str(e)
-        task.completed_at = datetime.utcnow()
-        db.session.commit()
+        task_writer.update(
+            task_id,
+            status=TaskStatus.FAILED,
+            error_message=str(e),
+            completed_at=datetime.utcnow()
+        )
 
 @video_bp.route('/generate', methods=['POST'])
 def generate_video():
@@ -98,8 +121,17 @@ def generate_video():
         db.session.add(task)
         db.session.commit()
         
+        params = {
+            'prompt': task.prompt,
+            'video_width': task.video_width,
+            'video_height': task.video_height,
+            'video_length': task.video_length,
+            'infer_steps': task.infer_steps,
+            'seed': task.seed
+        }
+        
         # Запускаем обработку в отдельном потоке
-        thread = threading.Thread(target=process_video_task, args=(task.id,))
+        thread = threading.Thread(target=process_video_task, args=(task.id, params))
         thread.daemon = True
         thread.start()
         
@@ -120,7 +152,12 @@ def get_task_status(task_id):
         if not task:
             return jsonify({'error': 'Задача не найдена'}), 404
         
-        return jsonify(task.to_dict()), 200
+        data = task.to_dict()
+        progress = task_writer.get_progress(task_id) if task_writer else None
+        if progress is not None:
+            data['progress'] = progress
+        
+        return jsonify(data), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -148,7 +185,7 @@ def get_all_tasks():
 
 @video_bp.route('/download/<int:task_id>', methods=['GET'])
 def download_video(task_id):
-    """Скачивание сгенерированного видео"""
+    """Скачивание сгенерированного видео (?inline=1 - просмотр в браузере)"""
     try:
         task = VideoTask.query.get(task_id)
         if not task:
@@ -160,11 +197,7 @@ def download_video(task_id):
         if not task.output_path or not os.path.exists(task.output_path):
             return jsonify({'error': 'Файл не найден'}), 404
         
-        return send_file(
-            task.output_path,
-            as_attachment=True,
-            download_name=f'video_{task.id}.mp4'
-        )
+        return send_video(task.output_path, download_name=f'video_{task.id}.mp4')
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -195,6 +228,9 @@ def get_api_status():
             'failed_tasks': failed_tasks
         })
         
+        if task_writer is not None:
+            status['status_writer'] = dict(task_writer.stats)
+        
         return jsonify(status), 200
         
     except Exception as e:
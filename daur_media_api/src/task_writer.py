@@ -0,0 +1,202 @@
+"""
+Фоновая запись статусов и прогресса задач генерации в базу данных
+Воркеры только ставят обновления в очередь, а единственный поток-писатель
+сбрасывает их пакетными транзакциями с заданным интервалом
+"""
+
+import threading
+import logging
+from collections import deque
+from typing import Any, Dict, Optional
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Параметры пула соединений для SQLite (передаются в SQLALCHEMY_ENGINE_OPTIONS)
+SQLITE_ENGINE_OPTIONS = {
+    'pool_size': 5,
+    'max_overflow': 10,
+    'pool_pre_ping': True,
+    'connect_args': {
+        'check_same_thread': False,
+        'timeout': 30
+    }
+}
+
+TERMINAL_STATUSES = ('completed', 'failed')
+
+# Сбросов подряд с ошибкой, после которых обновления задачи отбрасываются
+DEFAULT_MAX_RETRIES = 5
+
+# Сколько отброшенных обновлений хранится для разбора
+DEAD_LETTER_LIMIT = 100
+
+
+def configure_sqlite_engine(engine) -> None:
+    """
+    Включение WAL-режима для SQLite
+
+    В WAL читатели не блокируются писателем, а писатель - читателями.
+    Должно вызываться до первого подключения к базе.
+
+    Args:
+        engine: SQLAlchemy engine приложения
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _set_sqlite_pragma(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute('PRAGMA busy_timeout=5000')
+        cursor.close()
+
+
+class TaskStatusWriter:
+    """Отложенная (write-behind) запись обновлений задач пакетами"""
+
+    def __init__(self, app, db, model, flush_interval: float = 0.5, max_retries: int = DEFAULT_MAX_RETRIES):
+        """
+        Инициализация писателя
+
+        Args:
+            app: Flask приложение (для контекста при сбросе)
+            db: экземпляр Flask-SQLAlchemy
+            model: модель задачи (VideoTask)
+            flush_interval: интервал сброса в секундах
+            max_retries: сбросов подряд с ошибкой, после которых обновления
+                задачи отбрасываются в dead_letters
+        """
+        self.app = app
+        self.db = db
+        self.model = model
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+
+        self._columns = set(model.__table__.columns.keys())
+        self._pending: Dict[Any, Dict[str, Any]] = {}
+        self._progress: Dict[Any, float] = {}
+        self._failures: Dict[Any, int] = {}
+        self.dead_letters = deque(maxlen=DEAD_LETTER_LIMIT)
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.stats = {
+            'flushes': 0,
+            'rows_written': 0,
+            'updates_received': 0,
+            'errors': 0,
+            'dropped': 0
+        }
+
+    def start(self) -> None:
+        """Запуск фонового потока сброса"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='task-status-writer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Остановка потока с финальным сбросом"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def update(self, task_id, **fields) -> None:
+        """
+        Постановка обновления задачи в очередь
+
+        Несколько обновлений одной задачи между сбросами объединяются,
+        более поздние значения полей перекрывают ранние.
+        """
+        with self._lock:
+            self._pending.setdefault(task_id, {}).update(fields)
+            self.stats['updates_received'] += 1
+
+    def set_progress(self, task_id, progress: float) -> None:
+        """Обновление прогресса задачи (0-100)"""
+        progress = round(max(0.0, min(100.0, progress)), 1)
+        with self._lock:
+            self._progress[task_id] = progress
+            if 'progress' in self._columns:
+                self._pending.setdefault(task_id, {})['progress'] = progress
+            self.stats['updates_received'] += 1
+
+    def get_progress(self, task_id) -> Optional[float]:
+        """Последний известный прогресс задачи (без обращения к базе)"""
+        with self._lock:
+            return self._progress.get(task_id)
+
+    def flush(self) -> int:
+        """
+        Запись накопленных обновлений одной транзакцией
+
+        Returns:
+            int: количество обновленных задач
+        """
+        with self._lock:
+            batch, self._pending = self._pending, {}
+
+        if not batch:
+            return 0
+
+        try:
+            with self.app.app_context():
+                session = self.db.session
+                for task_id, fields in batch.items():
+                    values = {k: v for k, v in fields.items() if k in self._columns}
+                    if values:
+                        session.query(self.model).filter_by(id=task_id).update(
+                            values, synchronize_session=False
+                        )
+                session.commit()
+        except Exception as e:
+            logger.error(f"Ошибка записи статусов задач: {e}")
+            with self._lock:
+                self.stats['errors'] += 1
+                # Возвращаем пакет в очередь, не затирая более свежие значения;
+                # обновления, которые не записались max_retries раз подряд,
+                # отбрасываются, чтобы не повторять их бесконечно
+                for task_id, fields in batch.items():
+                    merged = dict(fields)
+                    merged.update(self._pending.get(task_id, {}))
+                    failures = self._failures.get(task_id, 0) + 1
+                    if failures >= self.max_retries:
+                        self._failures.pop(task_id, None)
+                        self._pending.pop(task_id, None)
+                        self.dead_letters.append((task_id, merged))
+                        self.stats['dropped'] += 1
+                        logger.error(f"Обновления задачи {task_id} отброшены после {failures} ошибок записи: {merged}")
+                        continue
+                    self._failures[task_id] = failures
+                    self._pending[task_id] = merged
+            return 0
+
+        with self._lock:
+            self.stats['flushes'] += 1
+            self.stats['rows_written'] += len(batch)
+            for task_id, fields in batch.items():
+                self._failures.pop(task_id, None)
+                if _status_value(fields.get('status')) in TERMINAL_STATUSES:
+                    self._progress.pop(task_id, None)
+
+        return len(batch)
+
+    def _run(self) -> None:
+        """Цикл фонового сброса"""
+        while not self._stop_event.wait(self.flush_interval):
+            self.flush()
+
+
+def _status_value(status) -> Optional[str]:
+    """Строковое значение статуса (Enum или строка)"""
+    if status is None:
+        return None
+    return getattr(status, 'value', status)
@@ -93,6 +93,7 @@ class DaurMediaApp {
             
             this.updateStatusIndicator(status.initialized);
             this.updateSystemStats(status);
+            this.updateModelOptions(status.models);
             this.isInitialized = status.initialized;
         } catch (error) {
             console.error('Ошибка проверки статуса:', error);
@@ -117,6 +118,19 @@ class DaurMediaApp {
         }
     }
 
+    updateModelOptions(models) {
+        // Список моделей из реестра; загруженные помечаются
+        const select = document.getElementById('model');
+        if (!select || !models) return;
+        
+        const selected = select.value || models.default_model;
+        select.innerHTML = Object.values(models.models).map(model => `
+            <option value="${model.name}" ${model.name === selected ? 'selected' : ''}>
+                ${model.name}${model.description ? ` - ${model.description}` : ''}${models.loaded[model.name] ? ' (загружена)' : ''}
+            </option>
+        `).join('');
+    }
+
     updateSystemStats(stats) {
         // Обновление статистики в header
         if (stats.cpu_percent !== undefined) {
@@ -197,6 +211,14 @@ class DaurMediaApp {
             data.seed = parseInt(formData.get('seed'));
         }
         
+        if (formData.get('draft')) {
+            data.mode = 'draft';
+        }
+        
+        if (formData.get('model')) {
+            data.model = formData.get('model');
+        }
+        
         const btn = document.getElementById('generateBtn');
         const originalText = btn.innerHTML;
         
@@ -268,10 +290,21 @@ class DaurMediaApp {
         tasksList.innerHTML = tasks.map(task => `
             <div class="glass-effect rounded-lg p-6 border border-white border-opacity-20 hover:bg-white hover:bg-opacity-5 transition-all">
                 <div class="flex items-start justify-between mb-4">
+                    ${task.status === 'completed' ? `
+                        <img src="/api/tasks/${task.id}/thumbnail" loading="lazy" alt="Превью"
+                             class="w-40 rounded-lg mr-4 cursor-pointer object-cover"
+                             onmouseenter="this.src='/api/tasks/${task.id}/thumbnail?kind=animated'"
+                             onmouseleave="this.src='/api/tasks/${task.id}/thumbnail'"
+                             onerror="this.remove()"
+                             onclick="app.downloadVideo('${task.id}')">
+                    ` : ''}
                     <div class="flex-1">
                         <div class="flex items-center space-x-2 mb-2">
                             <h4 class="text-white font-medium">Задача ${task.id.substring(0, 8)}</h4>
                             <span class="text-xs text-white text-opacity-50">Daur MedIA</span>
+                            ${task.mode === 'draft' ? '<span class="text-xs px-2 py-0.5 rounded bg-white bg-opacity-20 text-white">Черновик</span>' : ''}
+                            ${task.mode === 'refine' ? '<span class="text-xs px-2 py-0.5 rounded bg-white bg-opacity-20 text-white">Доработка</span>' : ''}
+                            ${task.model ? `<span class="text-xs px-2 py-0.5 rounded bg-white bg-opacity-10 text-white text-opacity-70">${task.model}</span>` : ''}
                         </div>
                         <p class="text-white text-opacity-80 text-sm mb-3 leading-relaxed">${task.prompt}</p>
                         <div class="grid grid-cols-2 md:grid-cols-4 gap-2 text-xs text-white text-opacity-60">
@@ -286,6 +319,11 @@ class DaurMediaApp {
                         <span class="px-3 py-1 rounded-full text-xs font-medium status-${task.status}">
                             ${this.getStatusText(task.status)}
                         </span>
+                        ${task.status === 'completed' && task.mode === 'draft' ? `
+                            <button onclick="app.refineTask('${task.id}')" class="glass-effect px-3 py-2 rounded text-white text-sm hover:bg-white hover:bg-opacity-20 transition-all" title="Доработать в полном качестве">
+                                <i data-lucide="sparkles" class="w-4 h-4"></i>
+                            </button>
+                        ` : ''}
                         ${task.status === 'completed' ? `
                             <button onclick="app.downloadVideo('${task.id}')" class="glass-effect px-3 py-2 rounded text-white text-sm hover:bg-white hover:bg-opacity-20 transition-all" title="Скачать видео">
                                 <i data-lucide="download" class="w-4 h-4"></i>
@@ -298,9 +336,15 @@ class DaurMediaApp {
                 </div>
                 ${task.status === 'processing' ? `
                     <div class="w-full bg-white bg-opacity-20 rounded-full h-2 mb-2">
-                        <div class="bg-gradient-to-r from-blue-500 to-purple-500 h-2 rounded-full animate-pulse-slow" style="width: 60%"></div>
+                        <div class="bg-gradient-to-r from-blue-500 to-purple-500 h-2 rounded-full animate-pulse-slow" style="width: ${this.getProgressPercent(task)}%"></div>
                     </div>
-                    <p class="text-white text-opacity-60 text-sm">Генерация видео в процессе...</p>
+                    <p class="text-white text-opacity-60 text-sm">Генерация видео в процессе...${task.eta ? ` осталось ${this.formatDuration(task.eta.eta_seconds)}` : ''}</p>
+                ` : ''}
+                ${task.status === 'pending' && task.eta ? `
+                    <p class="text-white text-opacity-60 text-sm">
+                        <i data-lucide="hourglass" class="w-4 h-4 inline mr-1"></i>
+                        Позиция в очереди: ${task.eta.queue_position}, готово примерно ${new Date(task.eta.predicted_finish).toLocaleTimeString()}
+                    </p>
                 ` : ''}
                 ${task.error ? `
                     <div class="mt-3 p-3 bg-red-500 bg-opacity-20 rounded text-red-200 text-sm">
@@ -325,6 +369,21 @@ class DaurMediaApp {
         return statusMap[status] || status;
     }
 
+    getProgressPercent(task) {
+        if (!task.eta || !task.eta.estimated_seconds) {
+            return 60;
+        }
+        const done = 1 - task.eta.eta_seconds / task.eta.estimated_seconds;
+        return Math.round(Math.min(0.99, Math.max(0.02, done)) * 100);
+    }
+
+    formatDuration(seconds) {
+        if (seconds < 60) {
+            return `${Math.round(seconds)} с`;
+        }
+        return `${Math.round(seconds / 60)} мин`;
+    }
+
     async downloadVideo(taskId) {
         try {
             const response = await fetch(`/api/download/${taskId}`);
@@ -633,6 +692,22 @@ class DaurMediaApp {
         }
     }
 
+    async refineTask(taskId) {
+        try {
+            const response = await fetch(`/api/tasks/${taskId}/refine`, { method: 'POST' });
+            const result = await response.json();
+            
+            if (result.success) {
+                this.showNotification('Задача создана!', 'Доработка черновика началась', 'success');
+                this.loadTasks();
+            } else {
+                this.showNotification('Ошибка', result.error || 'Ошибка создания задачи', 'error');
+            }
+        } catch (error) {
+            this.showNotification('Ошибка', 'Ошибка отправки запроса', 'error');
+        }
+    }
+
     async deleteTask(taskId) {
         if (confirm('Удалить эту задачу?')) {
             // Здесь можно добавить API для удаления задачи
@@ -6,26 +6,50 @@ Daur MedIA - AI Video Generation Platform
 
 import os
 import json
+import atexit
+import argparse
+import random
 import threading
 import time
 import uuid
 import psutil
 from datetime import datetime, timedelta
-from flask import Flask, render_template_string, request, jsonify, send_file
+from flask import Flask, Response, render_template_string, request, jsonify, send_file
 from werkzeug.utils import secure_filename
 
+from affinity_dispatcher import AffinityDispatcher
+from autoscaler import Autoscaler, AutoscalerConfig
+from cpu_placement import CorePlacer
+from deadline_scheduler import DeadlineScheduler, parse_deadline
+from draft_refine import draft_params
+from generation_profiles import CostModel, resolve_profile, validate_infer_steps
+from model_pool import MemoryBudget, ModelPool
+from shape_buckets import ShapeBuckets
+from task_eta import simulate_schedule
+from task_retention import RetentionPolicy, TaskGarbageCollector
+from task_store import TaskStore, TaskRecord, TaskStatus
+from video_delivery import configure_video_delivery, send_video
+from encode_pool import create_encoder_pool_from_env
+from video_encoder import resolve_encode_options
+from video_previews import PREVIEW_KINDS, PREVIEW_MIMETYPES, PreviewCache
+from video_renditions import PLAYLIST_MIMETYPE, PLAYLIST_NAME, SEGMENT_MIMETYPE, TranscodeCache
+from zygote import Zygote, ZygoteGenerator, zygote_enabled
+
 # Условный импорт для демонстрации
 try:
     from hunyuan_video_interface import HunyuanVideoGenerator
 except ImportError:
     # Заглушка для демонстрации без установленных зависимостей
     class HunyuanVideoGenerator:
-        def __init__(self):
+        def __init__(self, model_path=None, **kwargs):
             self.initialized = False
         
         def initialize(self):
             return True
         
+        def unload(self):
+            self.initialized = False
+        
         def get_model_info(self):
             return {
                 'initialized': False,
@@ -45,13 +69,161 @@ except ImportError:
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'daur-media-secret-key-2025'
+configure_video_delivery(app)
 
 # Глобальные переменные
-generator = None
-tasks = {}
-task_lock = threading.Lock()
+task_store = TaskStore()
 system_stats = {}
 
+# Задачи генерации распределяются между воркерами (у каждого свой пул
+# моделей) с учетом загруженных моделей и прогретых корзин; кодирование
+# готового видео идет параллельно в пуле процессов. С автомасштабированием
+# число воркеров меняется от минимума до максимума по очереди и ресурсам
+autoscaler_config = AutoscalerConfig.from_env()
+
+# Группа процессов параллелизма по последовательности (и ее порт встречи)
+# одна на сервер: генератор с ней может быть только у одного воркера.
+# В режиме зиготы параллелизм отключен, ограничение не нужно
+SEQUENCE_PARALLEL_DEGREE = (
+    int(os.environ.get('DAUR_MEDIA_ULYSSES_DEGREE', '1')) * int(os.environ.get('DAUR_MEDIA_RING_DEGREE', '1'))
+)
+single_worker = SEQUENCE_PARALLEL_DEGREE > 1 and not zygote_enabled()
+if single_worker:
+    if autoscaler_config.enabled or int(os.environ.get('DAUR_MEDIA_GENERATION_WORKERS', '1')) > 1:
+        print(
+            f"⚠️  Параллелизм по последовательности (степень {SEQUENCE_PARALLEL_DEGREE}) допускает один "
+            f"воркер генерации: автомасштабирование и DAUR_MEDIA_GENERATION_WORKERS игнорируются"
+        )
+    autoscaler_config.enabled = False
+
+dispatcher = AffinityDispatcher.from_env(
+    1 if single_worker else autoscaler_config.min_workers if autoscaler_config.enabled else None
+)
+MAX_GENERATION_WORKERS = autoscaler_config.max_workers if autoscaler_config.enabled else dispatcher.worker_count
+generation_threads = {}
+encoder_pool = None
+worker_lock = threading.Lock()
+
+OUTPUT_DIR = './generated_videos'
+
+
+# Режим зиготы (DAUR_MEDIA_ZYGOTE=1): веса загружаются один раз в отдельном
+# процессе, генерация идет в порожденных от него через fork воркерах
+zygote = Zygote() if zygote_enabled() else None
+if zygote is not None:
+    atexit.register(zygote.stop)
+
+# Раздельные ядра воркеров (DAUR_MEDIA_CPU_PLACEMENT=1): слот ядер на
+# каждого возможного воркера, потоков torch - по ядрам слота. Привязка
+# делается в процессах-воркерах, поэтому нужен режим зиготы
+core_placer = CorePlacer.from_env(MAX_GENERATION_WORKERS)
+if core_placer.enabled and zygote is None:
+    print("⚠️  Размещение по ядрам работает только с процессами-воркерами (DAUR_MEDIA_ZYGOTE=1), отключено")
+    core_placer = CorePlacer(slots=MAX_GENERATION_WORKERS)
+
+
+def _create_generator(spec, placement=None):
+    """Генератор для модели из реестра (веса загружает пул)"""
+    if zygote is not None:
+        return ZygoteGenerator(zygote, spec.to_dict(), placement)
+    return HunyuanVideoGenerator(model_path=spec.model_base, dit_weight=spec.dit_weight)
+
+
+# Бюджет памяти под веса общий для пулов работающих воркеров (с зиготой
+# веса у воркеров общие и учитываются один раз); запуск еще одного
+# воркера ограничивает проверка свободной памяти в автоскейлере
+model_budget = MemoryBudget.from_env()
+
+
+def _create_pool(worker_id):
+    """Пул моделей воркера"""
+    placement = core_placer.acquire(worker_id)
+    return ModelPool.from_env(lambda spec: _create_generator(spec, placement), model_budget)
+
+
+# Модели из реестра загружаются по требованию задач и выгружаются по LRU.
+# Пул воркера 0 отвечает за реестр, статус и ручную загрузку, поэтому
+# этот воркер при масштабировании не выводится
+worker_pools = {worker_id: _create_pool(worker_id) for worker_id in dispatcher.worker_ids()}
+model_pool = worker_pools[0]
+
+# Оценка времени генерации, калибруется по выполненным задачам
+cost_model = CostModel.from_env()
+
+# Корзины размеров: задачи с одинаковой формой делят кеши и буферы
+shape_buckets = ShapeBuckets.from_env()
+
+# Снижение качества под срок клиента и доля задач, успевших к сроку;
+# уменьшенное разрешение тоже берется из корзин
+deadline_scheduler = DeadlineScheduler(
+    cost_model.estimate,
+    lambda params: shape_buckets.snap_params(params, round_down=True)
+)
+
+# Постеры и анимированные превью готовых видео
+preview_cache = PreviewCache(os.path.join(OUTPUT_DIR, 'previews'))
+PREVIEW_MAX_AGE = 365 * 24 * 3600
+
+# HLS-рендиции пониженного разрешения, перекодируются по запросу
+rendition_cache = TranscodeCache.from_env(os.path.join(OUTPUT_DIR, 'renditions'))
+
+# Размер блока и пауза при отдаче файла, который еще дописывается
+STREAM_CHUNK_SIZE = 256 * 1024
+STREAM_POLL_INTERVAL = 0.2
+
+
+def _list_tasks():
+    """Снимок задач для сборщика"""
+    return task_store.snapshot().as_sorted_dicts()
+
+
+# Прогноз пересчитывается, только когда изменились задачи или очередь
+# (и не реже раза в SCHEDULE_CACHE_SECONDS - время идет), поэтому опрос
+# списка задач не берет блокировку диспетчера на каждый запрос
+SCHEDULE_CACHE_SECONDS = 2.0
+_schedule_cache = None
+
+
+def _simulate_schedule():
+    """
+    Прогноз начала и завершения для выполняемых и ожидающих задач по
+    воркерам и время, когда освободится воркер для новой задачи
+    """
+    global _schedule_cache
+    key = (task_store.snapshot().version, dispatcher.version)
+    cached = _schedule_cache
+    if cached is not None and cached[0] == key and time.time() - cached[1] < SCHEDULE_CACHE_SECONDS:
+        return cached[2]
+    
+    queued_ids = dispatcher.queued_ids()
+    snapshot = task_store.snapshot()
+    running = [task for task in snapshot if task.status == TaskStatus.PROCESSING]
+    queued = [
+        task for task in (snapshot.get(task_id) for task_id in queued_ids)
+        if task is not None and task.status == TaskStatus.PENDING
+    ]
+    result = simulate_schedule(running, queued, cost_model.estimate, workers=dispatcher.worker_count)
+    _schedule_cache = (key, time.time(), result)
+    return result
+
+
+def _task_schedule():
+    """Прогноз начала и завершения для выполняемых и ожидающих задач"""
+    return _simulate_schedule()[0]
+
+
+def _remove_task(task_id):
+    """Удаление задачи вместе с ее превью и рендициями"""
+    record = task_store.remove(task_id)
+    if record is not None:
+        preview_cache.remove(task_id)
+        rendition_cache.remove(task_id)
+    return record
+
+
+# Фоновая очистка старых задач и видеофайлов
+task_gc = TaskGarbageCollector(_list_tasks, _remove_task, RetentionPolicy.from_env(), OUTPUT_DIR)
+
 # HTML шаблон улучшенного интерфейса
 HTML_TEMPLATE = """
 <!DOCTYPE html>
@@ -254,7 +426,7 @@ HTML_TEMPLATE = """
                             </label>
                             <select id="video_width" name="video_width" class="w-full px-4 py-2 rounded-lg bg-white bg-opacity-10 border border-white border-opacity-20 text-white focus:outline-none focus:ring-2 focus:ring-white focus:ring-opacity-50">
                                 <option value="1280">1280px (HD)</option>
-                                <option value="1920">1920px (Full HD)</option>
+                                <option value="960">960px (qHD)</option>
                                 <option value="720">720px (SD)</option>
                             </select>
                         </div>
@@ -265,9 +437,9 @@ HTML_TEMPLATE = """
                             </label>
                             <select id="video_height" name="video_height" class="w-full px-4 py-2 rounded-lg bg-white bg-opacity-10 border border-white border-opacity-20 text-white focus:outline-none focus:ring-2 focus:ring-white focus:ring-opacity-50">
                                 <option value="720">720px (16:9)</option>
-                                <option value="1080">1080px (16:9)</option>
-                                <option value="1280">1280px (1:1)</option>
-                                <option value="1920">1920px (9:16)</option>
+                                <option value="544">544px (16:9)</option>
+                                <option value="960">960px (1:1)</option>
+                                <option value="1280">1280px (9:16)</option>
                             </select>
                         </div>
                         <div>
@@ -276,10 +448,10 @@ HTML_TEMPLATE = """
                                 Длительность
                             </label>
                             <select id="video_length" name="video_length" class="w-full px-4 py-2 rounded-lg bg-white bg-opacity-10 border border-white border-opacity-20 text-white focus:outline-none focus:ring-2 focus:ring-white focus:ring-opacity-50">
+                                <option value="33">1.4 сек (33 кадра)</option>
                                 <option value="65">2.7 сек (65 кадров)</option>
+                                <option value="97">4.0 сек (97 кадров)</option>
                                 <option value="129">5.4 сек (129 кадров)</option>
-                                <option value="193">8.0 сек (193 кадров)</option>
-                                <option value="257">10.7 сек (257 кадров)</option>
                             </select>
                         </div>
                         <div>
@@ -338,6 +510,23 @@ HTML_TEMPLATE = """
                         </div>
                     </div>
 
+                    <div>
+                        <label for="model" class="block text-white font-medium mb-2">
+                            <i data-lucide="box" class="w-4 h-4 inline mr-2"></i>
+                            Модель
+                        </label>
+                        <select id="model" name="model" class="w-full px-4 py-2 rounded-lg bg-white bg-opacity-10 border border-white border-opacity-20 text-white focus:outline-none focus:ring-2 focus:ring-white focus:ring-opacity-50">
+                        </select>
+                    </div>
+
+                    <label for="draft" class="flex items-center space-x-3 text-white cursor-pointer">
+                        <input type="checkbox" id="draft" name="draft" class="w-4 h-4 rounded">
+                        <span>
+                            <i data-lucide="pencil" class="w-4 h-4 inline mr-2"></i>
+                            Сначала черновик (быстрый просмотр, затем доработка в полном качестве)
+                        </span>
+                    </label>
+
                     <button 
                         type="submit" 
                         id="generateBtn"
@@ -694,45 +883,251 @@ def update_system_stats():
     except Exception as e:
         print(f"Ошибка обновления статистики: {e}")
 
-def process_video_task(task_id, task_data):
-    """Обработка задачи генерации видео в отдельном потоке"""
-    global generator, tasks
+def ensure_generation_worker():
+    """Запуск потоков генерации и пула кодировщиков при первой задаче"""
+    global encoder_pool
     
-    with task_lock:
-        if task_id not in tasks:
-            return
-        tasks[task_id]['status'] = 'processing'
-        tasks[task_id]['started_at'] = datetime.now().isoformat()
+    with worker_lock:
+        # Воркеры зиготы кодируют видео сами - пул кодировщиков им не передается
+        if encoder_pool is None and zygote is None:
+            encoder_pool = create_encoder_pool_from_env()
+        for worker_id in dispatcher.worker_ids():
+            thread = generation_threads.get(worker_id)
+            if thread is None or not thread.is_alive():
+                thread = threading.Thread(target=generation_worker, args=(worker_id,), name=f'generation-worker-{worker_id}')
+                thread.daemon = True
+                thread.start()
+                generation_threads[worker_id] = thread
+
+def submit_task(prompt, params, seed=None, stream=False, encode_options=None, **extra):
+    """Сохранение новой задачи и постановка ее в очередь генерации"""
+    task_id = str(uuid.uuid4())
     
+    # В потоковом режиме видео пишется фрагментированным MP4 прямо в итоговый файл
+    stream_path = os.path.join(OUTPUT_DIR, f"daur_media_{task_id}.mp4") if stream else None
+    
+    record = task_store.add(TaskRecord(
+        id=task_id,
+        prompt=prompt,
+        seed=seed,
+        status=TaskStatus.PENDING,
+        created_at=datetime.now().isoformat(),
+        platform='Daur MedIA',
+        stream_path=stream_path,
+        encode_options=encode_options,
+        estimated_seconds=cost_model.estimate(params),
+        shape_bucket=shape_buckets.bucket_for(params).key,
+        **params,
+        **extra
+    ))
+    
+    dispatcher.submit(task_id, model_pool.resolve(record.model), record.shape_bucket)
+    ensure_generation_worker()
+    return record
+
+def worker_warm_state(pool):
+    """Загруженные модели пула и корзины, прогретые ими при загрузке"""
+    warm = {}
+    for name in pool.get_stats()['loaded']:
+        compile_stats = pool.peek(name).get_model_info().get('compile') or {}
+        warm[name] = list(compile_stats.get('warm_buckets') or ())
+    return warm
+
+def generation_worker(worker_id):
+    """
+    Последовательная обработка задач, выбранных диспетчером для воркера
+    
+    Выведенный воркер (задач больше нет) выгружает свои модели и завершается.
+    """
+    pool = worker_pools[worker_id]
+    while True:
+        task_id = dispatcher.next_task(worker_id)
+        if task_id is None:
+            break
+        model = bucket = None
+        try:
+            task_data = task_store.get(task_id)
+            if task_data is not None:
+                process_video_task(task_id, task_data, pool)
+                # Корзина могла смениться при пересчете под срок
+                record = task_store.get(task_id) or task_data
+                model = pool.resolve(record.model)
+                if record.status != TaskStatus.FAILED:
+                    bucket = record.shape_bucket
+        finally:
+            dispatcher.task_done(worker_id, worker_warm_state(pool), model, bucket)
+    
+    for name in list(pool.get_stats()['loaded']):
+        pool.unload(name)
+    model_budget.remove(pool)
+    with worker_lock:
+        dispatcher.remove_worker(worker_id)
+        worker_pools.pop(worker_id, None)
+        generation_threads.pop(worker_id, None)
+        core_placer.release(worker_id)
+    print(f"🛑 Воркер генерации {worker_id} завершен")
+
+def scale_up_worker():
+    """Добавление воркера генерации (для автомасштабирования)"""
+    with worker_lock:
+        worker_id = dispatcher.add_worker()
+        worker_pools[worker_id] = _create_pool(worker_id)
+    ensure_generation_worker()
+    return worker_id
+
+def scale_down_worker(worker_id):
+    """Вывод воркера: дорабатывает текущую задачу и завершается"""
+    if worker_id == 0:
+        return False
+    return dispatcher.retire_worker(worker_id)
+
+def autoscaler_state():
+    """Очередь, работа в ней и ресурсы хоста для автоскейлера"""
+    workers = dispatcher.get_stats()['workers']
+    queued = [task_store.get(task_id) for task_id in dispatcher.queued_ids()]
+    queued = [task for task in queued if task is not None]
+    memory = psutil.virtual_memory()
+    # С зиготой новый воркер делит веса с ней, иначе загружает свою копию
+    worker_memory = 0 if zygote is not None else model_pool.expected_bytes()
+    # Запущенный воркер загружает модель минутами, на первой задаче: пока
+    # он ее не загрузил, свободная память ему уже обещана
+    pools = [worker_pools.get(worker['worker_id']) for worker in workers if not worker['draining']]
+    loading = sum(1 for pool in pools if pool is not None and not pool.get_stats()['loaded'])
+    return {
+        'workers': sum(1 for worker in workers if not worker['draining']),
+        'queued': len(queued),
+        'backlog_seconds': sum(task.estimated_seconds or 0 for task in queued),
+        'cpu_percent': psutil.cpu_percent(interval=None),
+        'memory_available_bytes': memory.available - loading * worker_memory,
+        'worker_memory_bytes': worker_memory,
+        'idle_workers': [
+            (worker['worker_id'], worker['idle_seconds']) for worker in workers
+            if not worker['busy'] and not worker['draining'] and worker['worker_id'] != 0
+        ]
+    }
+
+autoscaler = Autoscaler(autoscaler_config, autoscaler_state, scale_up_worker, scale_down_worker)
+
+def complete_task(task_id, output_path, seed):
+    """Отметка задачи выполненной и постановка превью в очередь"""
+    record = task_store.update(
+        task_id,
+        status=TaskStatus.COMPLETED,
+        output_path=output_path,
+        seed=seed,
+        completed_at=datetime.now().isoformat()
+    )
+    if record is not None and record.deadline:
+        deadline_scheduler.record_outcome(record)
+    preview_cache.submit(task_id, output_path)
+
+def fail_task(task_id, error):
+    """Отметка задачи завершенной с ошибкой"""
+    record = task_store.update(
+        task_id,
+        status=TaskStatus.FAILED,
+        error=error,
+        completed_at=datetime.now().isoformat()
+    )
+    if record is not None and record.deadline:
+        deadline_scheduler.record_outcome(record)
+
+def finish_encode(task_id, seed, future):
+    """Завершение задачи после кодирования в пуле"""
     try:
-        # Генерация видео
-        result = generator.generate_video(
-            prompt=task_data['prompt'],
-            video_size=(task_data['video_height'], task_data['video_width']),
-            video_length=task_data['video_length'],
-            infer_steps=task_data['infer_steps'],
-            seed=task_data.get('seed'),
-            embedded_cfg_scale=task_data.get('cfg_scale', 6.0),
-            save_path="./generated_videos",
-            filename=f"daur_media_{task_id}.mp4"
-        )
+        encode_result = future.result()
+        complete_task(task_id, encode_result['output_path'], seed)
+    except Exception as e:
+        fail_task(task_id, f"Ошибка кодирования: {e}")
+
+def replan_for_deadline(task_data):
+    """
+    Пересчет параметров задачи со сроком в момент начала генерации
+    
+    Очередь могла пройти быстрее или медленнее прогноза, поэтому план
+    строится заново от запрошенных параметров; если срок уже недостижим,
+    задача выполняется с самыми дешевыми разрешенными параметрами.
+    """
+    bounds = task_data.deadline_bounds or {}
+    requested = dict(bounds.get('requested') or {
+        name: task_data[name] for name in ('video_width', 'video_height', 'video_length', 'infer_steps')
+    })
+    plan = deadline_scheduler.plan(
+        requested,
+        datetime.now(),
+        datetime.fromisoformat(task_data.deadline),
+        bounds.get('min_infer_steps'),
+        bounds.get('min_scale', 1.0)
+    )
+    if plan is None:
+        params = deadline_scheduler.cheapest(requested, bounds.get('min_infer_steps'), bounds.get('min_scale', 1.0))
+        degradation = {'requested': requested, **params, 'deadline_unreachable': True}
+    else:
+        params, degradation = plan
+    return dict(
+        params,
+        degradation=degradation,
+        estimated_seconds=cost_model.estimate(params),
+        shape_bucket=shape_buckets.bucket_for(params).key
+    )
+
+def process_video_task(task_id, task_data, pool=None):
+    """Обработка задачи генерации видео в потоке генерации (на пуле моделей воркера)"""
+    pool = pool or model_pool
+    changes = {}
+    if task_data.deadline:
+        changes = replan_for_deadline(task_data)
+    
+    task_data = task_store.update(
+        task_id,
+        status=TaskStatus.PROCESSING,
+        started_at=datetime.now().isoformat(),
+        **changes
+    )
+    if task_data is None:
+        return
+    
+    try:
+        # Модель загружается, если ее еще нет, и не выгружается до конца генерации
+        with pool.acquire(task_data.get('model')) as generator:
+            generation_started = time.time()
+            result = generator.generate_video(
+                prompt=task_data['prompt'],
+                video_size=(task_data['video_height'], task_data['video_width']),
+                video_length=task_data['video_length'],
+                infer_steps=task_data['infer_steps'],
+                seed=task_data.get('seed'),
+                embedded_cfg_scale=task_data.get('cfg_scale', 6.0),
+                save_path=OUTPUT_DIR,
+                filename=f"daur_media_{task_id}.mp4",
+                stream=bool(task_data.get('stream_path')),
+                encode_pool=encoder_pool,
+                encode_options=task_data.get('encode_options')
+            )
         
-        with task_lock:
-            if result['success']:
-                tasks[task_id]['status'] = 'completed'
-                tasks[task_id]['output_path'] = result['output_path']
-                tasks[task_id]['seed'] = result['seed']
-            else:
-                tasks[task_id]['status'] = 'failed'
-                tasks[task_id]['error'] = result['error']
-            
-            tasks[task_id]['completed_at'] = datetime.now().isoformat()
+        if result.get('memory_plan'):
+            task_store.update(task_id, memory_mode=result['memory_plan']['mode'])
+        
+        if result['success']:
+            cost_model.record(
+                {name: task_data[name] for name in ('video_width', 'video_height', 'video_length', 'infer_steps')},
+                time.time() - generation_started
+            )
+        
+        encode_future = result.get('encode_future')
+        if result['success'] and encode_future is not None:
+            # Статус станет completed только после кодирования,
+            # а поток генерации уже берет следующую задачу
+            encode_future.add_done_callback(
+                lambda future: finish_encode(task_id, result['seed'], future)
+            )
+        elif result['success']:
+            complete_task(task_id, result['output_path'], result['seed'])
+        else:
+            fail_task(task_id, result['error'])
     
     except Exception as e:
-        with task_lock:
-            tasks[task_id]['status'] = 'failed'
-            tasks[task_id]['error'] = str(e)
-            tasks[task_id]['completed_at'] = datetime.now().isoformat()
+        fail_task(task_id, str(e))
 
 @app.route('/')
 def index():
@@ -742,12 +1137,9 @@ def index():
 @app.route('/api/status')
 def get_status():
     """Получение статуса модели и системы"""
-    global generator
-    
-    if generator is None:
-        generator = HunyuanVideoGenerator()
-    
-    info = generator.get_model_info()
+    # Статус модели по умолчанию и сводка пула моделей
+    info = model_pool.peek().get_model_info()
+    info['models'] = model_pool.get_stats()
     
     # Добавляем системную статистику
     update_system_stats()
@@ -757,17 +1149,27 @@ def get_status():
 
 @app.route('/api/initialize', methods=['POST'])
 def initialize_model():
-    """Инициализация модели"""
-    global generator
+    """Загрузка модели (по умолчанию или указанной в поле model)"""
+    data = request.get_json(silent=True) or {}
+    try:
+        model = model_pool.resolve(data.get('model'))
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     
     try:
-        if generator is None:
-            generator = HunyuanVideoGenerator()
-        
-        success = generator.initialize()
+        try:
+            model_pool.load(model)
+            success = True
+        except RuntimeError:
+            success = False
+        dispatcher.report_warm(0, worker_warm_state(model_pool))
         
         return jsonify({
             'success': success,
+            'model': model,
             'message': 'Модель Daur MedIA инициализирована' if success else 'Ошибка инициализации'
         })
     
@@ -780,14 +1182,6 @@ def initialize_model():
 @app.route('/api/generate', methods=['POST'])
 def generate_video():
     """Создание задачи генерации видео"""
-    global generator, tasks
-    
-    if generator is None or not generator.initialized:
-        return jsonify({
-            'success': False,
-            'error': 'Модель Daur MedIA не инициализирована'
-        }), 400
-    
     try:
         data = request.get_json()
         
@@ -797,37 +1191,200 @@ def generate_video():
                 'error': 'Требуется поле prompt'
             }), 400
         
-        # Создание уникального ID задачи
-        task_id = str(uuid.uuid4())
-        
-        # Сохранение задачи
-        task_data = {
-            'id': task_id,
-            'prompt': data['prompt'],
-            'video_width': data.get('video_width', 1280),
-            'video_height': data.get('video_height', 720),
-            'video_length': data.get('video_length', 129),
-            'infer_steps': data.get('infer_steps', 50),
-            'cfg_scale': data.get('cfg_scale', 6.0),
-            'seed': data.get('seed'),
-            'status': 'pending',
-            'created_at': datetime.now().isoformat(),
-            'platform': 'Daur MedIA'
-        }
+        # Модель из реестра по имени; незагруженная загрузится перед генерацией
+        try:
+            model = model_pool.resolve(data.get('model'))
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        # Параметры кодирования: профиль (preview/balanced/archival) и/или codec, preset, crf
+        try:
+            encode_options = resolve_encode_options(
+                profile=data.get('encode_profile'),
+                codec=data.get('codec'),
+                preset=data.get('preset'),
+                crf=data.get('crf')
+            )
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        mode = data.get('mode')
+        if mode not in (None, 'full', 'draft'):
+            return jsonify({
+                'success': False,
+                'error': f"Неизвестный режим: {mode}"
+            }), 400
         
-        with task_lock:
-            tasks[task_id] = task_data
+        # Профиль задается по имени или выбирается по бюджету времени (секунды)
+        profile = data.get('profile')
+        if profile is None and data.get('latency_budget') is not None:
+            try:
+                budget = float(data['latency_budget'])
+            except (TypeError, ValueError):
+                return jsonify({
+                    'success': False,
+                    'error': 'latency_budget должен быть числом секунд'
+                }), 400
+            profile, estimates = cost_model.select_for_budget(budget)
+            if profile is None:
+                return jsonify({
+                    'success': False,
+                    'error': f"Ни один профиль не укладывается в {budget:.0f} с",
+                    'estimates': estimates
+                }), 400
         
-        # Запуск обработки в отдельном потоке
-        thread = threading.Thread(target=process_video_task, args=(task_id, task_data))
-        thread.daemon = True
-        thread.start()
+        try:
+            params = resolve_profile(profile) if profile else {
+                'video_width': 1280,
+                'video_height': 720,
+                'video_length': 129,
+                'infer_steps': 50
+            }
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
         
-        return jsonify({
+        # Явно заданные параметры важнее профиля
+        for name in ('video_width', 'video_height', 'video_length', 'infer_steps'):
+            if name in data:
+                params[name] = data[name]
+        try:
+            params['infer_steps'] = validate_infer_steps(params['infer_steps'])
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        try:
+            params['cfg_scale'] = float(data.get('cfg_scale', 6.0))
+        except (TypeError, ValueError):
+            return jsonify({
+                'success': False,
+                'error': 'cfg_scale должен быть числом'
+            }), 400
+        
+        # Размеры приводятся к ближайшей корзине, некорректные отклоняются
+        # до постановки в очередь, а не после запуска модели
+        requested_shape = {name: params[name] for name in ('video_width', 'video_height', 'video_length')}
+        try:
+            bucket = shape_buckets.bucket_for(params)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        params.update(bucket.params())
+        
+        # Черновик уменьшается до планирования срока: срок относится к нему
+        seed = data.get('seed')
+        refine_params = None
+        if mode == 'draft':
+            # Сид фиксируется сразу, чтобы доработка повторила черновик
+            if seed is None:
+                seed = random.randint(0, 2**32 - 2)
+            # Доработка идет в полном качестве, без снижения под срок черновика
+            refine_params = dict(params, encode_options=encode_options)
+            params.update(draft_params(
+                params['video_width'], params['video_height'],
+                params['video_length'], params['infer_steps']
+            ))
+            params = shape_buckets.snap_params(params, round_down=True)
+            encode_options = resolve_encode_options(profile='preview')
+        
+        # Срок: при прогнозе опоздания качество снижается в пределах,
+        # разрешенных клиентом (min_infer_steps, min_scale), иначе отказ
+        deadline = None
+        deadline_bounds = None
+        degradation = None
+        if data.get('deadline') is not None:
+            try:
+                deadline = parse_deadline(data['deadline'])
+                min_infer_steps = data.get('min_infer_steps')
+                min_scale = float(data.get('min_scale', 1.0))
+                if min_infer_steps is not None and int(min_infer_steps) < 1:
+                    raise ValueError("min_infer_steps должен быть не меньше 1")
+                if not 0 < min_scale <= 1:
+                    raise ValueError("min_scale должен быть в диапазоне (0, 1]")
+            except (TypeError, ValueError) as e:
+                return jsonify({
+                    'success': False,
+                    'error': f"Некорректный срок: {e}"
+                }), 400
+            
+            # Задача встанет в конец очереди и начнется на первом освободившемся воркере
+            start_at = max(_simulate_schedule()[1], datetime.now())
+            requested = {
+                name: params[name] for name in ('video_width', 'video_height', 'video_length', 'infer_steps')
+            }
+            plan = deadline_scheduler.plan(
+                requested, start_at, deadline,
+                int(min_infer_steps) if min_infer_steps is not None else None, min_scale
+            )
+            if plan is None:
+                deadline_scheduler.record_rejection()
+                cheapest = deadline_scheduler.cheapest(
+                    requested, int(min_infer_steps) if min_infer_steps is not None else None, min_scale
+                )
+                predicted_finish = start_at + timedelta(seconds=cost_model.estimate(cheapest))
+                return jsonify({
+                    'success': False,
+                    'error': 'Задача не успеет к сроку даже с разрешенным снижением качества',
+                    'predicted_start': start_at.isoformat(),
+                    'predicted_finish': predicted_finish.isoformat()
+                }), 400
+            
+            planned, degradation = plan
+            params.update(planned)
+            deadline_bounds = {
+                'requested': requested,
+                'min_infer_steps': int(min_infer_steps) if min_infer_steps is not None else None,
+                'min_scale': min_scale
+            }
+        record = submit_task(
+            data['prompt'],
+            params,
+            seed=seed,
+            stream=bool(data.get('stream')),
+            encode_options=encode_options,
+            mode=mode if mode == 'draft' else None,
+            model=model,
+            refine_params=refine_params,
+            profile=profile,
+            deadline=deadline.isoformat() if deadline else None,
+            deadline_bounds=deadline_bounds,
+            degradation=degradation
+        )
+        task_id = record.id
+        
+        response = {
             'success': True,
             'task_id': task_id,
+            'model': model,
             'message': 'Задача создана в Daur MedIA'
-        })
+        }
+        if record.stream_path:
+            response['stream_url'] = f'/api/tasks/{task_id}/stream'
+        if profile:
+            response['profile'] = profile
+        response['shape_bucket'] = record.shape_bucket
+        if bucket.params() != requested_shape:
+            response['requested_shape'] = requested_shape
+        response['estimated_seconds'] = record.estimated_seconds
+        if degradation:
+            response['degradation'] = degradation
+        if mode == 'draft':
+            response['draft'] = params
+            response['refine_url'] = f'/api/tasks/{task_id}/refine'
+        
+        return jsonify(response)
     
     except Exception as e:
         return jsonify({
@@ -835,16 +1392,131 @@ def generate_video():
             'error': str(e)
         }), 500
 
+@app.route('/api/tasks/<task_id>/refine', methods=['POST'])
+def refine_task(task_id):
+    """Генерация в полном качестве по черновику (тот же промпт и сид)"""
+    draft = task_store.get(task_id)
+    if draft is None:
+        return jsonify({'success': False, 'error': 'Задача не найдена'}), 404
+    
+    if draft.mode != 'draft':
+        return jsonify({'success': False, 'error': 'Задача не является черновиком'}), 400
+    
+    if draft.status == TaskStatus.FAILED:
+        return jsonify({'success': False, 'error': 'Черновик завершился с ошибкой'}), 400
+    
+    data = request.get_json(silent=True) or {}
+    params = dict(draft.refine_params)
+    encode_options = params.pop('encode_options', None)
+    
+    record = submit_task(
+        draft.prompt,
+        params,
+        seed=draft.seed,
+        stream=bool(data.get('stream')),
+        encode_options=encode_options,
+        mode='refine',
+        parent_id=task_id,
+        model=draft.model
+    )
+    
+    response = {
+        'success': True,
+        'task_id': record.id,
+        'parent_id': task_id,
+        'message': 'Задача доработки создана в Daur MedIA'
+    }
+    if record.stream_path:
+        response['stream_url'] = f'/api/tasks/{record.id}/stream'
+    
+    return jsonify(response)
+
+@app.route('/api/models')
+def get_models():
+    """Реестр моделей, загруженные модели и статистика пула"""
+    return jsonify(model_pool.get_stats())
+
+@app.route('/api/models/<name>/unload', methods=['POST'])
+def unload_model(name):
+    """Выгрузка модели (если на ней сейчас не идет генерация)"""
+    if name not in model_pool.specs:
+        return jsonify({'success': False, 'error': 'Модель не найдена'}), 404
+    
+    # Модель выгружается у всех воркеров, где она не занята генерацией
+    unloaded = False
+    for worker_id, pool in list(worker_pools.items()):
+        if pool.unload(name):
+            unloaded = True
+            dispatcher.report_warm(worker_id, worker_warm_state(pool))
+    return jsonify({
+        'success': unloaded,
+        'message': 'Модель выгружена' if unloaded else 'Модель не загружена или занята генерацией'
+    })
+
+@app.route('/api/workers')
+def get_workers():
+    """Воркеры генерации: прогретые модели и корзины, доля прогретых попаданий"""
+    stats = dispatcher.get_stats()
+    for worker in stats['workers']:
+        pool = worker_pools.get(worker['worker_id'])
+        worker['models'] = pool.get_stats()['loaded'] if pool is not None else {}
+    stats['zygote'] = zygote.get_stats() if zygote is not None else None
+    stats['cpu_placement'] = core_placer.get_stats()
+    stats['encoder_pool'] = encoder_pool.get_stats() if encoder_pool is not None else None
+    return jsonify(stats)
+
+@app.route('/api/autoscaler')
+def get_autoscaler():
+    """Параметры автомасштабирования и журнал решений с причинами"""
+    return jsonify(autoscaler.get_stats())
+
+@app.route('/api/buckets')
+def get_shape_buckets():
+    """Допустимые разрешения и длины видео"""
+    return jsonify(shape_buckets.to_dict())
+
+@app.route('/api/profiles')
+def get_profiles():
+    """Профили качества с оценкой времени на этом хосте"""
+    return jsonify({
+        'profiles': cost_model.profiles(),
+        'calibration': cost_model.to_dict(),
+        'prediction_error': cost_model.error_metrics()
+    })
+
+@app.route('/api/deadlines')
+def get_deadline_metrics():
+    """Доля задач со сроком, выполненных вовремя"""
+    return jsonify(deadline_scheduler.get_metrics())
+
+@app.route('/api/tasks/<task_id>/eta')
+def get_task_eta(task_id):
+    """Позиция в очереди и прогноз времени начала и завершения задачи"""
+    task = task_store.get(task_id)
+    if task is None:
+        return jsonify({'error': 'Задача не найдена'}), 404
+    
+    response = {
+        'task_id': task_id,
+        'status': task.status.value,
+        'started_at': task.started_at,
+        'completed_at': task.completed_at
+    }
+    eta = _task_schedule().get(task_id)
+    if eta is not None:
+        response.update(eta)
+    return jsonify(response)
+
 @app.route('/api/tasks')
 def get_tasks():
     """Получение списка задач"""
-    global tasks
-    
-    with task_lock:
-        task_list = list(tasks.values())
-    
-    # Сортировка по времени создания (новые сначала)
-    task_list.sort(key=lambda x: x['created_at'], reverse=True)
+    # Снимок уже отсортирован по времени создания (новые сначала);
+    # словари снимка общие, поэтому прогноз добавляется в копии
+    schedule = _task_schedule()
+    task_list = [
+        dict(task, eta=schedule[task['id']]) if task['id'] in schedule else task
+        for task in task_store.snapshot().as_sorted_dicts()
+    ]
     
     return jsonify({
         'tasks': task_list,
@@ -854,27 +1526,151 @@ def get_tasks():
 
 @app.route('/api/download/<task_id>')
 def download_video(task_id):
-    """Скачивание сгенерированного видео"""
-    global tasks
+    """Скачивание сгенерированного видео (?inline=1 - просмотр в браузере)"""
+    task = task_store.get(task_id)
+    if task is None:
+        return jsonify({'error': 'Задача не найдена'}), 404
     
-    with task_lock:
-        if task_id not in tasks:
-            return jsonify({'error': 'Задача не найдена'}), 404
-        
-        task = tasks[task_id]
+    if task.status != TaskStatus.COMPLETED:
+        return jsonify({'error': 'Видео еще не готово'}), 400
+    
+    if not task.output_path or not os.path.exists(task.output_path):
+        return jsonify({'error': 'Файл не найден'}), 404
     
-    if task['status'] != 'completed':
+    return send_video(task.output_path, download_name=f"daur_media_{task_id}.mp4")
+
+@app.route('/api/tasks/<task_id>/thumbnail')
+def get_thumbnail(task_id):
+    """Постер (?kind=poster) или анимированное превью (?kind=animated) готового видео"""
+    kind = request.args.get('kind', 'poster')
+    if kind not in PREVIEW_KINDS:
+        return jsonify({'error': f"Неизвестный тип превью: {kind}"}), 400
+    
+    task = task_store.get(task_id)
+    if task is None:
+        return jsonify({'error': 'Задача не найдена'}), 404
+    
+    if task.status != TaskStatus.COMPLETED:
         return jsonify({'error': 'Видео еще не готово'}), 400
     
-    if 'output_path' not in task or not os.path.exists(task['output_path']):
+    path = preview_cache.get(task_id, kind)
+    if path is None:
+        # Превью еще строится или было удалено - строим по запросу
+        if not task.output_path or not os.path.exists(task.output_path):
+            return jsonify({'error': 'Файл не найден'}), 404
+        try:
+            path = preview_cache.ensure(task_id, task.output_path, kind)
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+    
+    # Превью задачи не меняется, поэтому кешируется браузером без перепроверки
+    response = send_file(
+        path,
+        mimetype=PREVIEW_MIMETYPES[os.path.basename(path)],
+        conditional=True,
+        etag=True,
+        max_age=PREVIEW_MAX_AGE
+    )
+    response.headers['Cache-Control'] = f'public, max-age={PREVIEW_MAX_AGE}, immutable'
+    return response
+
+@app.route('/api/tasks/<task_id>/manifest.m3u8')
+def get_manifest(task_id):
+    """Мастер-плейлист HLS с лестницей рендиций"""
+    task = task_store.get(task_id)
+    if task is None:
+        return jsonify({'error': 'Задача не найдена'}), 404
+    
+    if task.status != TaskStatus.COMPLETED:
+        return jsonify({'error': 'Видео еще не готово'}), 400
+    
+    playlist = rendition_cache.master_playlist(task.video_width, task.video_height)
+    return Response(playlist, mimetype=PLAYLIST_MIMETYPE, headers={'Cache-Control': 'public, max-age=3600'})
+
+@app.route('/api/tasks/<task_id>/renditions/<rendition>/<filename>')
+def get_rendition_file(task_id, rendition, filename):
+    """Плейлист или сегмент рендиции (перекодирование при первом запросе плейлиста)"""
+    task = task_store.get(task_id)
+    if task is None:
+        return jsonify({'error': 'Задача не найдена'}), 404
+    
+    if task.status != TaskStatus.COMPLETED:
+        return jsonify({'error': 'Видео еще не готово'}), 400
+    
+    if not task.output_path or not os.path.exists(task.output_path):
         return jsonify({'error': 'Файл не найден'}), 404
     
+    try:
+        path = rendition_cache.get_file(
+            task_id, rendition, filename, task.output_path, task.video_width, task.video_height
+        )
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    
+    if path is None:
+        return jsonify({'error': 'Рендиция не найдена'}), 404
+    
+    is_playlist = filename == PLAYLIST_NAME
     return send_file(
-        task['output_path'],
-        as_attachment=True,
-        download_name=f"daur_media_{task_id}.mp4"
+        path,
+        mimetype=PLAYLIST_MIMETYPE if is_playlist else SEGMENT_MIMETYPE,
+        conditional=True,
+        etag=True,
+        max_age=3600 if is_playlist else PREVIEW_MAX_AGE
+    )
+
+@app.route('/api/renditions')
+def get_rendition_stats():
+    """Статистика кеша рендиций"""
+    return jsonify(rendition_cache.get_stats())
+
+@app.route('/api/tasks/<task_id>/stream')
+def stream_video(task_id):
+    """Прогрессивная отдача видео, пока задача еще выполняется"""
+    task = task_store.get(task_id)
+    if task is None:
+        return jsonify({'error': 'Задача не найдена'}), 404
+    
+    # Готовое видео отдаем обычным способом (с Range и кешированием)
+    if task.status == TaskStatus.COMPLETED and task.output_path and os.path.exists(task.output_path):
+        return send_video(task.output_path, download_name=f"daur_media_{task_id}.mp4", inline=True)
+    
+    if task.status == TaskStatus.FAILED:
+        return jsonify({'error': task.error or 'Ошибка генерации'}), 400
+    
+    if not task.stream_path:
+        return jsonify({'error': 'Задача создана без потокового режима'}), 400
+    
+    if not os.path.exists(task.stream_path):
+        response = jsonify({'error': 'Поток еще не начат', 'status': task.status.value})
+        response.headers['Retry-After'] = '5'
+        return response, 202
+    
+    return Response(
+        _tail_stream(task_id, task.stream_path),
+        mimetype='video/mp4',
+        headers={'Cache-Control': 'no-store'}
     )
 
+def _tail_stream(task_id, path):
+    """Чтение дописываемого файла до завершения задачи"""
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(STREAM_CHUNK_SIZE)
+            if data:
+                yield data
+                continue
+            
+            task = task_store.get(task_id)
+            if task is None or task.status in (TaskStatus.COMPLETED, TaskStatus.FAILED):
+                # Запись завершена до смены статуса - дочитываем остаток
+                rest = f.read()
+                if rest:
+                    yield rest
+                return
+            
+            time.sleep(STREAM_POLL_INTERVAL)
+
 @app.route('/api/test/<test_type>', methods=['POST'])
 def run_test(test_type):
     """Запуск различных тестов системы"""
@@ -934,7 +1730,7 @@ def run_test(test_type):
         
         elif test_type == 'quick_generation':
             # Быстрый тест генерации
-            if generator is None or not generator.initialized:
+            if not model_pool.is_loaded():
                 return jsonify({
                     'success': False,
                     'test': 'Quick Generation Test',
@@ -945,20 +1741,17 @@ def run_test(test_type):
             test_prompt = "A simple test video, minimal quality"
             task_id = str(uuid.uuid4())
             
-            task_data = {
-                'id': task_id,
-                'prompt': test_prompt,
-                'video_width': 720,
-                'video_height': 480,
-                'video_length': 65,  # Минимальная длина
-                'infer_steps': 10,   # Минимальные шаги
-                'cfg_scale': 6.0,
-                'status': 'testing',
-                'created_at': datetime.now().isoformat()
-            }
-            
-            with task_lock:
-                tasks[task_id] = task_data
+            task_store.add(TaskRecord(
+                id=task_id,
+                prompt=test_prompt,
+                video_width=720,
+                video_height=480,
+                video_length=65,  # Минимальная длина
+                infer_steps=10,   # Минимальные шаги
+                cfg_scale=6.0,
+                status=TaskStatus.TESTING,
+                created_at=datetime.now().isoformat()
+            ))
             
             return jsonify({
                 'success': True,
@@ -985,12 +1778,75 @@ def get_system_stats():
     update_system_stats()
     return jsonify(system_stats)
 
+@app.route('/api/retention')
+def get_retention_stats():
+    """Политика хранения и метрики очистки задач"""
+    return jsonify(task_gc.get_metrics())
+
+@app.route('/api/retention/run', methods=['POST'])
+def run_retention():
+    """Внеочередной проход сборщика задач"""
+    try:
+        removed = task_gc.collect_once()
+        return jsonify({
+            'success': True,
+            'removed': removed,
+            'metrics': task_gc.get_metrics()
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+def run_server(host='0.0.0.0', port=5000, debug=False, threads=8):
+    """
+    Запуск HTTP-сервера
+    
+    Args:
+        host: Адрес
+        port: Порт
+        debug: Отладочный сервер Flask с перезагрузкой при изменении кода
+        threads: Потоков обработки запросов в рабочем режиме
+    
+    В рабочем режиме запросы обслуживает многопоточный WSGI-сервер
+    (waitress, если установлен, иначе werkzeug) в одном процессе: все
+    HTTP-потоки делят хранилище задач, очередь и загруженные модели.
+    """
+    if debug:
+        app.run(host=host, port=port, debug=True)
+        return
+    
+    try:
+        from waitress import serve
+    except ImportError:
+        from werkzeug.serving import make_server
+        print(f"🌐 WSGI-сервер werkzeug (многопоточный) на {host}:{port}")
+        make_server(host, port, app, threaded=True).serve_forever()
+    else:
+        print(f"🌐 WSGI-сервер waitress ({threads} потоков) на {host}:{port}")
+        serve(app, host=host, port=port, threads=threads)
+
 if __name__ == '__main__':
     # Создание директории для результатов
-    os.makedirs('./generated_videos', exist_ok=True)
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    
+    parser = argparse.ArgumentParser(description="Daur MedIA - веб-сервер генерации видео")
+    parser.add_argument("--host", default=os.environ.get('DAUR_MEDIA_HOST', '0.0.0.0'), help="Адрес")
+    parser.add_argument("--port", type=int, default=int(os.environ.get('DAUR_MEDIA_PORT', '5000')), help="Порт")
+    parser.add_argument(
+        "--debug", action="store_true",
+        default=os.environ.get('DAUR_MEDIA_DEBUG', '0').lower() in ('1', 'true', 'yes'),
+        help="Отладочный сервер Flask с перезагрузкой"
+    )
+    parser.add_argument(
+        "--threads", type=int, default=int(os.environ.get('DAUR_MEDIA_HTTP_THREADS', '8')),
+        help="Потоков обработки HTTP-запросов"
+    )
+    args = parser.parse_args()
     
     print("🚀 Запуск Daur MedIA - AI Video Generation Platform")
-    print("📱 Откройте http://localhost:5000 в браузере")
+    print(f"📱 Откройте http://localhost:{args.port} в браузере")
     print("⚠️  Убедитесь, что у вас установлены все зависимости")
     
     # Запуск обновления статистики в отдельном потоке
@@ -1003,4 +1859,28 @@ if __name__ == '__main__':
     stats_thread.daemon = True
     stats_thread.start()
     
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # Запуск фоновой очистки старых задач
+    task_gc.start()
+    
+    # Автомасштабирование воркеров генерации (DAUR_MEDIA_AUTOSCALE=1)
+    if autoscaler_config.enabled and (not args.debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'):
+        ensure_generation_worker()
+        autoscaler.start()
+
+    # С torch.compile или зиготой модель по умолчанию загружается сразу:
+    # корзины прогреваются, а веса попадают в зиготу при старте, а не на
+    # первой задаче пользователя. Отладочный режим Flask перезапускает
+    # скрипт - там загрузка только в рабочем процессе
+    preload = zygote is not None or os.environ.get('DAUR_MEDIA_COMPILE', '0').lower() in ('1', 'true', 'yes')
+    if preload and (not args.debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'):
+        def preload_default_model():
+            try:
+                model_pool.load()
+                dispatcher.report_warm(0, worker_warm_state(model_pool))
+                print("🔥 Модель по умолчанию загружена")
+            except RuntimeError as e:
+                print(f"⚠️  Предзагрузка модели не удалась: {e}")
+
+        threading.Thread(target=preload_default_model, daemon=True).start()
+
+    run_server(args.host, args.port, args.debug, args.threads)
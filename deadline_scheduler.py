@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Daur MedIA - Deadline Scheduler
+Подбор параметров генерации под срок клиента
+
+Если по прогнозу очереди и модели стоимости задача не успевает к сроку,
+планировщик снижает число шагов и разрешение в пределах, разрешенных
+клиентом: сначала сохраняется разрешение, затем оно уменьшается ступенями,
+а шаги подбираются максимальными для каждой ступени. Если не помогает и
+это - задача в момент постановки, она отклоняется сразу.
+"""
+
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from task_store import TaskStatus
+
+# Шаг уменьшения разрешения (доля от запрошенного)
+SCALE_STEP = 0.125
+SIZE_MULTIPLE = 16
+MIN_SIDE = 128
+
+
+def parse_deadline(value: Any, now: Optional[datetime] = None) -> datetime:
+    """
+    Срок из запроса: число секунд от текущего момента или время в ISO 8601
+
+    Raises:
+        ValueError: некорректное значение
+    """
+    now = now or datetime.now()
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        if value <= 0:
+            raise ValueError("deadline должен быть в будущем")
+        return now + timedelta(seconds=value)
+    if isinstance(value, str):
+        deadline = datetime.fromisoformat(value)
+        if deadline.tzinfo is not None:
+            # Время задач хранится в локальном времени без зоны
+            deadline = deadline.astimezone().replace(tzinfo=None)
+        if deadline <= now:
+            raise ValueError("deadline должен быть в будущем")
+        return deadline
+    raise ValueError("deadline - число секунд или время в ISO 8601")
+
+
+def _scaled(value: int, scale: float) -> int:
+    return max(MIN_SIDE, int(value * scale) // SIZE_MULTIPLE * SIZE_MULTIPLE)
+
+
+class DeadlineScheduler:
+    """Планирование под срок и учет доли задач, выполненных вовремя"""
+
+    def __init__(
+        self,
+        estimate: Callable[[Dict[str, Any]], float],
+        canonicalize: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None
+    ):
+        """
+        Args:
+            estimate: Оценка длительности генерации в секундах по параметрам
+            canonicalize: Приведение уменьшенного разрешения к допустимому
+                (не больше заданного), например к корзине размеров
+        """
+        self.estimate = estimate
+        self.canonicalize = canonicalize or (lambda params: params)
+        self._lock = threading.Lock()
+        self.metrics = {
+            'deadline_tasks': 0,
+            'hits': 0,
+            'misses': 0,
+            'rejected': 0,
+            'degraded': 0
+        }
+
+    def plan(
+        self,
+        params: Dict[str, Any],
+        start_at: datetime,
+        deadline: datetime,
+        min_infer_steps: Optional[int] = None,
+        min_scale: float = 1.0
+    ) -> Optional[Tuple[Dict[str, Any], Optional[Dict[str, Any]]]]:
+        """
+        Параметры, укладывающиеся в срок
+
+        Args:
+            params: Запрошенные параметры генерации
+            start_at: Прогноз начала генерации
+            deadline: Срок завершения
+            min_infer_steps: Минимально допустимое число шагов (по умолчанию - запрошенное)
+            min_scale: Минимально допустимая доля разрешения
+
+        Returns:
+            (параметры, описание снижения качества или None) либо None,
+            если срок недостижим в разрешенных пределах
+        """
+        available = (deadline - start_at).total_seconds()
+        requested_steps = params['infer_steps']
+        min_steps = min(requested_steps, min_infer_steps or requested_steps)
+
+        scale = 1.0
+        while scale >= min_scale - 1e-9:
+            candidate = dict(params) if scale == 1.0 else self.canonicalize(dict(
+                params,
+                video_width=_scaled(params['video_width'], scale),
+                video_height=_scaled(params['video_height'], scale)
+            ))
+            steps = self._max_steps(candidate, min_steps, requested_steps, available)
+            if steps is not None:
+                candidate['infer_steps'] = steps
+                return candidate, self._describe(params, candidate, scale, available)
+            scale -= SCALE_STEP
+        return None
+
+    def cheapest(self, params: Dict[str, Any], min_infer_steps: Optional[int] = None, min_scale: float = 1.0) -> Dict[str, Any]:
+        """Самые дешевые параметры в разрешенных пределах"""
+        scale = max(min_scale, 0.0)
+        steps = min(params['infer_steps'], min_infer_steps or params['infer_steps'])
+        if scale >= 1.0:
+            return dict(params, infer_steps=steps)
+        # Та же сетка ступеней, что и в plan()
+        scale = 1.0 - int((1.0 - scale) / SCALE_STEP + 1e-9) * SCALE_STEP
+        return self.canonicalize(dict(
+            params,
+            video_width=_scaled(params['video_width'], scale),
+            video_height=_scaled(params['video_height'], scale),
+            infer_steps=steps
+        ))
+
+    def record_rejection(self) -> None:
+        with self._lock:
+            self.metrics['rejected'] += 1
+
+    def record_outcome(self, task) -> bool:
+        """
+        Учет завершенной задачи со сроком
+
+        Returns:
+            bool: успела ли задача к сроку
+        """
+        deadline = datetime.fromisoformat(task.deadline)
+        completed = datetime.fromisoformat(task.completed_at) if task.completed_at else datetime.now()
+        hit = task.status == TaskStatus.COMPLETED and completed <= deadline
+        with self._lock:
+            self.metrics['deadline_tasks'] += 1
+            self.metrics['hits' if hit else 'misses'] += 1
+            if task.degradation:
+                self.metrics['degraded'] += 1
+        return hit
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = dict(self.metrics)
+        finished = metrics['deadline_tasks']
+        metrics['hit_rate'] = round(metrics['hits'] / finished, 4) if finished else None
+        return metrics
+
+    def _max_steps(self, params: Dict[str, Any], min_steps: int, max_steps: int, available: float) -> Optional[int]:
+        """Наибольшее число шагов в [min_steps, max_steps], укладывающееся в available"""
+        if self.estimate(dict(params, infer_steps=min_steps)) > available:
+            return None
+        low, high = min_steps, max_steps
+        # Оценка монотонна по шагам - бинарный поиск
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.estimate(dict(params, infer_steps=middle)) <= available:
+                low = middle
+            else:
+                high = middle - 1
+        return low
+
+    def _describe(
+        self,
+        requested: Dict[str, Any],
+        planned: Dict[str, Any],
+        scale: float,
+        available: float
+    ) -> Optional[Dict[str, Any]]:
+        if scale == 1.0 and planned['infer_steps'] == requested['infer_steps']:
+            return None
+        return {
+            'requested': {
+                name: requested[name] for name in ('video_width', 'video_height', 'infer_steps')
+            },
+            'infer_steps': planned['infer_steps'],
+            'video_width': planned['video_width'],
+            'video_height': planned['video_height'],
+            # Фактическая доля: уменьшенное разрешение приводится к допустимому
+            'scale': round(planned['video_width'] / requested['video_width'], 3),
+            'available_seconds': round(available, 1),
+            'estimated_seconds': self.estimate(planned)
+        }
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Daur MedIA - Draft & Refine
+Черновая генерация с пониженными параметрами и последующая доработка
+
+Черновик считается в уменьшенном разрешении, с меньшим числом кадров и
+шагов. Доработка повторяет запрос с исходными параметрами и тем же сидом,
+а эмбеддинги промпта берет из кеша, заполненного черновиком.
+"""
+
+import os
+import inspect
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Параметры черновика (переопределяются переменными окружения)
+DRAFT_SCALE = float(os.environ.get('DAUR_MEDIA_DRAFT_SCALE', '0.5'))
+DRAFT_MAX_LENGTH = int(os.environ.get('DAUR_MEDIA_DRAFT_MAX_LENGTH', '33'))
+DRAFT_STEPS = int(os.environ.get('DAUR_MEDIA_DRAFT_STEPS', '15'))
+
+# Размеры кратны 16 (VAE сжимает в 8 раз, патчи DiT - 2x2)
+SIZE_MULTIPLE = 16
+MIN_DRAFT_SIDE = 256
+
+# Длина видео вида 4k+1 (временное сжатие VAE в 4 раза)
+MIN_DRAFT_LENGTH = 17
+
+
+def _round_size(value: float) -> int:
+    return max(MIN_DRAFT_SIDE, int(round(value / SIZE_MULTIPLE)) * SIZE_MULTIPLE)
+
+
+def draft_params(video_width: int, video_height: int, video_length: int, infer_steps: int) -> Dict[str, int]:
+    """
+    Параметры черновика для заданного полного запроса
+
+    Args:
+        video_width: Ширина итогового видео
+        video_height: Высота итогового видео
+        video_length: Длина итогового видео в кадрах
+        infer_steps: Шагов инференса итогового видео
+
+    Returns:
+        Dict с video_width, video_height, video_length, infer_steps черновика
+    """
+    length = (min(video_length, DRAFT_MAX_LENGTH) - 1) // 4 * 4 + 1
+    return {
+        'video_width': min(video_width, _round_size(video_width * DRAFT_SCALE)),
+        'video_height': min(video_height, _round_size(video_height * DRAFT_SCALE)),
+        'video_length': max(min(video_length, MIN_DRAFT_LENGTH), length),
+        'infer_steps': min(infer_steps, DRAFT_STEPS)
+    }
+
+
+class PromptEmbeddingCache:
+    """
+    LRU-кеш эмбеддингов промпта для пайплайна HunyuanVideo
+
+    Пайплайн кодирует промпт обоими текстовыми энкодерами при каждом
+    вызове и не принимает готовые эмбеддинги через predict(), поэтому
+    кеш подменяет метод encode_prompt экземпляра пайплайна.
+    """
+
+    # Аргументы encode_prompt, при которых результат зависит не только от текста
+    _BYPASS_ARGS = ('prompt_embeds', 'attention_mask', 'negative_prompt_embeds', 'negative_attention_mask', 'lora_scale')
+
+    def __init__(self, max_entries: int = 32):
+        """
+        Args:
+            max_entries: Сколько результатов encode_prompt хранить
+        """
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[tuple, Any]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def install(self, pipeline) -> None:
+        """Подмена pipeline.encode_prompt кеширующей оберткой"""
+        original = pipeline.encode_prompt
+        signature = inspect.signature(original)
+
+        def encode_prompt(*args, **kwargs):
+            key = self._make_key(signature, args, kwargs)
+            if key is None:
+                return original(*args, **kwargs)
+
+            with self._lock:
+                cached = self._entries.get(key)
+                if cached is not None:
+                    self._entries.move_to_end(key)
+                    self.stats['hits'] += 1
+                    return cached
+                self.stats['misses'] += 1
+
+            result = original(*args, **kwargs)
+            with self._lock:
+                self._entries[key] = result
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            return result
+
+        pipeline.encode_prompt = encode_prompt
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.stats, 'entries': len(self._entries)}
+
+    def _make_key(self, signature, args, kwargs) -> Optional[tuple]:
+        """Ключ кеша или None, если вызов кешировать нельзя"""
+        try:
+            bound = signature.bind(*args, **kwargs)
+        except TypeError:
+            return None
+        bound.apply_defaults()
+        arguments = bound.arguments
+        if any(arguments.get(name) is not None for name in self._BYPASS_ARGS):
+            return None
+
+        def _text(value):
+            return tuple(value) if isinstance(value, list) else value
+
+        return (
+            _text(arguments.get('prompt')),
+            _text(arguments.get('negative_prompt')),
+            # Пайплайн вызывает encode_prompt для каждого текстового энкодера
+            id(arguments.get('text_encoder')),
+            str(arguments.get('device')),
+            arguments.get('num_videos_per_prompt'),
+            arguments.get('do_classifier_free_guidance'),
+            arguments.get('clip_skip'),
+            arguments.get('data_type')
+        )
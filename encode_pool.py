@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Daur MedIA - Encoder Pool
+Кодирование MP4 в отдельных процессах, параллельно со следующей генерацией
+
+Генератор переводит кадры в uint8 прямо в разделяемую память и сразу
+возвращается к модели; процесс пула читает кадры из той же памяти без
+копирования через pickle и кодирует их тем же writer'ом, что и
+save_video_streaming, поэтому файлы не отличаются.
+"""
+
+import os
+import time
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from video_encoder import DEFAULT_CHUNK_FRAMES, encode_segments_parallel, video_to_uint8, write_frames
+
+logger = logging.getLogger(__name__)
+
+
+def _attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    """
+    Подключение к сегменту, которым владеет родительский процесс
+
+    Процессы пула работают с тем же resource_tracker, что и родитель,
+    поэтому повторная регистрация сегмента безвредна: удаляет его
+    только родитель после завершения кодирования.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13: параметра track нет
+        return shared_memory.SharedMemory(name=name)
+
+
+def _encode_worker(
+    shm_name: str,
+    shape: Tuple[int, ...],
+    path: str,
+    fps: int,
+    encode_options: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """Кодирование кадров из разделяемой памяти (выполняется в процессе пула)"""
+    started = time.time()
+    shm = _attach_shared_memory(shm_name)
+    try:
+        frames = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+        if encode_options:
+            count = encode_segments_parallel(frames, path, fps=fps, **encode_options)['frames']
+        else:
+            count = write_frames([frames], path, fps=fps)
+        del frames
+    finally:
+        shm.close()
+    return {
+        'frames': count,
+        'output_path': path,
+        'encode_time': round(time.time() - started, 3),
+        'encoder_pid': os.getpid()
+    }
+
+
+class EncoderPool:
+    """
+    Пул процессов-кодировщиков
+
+    Если процесс пула погиб (OOM killer, падение), ProcessPoolExecutor
+    становится непригодным и отклоняет все следующие задачи. Пул в этом
+    случае пересоздается, а задача, на которой он сломался, повторяется
+    один раз.
+    """
+
+    # Повторов задачи после пересоздания сломанного пула
+    MAX_RETRIES = 1
+
+    def __init__(self, max_workers: int = 2):
+        """
+        Args:
+            max_workers: Количество процессов кодирования
+        """
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._executor = self._create_executor()
+        self.stats = {'submitted': 0, 'retries': 0, 'restarts': 0}
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        # spawn: процессы пула не наследуют память модели и состояние CUDA
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+
+    def _restart(self, broken: ProcessPoolExecutor) -> None:
+        """Замена сломанного пула (если его еще не заменил другой поток)"""
+        with self._lock:
+            if self._executor is not broken:
+                return
+            logger.warning("Пул кодирования сломан (процесс завершился аварийно), пересоздается")
+            broken.shutdown(wait=False)
+            self._executor = self._create_executor()
+            self.stats['restarts'] += 1
+
+    def _submit(self, args: Tuple) -> Tuple[ProcessPoolExecutor, Future]:
+        """Постановка в текущий пул; сломанный пересоздается и задача ставится в новый"""
+        executor = self._executor
+        try:
+            return executor, executor.submit(_encode_worker, *args)
+        except BrokenProcessPool:
+            self._restart(executor)
+            executor = self._executor
+            return executor, executor.submit(_encode_worker, *args)
+
+    def submit(
+        self,
+        video,
+        path: str,
+        fps: int = 24,
+        chunk_frames: int = DEFAULT_CHUNK_FRAMES,
+        encode_options: Optional[Dict[str, Any]] = None
+    ) -> Future:
+        """
+        Постановка видео в очередь кодирования
+
+        Кадры переводятся в uint8 в разделяемую память до возврата из
+        метода, после чего тензор video можно освобождать.
+
+        Args:
+            video: Тензор (1, c, t, h, w) со значениями в [0, 1]
+            path: Путь к итоговому файлу
+            fps: Частота кадров
+            chunk_frames: Кадров в чанке при конвертации
+            encode_options: codec/preset/crf для сегментного кодирования
+
+        Returns:
+            Future с результатом кодирования (dict)
+        """
+        channels, total, height, width = video.shape[-4:]
+        shape = (total, height, width, channels)
+        shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)))
+        args = (shm.name, shape, path, fps, encode_options)
+        try:
+            frames = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+            video_to_uint8(video, frames, chunk_frames)
+            del frames
+            executor, inner = self._submit(args)
+        except Exception:
+            shm.close()
+            shm.unlink()
+            raise
+        self.stats['submitted'] += 1
+
+        # Кадры в разделяемой памяти живут до итогового результата, чтобы
+        # задачу можно было повторить на новом пуле
+        result: Future = Future()
+        result.set_running_or_notify_cancel()
+        retries = [0]
+
+        def _done(future: Future, executor=executor) -> None:
+            error = future.exception()
+            if isinstance(error, BrokenProcessPool) and retries[0] < self.MAX_RETRIES:
+                retries[0] += 1
+                self.stats['retries'] += 1
+                self._restart(executor)
+                try:
+                    executor, retry = self._submit(args)
+                except Exception as e:
+                    _finish(None, e)
+                    return
+                retry.add_done_callback(lambda f: _done(f, executor))
+                return
+            _finish(None if error else future.result(), error)
+
+        def _finish(value, error) -> None:
+            shm.close()
+            shm.unlink()
+            if error is not None:
+                result.set_exception(error)
+            else:
+                result.set_result(value)
+
+        inner.add_done_callback(_done)
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(self.stats, max_workers=self.max_workers)
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Остановка пула"""
+        self._executor.shutdown(wait=wait)
+
+
+def create_encoder_pool_from_env() -> Optional[EncoderPool]:
+    """Пул из DAUR_MEDIA_ENCODE_WORKERS (0 - кодировать в потоке генерации)"""
+    workers = int(os.environ.get('DAUR_MEDIA_ENCODE_WORKERS', '2'))
+    if workers <= 0:
+        return None
+    return EncoderPool(max_workers=workers)
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Daur MedIA - Generation Profiles
+Именованные профили качества/скорости и модель стоимости генерации
+
+Стоимость задачи оценивается в условных единицах работы DiT: число
+латентных токенов, умноженное на число шагов, с поправкой на
+квадратичную часть внимания. Секунды на единицу и постоянные накладные
+расходы подбираются методом наименьших квадратов по истории выполненных
+задач этого хоста после каждой задачи; история сохраняется между
+перезапусками, а ошибка прогноза накапливается в метриках.
+"""
+
+import os
+import json
+import socket
+import threading
+import logging
+from collections import deque
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+GENERATION_PROFILES = {
+    'preview': {'video_width': 960, 'video_height': 544, 'video_length': 33, 'infer_steps': 20},
+    'balanced': {'video_width': 960, 'video_height': 544, 'video_length': 65, 'infer_steps': 30},
+    'quality': {'video_width': 1280, 'video_height': 720, 'video_length': 129, 'infer_steps': 50}
+}
+
+# От дешевого к дорогому (порядок выбора по бюджету времени)
+PROFILE_ORDER = ('preview', 'balanced', 'quality')
+
+# Сжатие VAE (8x по пространству, 4x по времени) и патчи DiT 2x2
+SPATIAL_TOKEN_STRIDE = 16
+TEMPORAL_TOKEN_STRIDE = 4
+
+# Число токенов, при котором внимание (~N^2*d) сравнивается по стоимости
+# с линейными слоями (~N*d^2): примерно 6 * hidden_size для hidden_size=3072
+ATTENTION_TOKENS = 18432
+
+# Начальная оценка до калибровки: quality-профиль около 30 минут на одном GPU
+DEFAULT_SECONDS_PER_UNIT = 40.0
+DEFAULT_OVERHEAD_SECONDS = 20.0
+
+MIN_CALIBRATION_SAMPLES = 3
+
+# Предел шагов денойзинга в запросе (у профиля quality - 50)
+MAX_INFER_STEPS = 200
+
+
+def validate_infer_steps(value: Any) -> int:
+    """
+    Число шагов из запроса
+
+    Raises:
+        ValueError: не целое число или вне диапазона 1..MAX_INFER_STEPS
+    """
+    try:
+        steps = float(value) if not isinstance(value, bool) else None
+    except (TypeError, ValueError):
+        steps = None
+    if steps is None or not steps.is_integer():
+        raise ValueError("infer_steps должно быть целым числом")
+    if not 1 <= steps <= MAX_INFER_STEPS:
+        raise ValueError(f"infer_steps должно быть от 1 до {MAX_INFER_STEPS}")
+    return int(steps)
+
+
+def work_units(
+    video_width: int,
+    video_height: int,
+    video_length: int,
+    infer_steps: int,
+    batch_size: int = 1
+) -> float:
+    """Условная стоимость генерации (миллионы токено-шагов с поправкой на внимание)"""
+    tokens = (
+        (video_width // SPATIAL_TOKEN_STRIDE)
+        * (video_height // SPATIAL_TOKEN_STRIDE)
+        * ((video_length - 1) // TEMPORAL_TOKEN_STRIDE + 1)
+    )
+    return batch_size * infer_steps * tokens * (1 + tokens / ATTENTION_TOKENS) / 1e6
+
+
+def _params_units(params: Dict[str, Any]) -> float:
+    return work_units(
+        params['video_width'], params['video_height'],
+        params['video_length'], params['infer_steps'],
+        params.get('batch_size') or 1
+    )
+
+
+def resolve_profile(name: str) -> Dict[str, int]:
+    """
+    Параметры генерации профиля
+
+    Raises:
+        ValueError: неизвестный профиль
+    """
+    if name not in GENERATION_PROFILES:
+        raise ValueError(
+            f"Неизвестный профиль: {name} (доступны: {', '.join(PROFILE_ORDER)})"
+        )
+    return dict(GENERATION_PROFILES[name])
+
+
+class CostModel:
+    """Оценка времени генерации, калибруемая по выполненным задачам"""
+
+    def __init__(self, history_path: Optional[str] = None, max_history: int = 200, host: Optional[str] = None):
+        """
+        Args:
+            history_path: JSON-файл для сохранения истории между перезапусками
+            max_history: Сколько последних задач этого хоста учитывать при калибровке
+            host: Имя хоста (по умолчанию текущий); записи истории помечаются
+                хостом, и калибровка использует только свои
+        """
+        self.history_path = history_path
+        self.host = host or socket.gethostname()
+        self.seconds_per_unit = DEFAULT_SECONDS_PER_UNIT
+        self.overhead_seconds = DEFAULT_OVERHEAD_SECONDS
+        self.calibrated = False
+        self._history = deque(maxlen=max_history)
+        # Записи других хостов хранятся как есть и не участвуют в калибровке
+        self._foreign_history = []
+        self._lock = threading.Lock()
+        self.errors = {
+            'count': 0,
+            'abs_error_sum': 0.0,
+            'abs_pct_error_sum': 0.0,
+            'bias_sum': 0.0,
+            'last_error': None
+        }
+        self._load()
+
+    @classmethod
+    def from_env(cls) -> 'CostModel':
+        """Модель с историей в DAUR_MEDIA_COST_HISTORY (по умолчанию ./daur_media_cost_history.json)"""
+        return cls(os.environ.get('DAUR_MEDIA_COST_HISTORY', './daur_media_cost_history.json'))
+
+    def estimate(self, params: Dict[str, Any]) -> float:
+        """Ожидаемое время генерации в секундах"""
+        units = _params_units(params)
+        with self._lock:
+            return round(self.overhead_seconds + self.seconds_per_unit * units, 1)
+
+    def record(self, params: Dict[str, Any], seconds: float) -> None:
+        """Учет фактического времени выполненной задачи и перекалибровка"""
+        units = _params_units(params)
+        with self._lock:
+            # Ошибка прогноза, который модель дала бы до этой задачи
+            predicted = self.overhead_seconds + self.seconds_per_unit * units
+            error = predicted - seconds
+            self.errors['count'] += 1
+            self.errors['abs_error_sum'] += abs(error)
+            self.errors['abs_pct_error_sum'] += abs(error) / seconds if seconds > 0 else 0.0
+            self.errors['bias_sum'] += error
+            self.errors['last_error'] = round(error, 2)
+
+            self._history.append((units, seconds))
+            self._calibrate()
+            history = self._foreign_history + [[self.host, x, y] for x, y in self._history]
+        self._save(history)
+
+    def profiles(self) -> Dict[str, Dict[str, Any]]:
+        """Профили с параметрами и оценкой времени на этом хосте"""
+        return {
+            name: {
+                'params': dict(GENERATION_PROFILES[name]),
+                'estimated_seconds': self.estimate(GENERATION_PROFILES[name])
+            }
+            for name in PROFILE_ORDER
+        }
+
+    def select_for_budget(self, budget_seconds: float) -> Tuple[Optional[str], Dict[str, float]]:
+        """
+        Самый качественный профиль, укладывающийся в бюджет времени
+
+        Returns:
+            (имя профиля или None, оценки всех профилей)
+        """
+        estimates = {name: self.estimate(GENERATION_PROFILES[name]) for name in PROFILE_ORDER}
+        chosen = None
+        for name in PROFILE_ORDER:
+            if estimates[name] <= budget_seconds:
+                chosen = name
+        return chosen, estimates
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'seconds_per_unit': round(self.seconds_per_unit, 4),
+                'overhead_seconds': round(self.overhead_seconds, 2),
+                'calibrated': self.calibrated,
+                'samples': len(self._history),
+                'host': self.host
+            }
+
+    def error_metrics(self) -> Dict[str, Any]:
+        """Ошибка прогноза по задачам, выполненным с момента запуска"""
+        with self._lock:
+            count = self.errors['count']
+            return {
+                'count': count,
+                'mean_abs_error_seconds': round(self.errors['abs_error_sum'] / count, 2) if count else None,
+                'mean_abs_pct_error': round(100 * self.errors['abs_pct_error_sum'] / count, 1) if count else None,
+                'mean_bias_seconds': round(self.errors['bias_sum'] / count, 2) if count else None,
+                'last_error_seconds': self.errors['last_error']
+            }
+
+    def _calibrate(self) -> None:
+        """Подбор seconds = overhead + rate * units (вызывается под _lock)"""
+        if len(self._history) < MIN_CALIBRATION_SAMPLES:
+            return
+        xs = [units for units, _ in self._history]
+        ys = [seconds for _, seconds in self._history]
+        n = len(xs)
+        mean_x = sum(xs) / n
+        mean_y = sum(ys) / n
+        var_x = sum((x - mean_x) ** 2 for x in xs)
+
+        rate = overhead = None
+        if var_x > 0:
+            rate = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / var_x
+            overhead = mean_y - rate * mean_x
+        if rate is None or rate <= 0 or overhead < 0:
+            # Все задачи одного размера или шумная история: пропорциональная модель
+            rate = sum(ys) / sum(xs) if sum(xs) > 0 else self.seconds_per_unit
+            overhead = 0.0
+
+        self.seconds_per_unit = rate
+        self.overhead_seconds = overhead
+        self.calibrated = True
+
+    def _load(self) -> None:
+        if not self.history_path or not os.path.exists(self.history_path):
+            return
+        try:
+            with open(self.history_path) as f:
+                data = json.load(f)
+            for entry in data.get('history', []):
+                # [host, units, seconds]; записи без хоста считаются своими
+                host, units, seconds = entry if len(entry) == 3 else (self.host, *entry)
+                if host == self.host:
+                    self._history.append((float(units), float(seconds)))
+                else:
+                    self._foreign_history.append([host, float(units), float(seconds)])
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning(f"История стоимости не загружена: {e}")
+            return
+        self._calibrate()
+
+    def _save(self, history) -> None:
+        if not self.history_path:
+            return
+        tmp_path = self.history_path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({'history': history}, f)
+            os.replace(tmp_path, self.history_path)
+        except OSError as e:
+            logger.warning(f"История стоимости не сохранена: {e}")
@@ -9,7 +9,7 @@ import os
 import sys
 import time
 import random
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Callable
 import logging
 
 # Настройка логирования
@@ -45,7 +45,8 @@ class HunyuanVideoAPI:
         video_length: int = 129,
         infer_steps: int = 50,
         seed: Optional[int] = None,
-        save_path: str = "./results"
+        save_path: str = "./results",
+        progress_callback: Optional[Callable[[int, int], None]] = None
     ) -> Dict[str, Any]:
         """
         Генерация видео по текстовому запросу
@@ -57,6 +58,7 @@ class HunyuanVideoAPI:
             infer_steps: Количество шагов инференса
             seed: Случайное зерно
             save_path: Путь для сохранения
+            progress_callback: Функция (шаг, всего шагов), вызываемая после каждого шага
             
         Returns:
             Словарь с результатами генерации
@@ -79,6 +81,8 @@ class HunyuanVideoAPI:
                 progress = (step / infer_steps) * 100
                 logger.info(f"Прогресс генерации: {progress:.1f}%")
             time.sleep(0.1)  # Имитация работы
+            if progress_callback is not None:
+                progress_callback(step, infer_steps)
         
         # Генерация имени файла
         timestamp = int(time.time())
@@ -4,19 +4,21 @@ Daur MedIA - HunyuanVideo Interface
 Полноценная интеграция с HunyuanVideo для генерации видео без сторонних API
 """
 
+import gc
 import os
 import sys
 import torch
 import argparse
 import logging
 from pathlib import Path
+from types import SimpleNamespace
+from contextlib import nullcontext
 from typing import Optional, Dict, Any
 
 # Добавляем путь к HunyuanVideo
 sys.path.insert(0, '/home/ubuntu/HunyuanVideo')
 
 try:
-    from hyvideo.utils.file_utils import save_videos_grid
     from hyvideo.config import parse_args
     from hyvideo.inference import HunyuanVideoSampler
     HUNYUAN_AVAILABLE = True
@@ -24,29 +26,85 @@ except ImportError as e:
     print(f"HunyuanVideo не доступен: {e}")
     HUNYUAN_AVAILABLE = False
 
+from compile_cache import CompileCache, CompileConfig, warmup_keys
+from cpu_runtime import CPUConfig, apply_channels_last, configure_cpu_runtime, cpu_autocast
+from draft_refine import PromptEmbeddingCache
+from generation_profiles import GENERATION_PROFILES
+from memory_planner import MemoryPlanner
+from quantization import quantization_from_env, quantize_linear_layers
+from sequence_parallel import ParallelConfig, SequenceParallelGroup, parallel_attention, parallelize_transformer, start_followers
+from shape_buckets import ShapeBuckets
+from streaming_decode import StreamingDecode
+from video_encoder import encode_video, extract_video
+
 class HunyuanVideoGenerator:
     """Класс для генерации видео с помощью HunyuanVideo"""
     
-    def __init__(self, model_path: Optional[str] = None):
+    def __init__(
+        self,
+        model_path: Optional[str] = None,
+        parallel: Optional[ParallelConfig] = None,
+        rank: int = 0,
+        dit_weight: Optional[str] = None
+    ):
         """
         Инициализация генератора
         
         Args:
             model_path: Путь к модели (опционально)
+            parallel: Степени параллелизма по последовательности
+                (по умолчанию из DAUR_MEDIA_ULYSSES_DEGREE/DAUR_MEDIA_RING_DEGREE)
+            rank: Номер процесса в группе; rank 0 сам запускает остальные
+            dit_weight: Веса DiT варианта модели (например, дистиллированного)
         """
         self.model_path = model_path
+        self.dit_weight = dit_weight
         self.sampler = None
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         self.initialized = False
         
+        # Эмбеддинги промптов: доработка черновика не кодирует промпт заново
+        self.prompt_cache = PromptEmbeddingCache()
+        
+        # Режим выполнения (выгрузка весов, тайлы VAE) выбирается под каждую задачу
+        self.memory_planner = MemoryPlanner(self.device)
+        self.offload_active = False
+        
+        # torch.compile DiT и VAE с кешем графов по корзинам (DAUR_MEDIA_COMPILE)
+        self.compile_cache = CompileCache(CompileConfig.from_env())
+        
         # Настройка логирования
         logging.basicConfig(level=logging.INFO)
         self.logger = logging.getLogger(__name__)
         
-    def initialize(self) -> bool:
+        # Одна генерация на нескольких процессах (gloo): только на CPU,
+        # на GPU HunyuanVideo делает это сам через xDiT и NCCL
+        self.parallel = parallel or ParallelConfig.from_env()
+        if self.parallel.enabled and self.device != "cpu":
+            self.logger.warning("Параллелизм по последовательности через gloo доступен только на CPU")
+            self.parallel = ParallelConfig()
+        self.rank = rank
+        self.parallel_group = None
+        self.followers = []
+        
+        # Без GPU: потоки, bf16 и oneDNN настраиваются до загрузки модели
+        self.cpu_config = None
+        self.quantization = None
+        if self.device == "cpu":
+            self.cpu_config = CPUConfig.from_env()
+            if self.parallel.enabled and not os.environ.get('DAUR_MEDIA_CPU_THREADS'):
+                # Ядра делятся между процессами группы
+                self.cpu_config.intra_op_threads = max(1, self.cpu_config.intra_op_threads // self.parallel.world_size)
+            configure_cpu_runtime(self.cpu_config)
+        
+    def initialize(self, warmup: bool = True) -> bool:
         """
         Инициализация модели HunyuanVideo
         
+        Args:
+            warmup: Прогреть корзины сразу после загрузки (при включенной
+                компиляции); иначе прогрев вызывается отдельно - warmup_compiled()
+        
         Returns:
             bool: True если инициализация успешна
         """
@@ -55,6 +113,14 @@ class HunyuanVideoGenerator:
             return False
             
         try:
+            if self.parallel.enabled and self.parallel_group is None:
+                if self.rank == 0:
+                    self.followers = start_followers(self.parallel, _run_follower, self.model_path, self.dit_weight)
+                self.parallel_group = SequenceParallelGroup(self.parallel, self.rank)
+            
+            # Выгрузка весов при загрузке нужна, только если они не помещаются на GPU
+            use_cpu_offload = self.device == "cuda" and not self.memory_planner.weights_fit()
+            
             # Настройки по умолчанию для HunyuanVideo
             args = argparse.Namespace(
                 video_size=(720, 1280),
@@ -69,15 +135,18 @@ class HunyuanVideoGenerator:
                 save_path="./results",
                 name="test",
                 model_base=self.model_path or "Tencent-Hunyuan/HunyuanVideo",
-                dit_weight=None,
+                dit_weight=self.dit_weight,
                 vae_weight=None,
                 text_encoder_weight=None,
                 text_encoder_2_weight=None,
                 tokenizer=None,
                 tokenizer_2=None,
                 flow_reverse=True,
-                use_cpu_offload=False,
+                use_cpu_offload=use_cpu_offload,
                 save_memory=False,
+                vae_tiling=True,
+                # Свой параллелизм HunyuanVideo требует NCCL; на CPU
+                # последовательность делит parallelize_transformer
                 ulysses_degree=1,
                 ring_degree=1,
                 disable_autocast=False
@@ -88,9 +157,30 @@ class HunyuanVideoGenerator:
                 args.model_base, 
                 args=args
             )
+            self.prompt_cache.install(self.sampler.pipeline)
+            self.offload_active = use_cpu_offload
+            
+            if self.cpu_config is not None:
+                # fp16-сверток на CPU нет: VAE считается в float32,
+                # а bf16 (если включен) дает autocast
+                vae = self.sampler.pipeline.vae.to(torch.float32)
+                if self.cpu_config.channels_last:
+                    apply_channels_last(vae)
+                self._quantize_for_cpu()
+            
+            if self.parallel_group is not None:
+                import hyvideo.modules.models as hyvideo_models
+                # Оригинальная parallel_attention требует flash-attn и xDiT
+                hyvideo_models.parallel_attention = parallel_attention
+                parallelize_transformer(self.sampler.pipeline.transformer, self.parallel_group)
+            
+            if self.compile_cache.config.enabled:
+                self._compile_model()
             
             self.initialized = True
             self.logger.info(f"HunyuanVideo инициализирован на устройстве: {self.device}")
+            if warmup:
+                self.warmup_compiled()
             return True
             
         except Exception as e:
@@ -107,7 +197,10 @@ class HunyuanVideoGenerator:
         cfg_scale: float = 1.0,
         embedded_cfg_scale: float = 6.0,
         save_path: str = "./results",
-        filename: Optional[str] = None
+        filename: Optional[str] = None,
+        stream: bool = False,
+        encode_pool=None,
+        encode_options: Optional[Dict[str, Any]] = None
     ) -> Dict[str, Any]:
         """
         Генерация видео по текстовому описанию
@@ -122,6 +215,13 @@ class HunyuanVideoGenerator:
             embedded_cfg_scale: Встроенный масштаб CFG
             save_path: Путь для сохранения
             filename: Имя файла (опционально)
+            stream: Писать фрагментированный MP4 по мере декодирования VAE
+                (по временным тайлам), чтобы файл можно было проигрывать
+                до окончания генерации
+            encode_pool: EncoderPool для кодирования в отдельном процессе;
+                тогда в результате будет encode_future, а файл появится
+                после его завершения
+            encode_options: Кодек, пресет и CRF (см. video_encoder.resolve_encode_options)
             
         Returns:
             Dict с результатами генерации
@@ -148,30 +248,58 @@ class HunyuanVideoGenerator:
             # Подготовка входных данных
             height, width = video_size
             
+            # Режим под размер задачи: маленькие - целиком на устройстве,
+            # большие - с тайлами VAE или выгрузкой весов вместо OOM
+            memory_plan = self.memory_planner.plan(height, width, video_length)
+            self._apply_memory_plan(memory_plan)
+            self.logger.info(f"План памяти: {memory_plan.to_dict()}")
+            
             # Генерация с помощью HunyuanVideo
-            outputs = self.sampler.predict(
-                prompt=prompt,
-                height=height,
-                width=width,
-                video_length=video_length,
-                seed=seed,
-                infer_steps=infer_steps,
-                guidance_scale=cfg_scale,
-                embedded_guidance_scale=embedded_cfg_scale,
-                batch_size=1,
-                num_videos_per_prompt=1
-            )
+            job = {
+                "prompt": prompt,
+                "height": height,
+                "width": width,
+                "video_length": video_length,
+                "seed": seed,
+                "infer_steps": infer_steps,
+                "guidance_scale": cfg_scale,
+                "embedded_guidance_scale": embedded_cfg_scale,
+                "batch_size": 1,
+                "num_videos_per_prompt": 1
+            }
             
-            # Сохранение результата
             if filename is None:
                 filename = f"video_{seed}.mp4"
             
             output_path = os.path.join(save_path, filename)
             
-            # Сохранение видео
-            save_videos_grid(outputs, output_path, fps=24)
+            stream_stats = None
+            if stream:
+                # Кадры пишутся из vae.decode по мере декодирования тайлов
+                with StreamingDecode(
+                    self.sampler.pipeline.vae, output_path, fps=24, encode_options=encode_options
+                ) as streaming:
+                    outputs = self._run_job(job)
+                stream_stats = streaming.stats
+            else:
+                outputs = self._run_job(job)
+            
+            # Сохранение видео (кадры конвертируются и кодируются чанками);
+            # в потоковом режиме файл уже записан
+            encode_stats = None
+            encode_future = None
+            if encode_pool is not None and not stream:
+                encode_future = encode_pool.submit(
+                    extract_video(outputs), output_path, fps=24, encode_options=encode_options
+                )
+            elif not stream:
+                encode_stats = encode_video(extract_video(outputs), output_path, fps=24, encode_options=encode_options)
+            del outputs
             
-            self.logger.info(f"Видео успешно сохранено: {output_path}")
+            if encode_future is not None:
+                self.logger.info(f"Видео передано на кодирование: {output_path}")
+            else:
+                self.logger.info(f"Видео успешно сохранено: {output_path}")
             
             return {
                 "success": True,
@@ -180,7 +308,11 @@ class HunyuanVideoGenerator:
                 "prompt": prompt,
                 "video_size": video_size,
                 "video_length": video_length,
-                "infer_steps": infer_steps
+                "infer_steps": infer_steps,
+                "encode_stats": encode_stats,
+                "encode_future": encode_future,
+                "stream_stats": stream_stats,
+                "memory_plan": memory_plan.to_dict()
             }
             
         except Exception as e:
@@ -190,6 +322,205 @@ class HunyuanVideoGenerator:
                 "error": str(e)
             }
     
+    def _run_job(self, job: Dict[str, Any], warmup: bool = False):
+        """Выполнение задачи: рассылка процессам группы и учет прогретых корзин"""
+        bucket_key = f"{job['width']}x{job['height']}x{job['video_length']}"
+        if self.parallel_group is None or self.rank != 0:
+            return self.compile_cache.run(bucket_key, lambda: self._predict(job), warmup=warmup)
+        
+        dead = [process.name for process in self.followers if not process.is_alive()]
+        if dead:
+            self._abort_parallel()
+            raise RuntimeError(f"Процессы группы параллелизма завершились: {', '.join(dead)}")
+        try:
+            # Остальные процессы группы выполняют ту же задачу (с тем же сидом)
+            self.parallel_group.broadcast_job(job)
+            return self.compile_cache.run(bucket_key, lambda: self._predict(job), warmup=warmup)
+        except Exception:
+            # Обмены группы могли разойтись: группа пересоздается с моделью
+            self._abort_parallel()
+            raise
+    
+    def _abort_parallel(self) -> None:
+        """
+        Разбор сломанной группы параллелизма (rank 0)
+        
+        Ведомые процессы останавливаются, а модель выгружается: DiT
+        разделен на старую группу, и следующая задача загрузит модель
+        заново вместе с новой группой.
+        """
+        self.logger.error("Группа параллелизма по последовательности сломана, модель будет загружена заново")
+        for process in self.followers:
+            if process.is_alive():
+                process.kill()
+            process.join(timeout=10)
+        self.followers = []
+        group, self.parallel_group = self.parallel_group, None
+        try:
+            group.destroy()
+        except Exception as e:
+            self.logger.warning(f"Ошибка разбора группы параллелизма: {e}")
+        self.unload()
+    
+    def _predict(self, job: Dict[str, Any]):
+        """Вызов семплера с настройками CPU-режима"""
+        autocast = cpu_autocast(self.cpu_config) if self.cpu_config is not None else nullcontext()
+        with autocast:
+            return self.sampler.predict(**job)
+    
+    def follow(self) -> None:
+        """
+        Цикл процесса с rank > 0: задачи приходят от rank 0
+        
+        Процесс считает свою часть последовательности в каждом шаге DiT;
+        видео декодирует и сохраняет только rank 0. При ошибке процесс
+        разбирает группу и завершается: rank 0 в это время внутри обменов
+        шага, и они у него должны упасть, а не разойтись с этим процессом.
+        """
+        # Латенты после DiT не нужны: VAE на этом процессе не вызывается
+        self.sampler.pipeline.vae.decode = _skip_decode
+        try:
+            while True:
+                job = self.parallel_group.broadcast_job(None)
+                if job is None:
+                    break
+                self._apply_memory_plan(self.memory_planner.plan(job["height"], job["width"], job["video_length"]))
+                self._run_job(job)
+        except Exception as e:
+            self.logger.error(f"Ошибка генерации в процессе {self.rank}, группа параллелизма разбирается: {e}")
+            self.parallel_group.destroy()
+            os._exit(1)
+        self.parallel_group.destroy()
+    
+    def shutdown(self) -> None:
+        """Остановка процессов группы параллелизма"""
+        if self.parallel_group is None or self.rank != 0:
+            return
+        self.parallel_group.broadcast_job(None)
+        for process in self.followers:
+            process.join(timeout=30)
+        self.parallel_group.destroy()
+        self.parallel_group = None
+        self.followers = []
+    
+    def unload(self) -> None:
+        """Освобождение весов модели; initialize() загрузит ее снова"""
+        self.shutdown()
+        self.sampler = None
+        self.prompt_cache.clear()
+        self.initialized = False
+        self.offload_active = False
+        self.quantization = None
+        # Модули новой загрузки компилируются заново (графы - из кеша на диске)
+        self.compile_cache = CompileCache(self.compile_cache.config)
+        gc.collect()
+        if self.device == "cuda":
+            torch.cuda.empty_cache()
+        self.logger.info(f"Модель выгружена: {self.model_path or 'по умолчанию'}")
+    
+    def _quantize_for_cpu(self) -> None:
+        """int8-квантизация DiT и текстового энкодера (DAUR_MEDIA_QUANTIZE)"""
+        settings = quantization_from_env()
+        if not settings['mode']:
+            return
+        
+        pipeline = self.sampler.pipeline
+        text_encoder = pipeline.text_encoder
+        self.quantization = {
+            'transformer': quantize_linear_layers(
+                pipeline.transformer, settings['mode'], settings['skip_patterns']
+            ),
+            'text_encoder': quantize_linear_layers(
+                getattr(text_encoder, 'model', text_encoder), settings['mode'], settings['skip_patterns']
+            )
+        }
+        if settings['mode'] == 'dynamic':
+            # Модели переведены в float32: bf16 autocast и bf16-вход DiT
+            # несовместимы с динамическими int8-ядрами
+            self.cpu_config.bf16 = False
+            self.sampler.args.precision = 'fp32'
+    
+    def _compile_model(self) -> None:
+        """torch.compile DiT и VAE после квантизации и параллелизма"""
+        pipeline = self.sampler.pipeline
+        buckets = ShapeBuckets.from_env()
+        self.compile_cache.compile(
+            {'transformer': pipeline.transformer, 'vae': pipeline.vae},
+            bucket_count=len(buckets.sizes) * len(buckets.lengths),
+            extra={
+                'model_base': self.model_path,
+                'dit_weight': self.dit_weight,
+                'device': self.device,
+                'precision': getattr(self.sampler.args, 'precision', None),
+                'cpu_runtime': self.cpu_config.to_dict() if self.cpu_config is not None else None,
+                'sequence_parallel': self.parallel.to_dict(),
+                'rank': self.rank
+            }
+        )
+    
+    def warmup_compiled(self) -> None:
+        """
+        Компиляция настроенных корзин до первой задачи
+        
+        Для каждой корзины выполняется один шаг денойзинга и декодирование
+        VAE; корзины с артефактами на диске только загружают их.
+        """
+        if not self.compile_cache.active or self.rank != 0:
+            # Процессы группы участвуют в прогреве из цикла follow()
+            return
+        try:
+            keys = warmup_keys(
+                self.compile_cache.config, GENERATION_PROFILES.values(), ShapeBuckets.from_env().canonicalize
+            )
+        except ValueError as e:
+            self.logger.warning(f"Прогрев компиляции пропущен: {e}")
+            return
+        for key in keys:
+            width, height, video_length = (int(value) for value in key.split('x'))
+            cached = self.compile_cache.is_cached(key)
+            job = {
+                "prompt": "warmup",
+                "height": height,
+                "width": width,
+                "video_length": video_length,
+                "seed": 0,
+                "infer_steps": 1,
+                "guidance_scale": 1.0,
+                "embedded_guidance_scale": 6.0,
+                "batch_size": 1,
+                "num_videos_per_prompt": 1
+            }
+            try:
+                self._apply_memory_plan(self.memory_planner.plan(height, width, video_length))
+                self._run_job(job, warmup=True)
+            except Exception as e:
+                self.logger.warning(f"Ошибка прогрева корзины {key}: {e}")
+                continue
+            self.logger.info(
+                f"Корзина {key} прогрета ({'кеш на диске' if cached else 'компиляция'}): "
+                f"{self.compile_cache.warm[key]['first_run_seconds']} с"
+            )
+    
+    def _apply_memory_plan(self, plan) -> None:
+        """Переключение тайлов VAE и выгрузки весов под план задачи"""
+        pipeline = self.sampler.pipeline
+        self.sampler.args.vae_tiling = plan.vae_tiling
+        self.sampler.args.save_memory = plan.vae_tiling
+        if plan.vae_tiling:
+            pipeline.vae.enable_tiling()
+        else:
+            pipeline.vae.disable_tiling()
+        
+        if plan.offload == self.offload_active:
+            return
+        if plan.offload:
+            pipeline.enable_sequential_cpu_offload()
+        else:
+            # Веса помещаются: снимаем хуки выгрузки и возвращаем модель на GPU
+            pipeline.remove_all_hooks()
+            pipeline.to(self.device)
+        self.offload_active = plan.offload
+    
     def get_model_info(self) -> Dict[str, Any]:
         """
         Получение информации о модели
@@ -202,9 +533,28 @@ class HunyuanVideoGenerator:
             "device": self.device,
             "cuda_available": torch.cuda.is_available(),
             "hunyuan_available": HUNYUAN_AVAILABLE,
-            "model_path": self.model_path
+            "model_path": self.model_path,
+            "dit_weight": self.dit_weight,
+            "prompt_cache": self.prompt_cache.get_stats(),
+            "cpu_runtime": self.cpu_config.to_dict() if self.cpu_config is not None else None,
+            "cpu_offload": self.offload_active,
+            "quantization": self.quantization,
+            "sequence_parallel": self.parallel.to_dict() if self.parallel.enabled else None,
+            "compile": self.compile_cache.get_stats() if self.compile_cache.config.enabled else None
         }
 
+def _skip_decode(z, return_dict: bool = True, generator=None):
+    """vae.decode процесса с rank > 0: латенты вместо кадров"""
+    if return_dict:
+        return SimpleNamespace(sample=z)
+    return (z,)
+
+def _run_follower(rank: int, parallel: ParallelConfig, model_path: Optional[str], dit_weight: Optional[str]) -> None:
+    """Точка входа процесса группы параллелизма (rank > 0)"""
+    generator = HunyuanVideoGenerator(model_path, parallel=parallel, rank=rank, dit_weight=dit_weight)
+    if generator.initialize():
+        generator.follow()
+
 def main():
     """Основная функция для тестирования"""
     parser = argparse.ArgumentParser(description="Daur MedIA HunyuanVideo Generator")
@@ -215,11 +565,16 @@ def main():
     parser.add_argument("--length", type=int, default=129, help="Длина видео в кадрах")
     parser.add_argument("--steps", type=int, default=50, help="Количество шагов инференса")
     parser.add_argument("--seed", type=int, default=None, help="Сид для воспроизводимости")
+    parser.add_argument("--ulysses-degree", type=int, default=None, help="Процессов Ulysses (делит число голов внимания)")
+    parser.add_argument("--ring-degree", type=int, default=None, help="Процессов в кольце K/V")
     
     args = parser.parse_args()
     
-    # Создание генератора
-    generator = HunyuanVideoGenerator()
+    # Создание генератора: при степенях > 1 он сам запускает процессы группы
+    parallel = None
+    if args.ulysses_degree or args.ring_degree:
+        parallel = ParallelConfig(args.ulysses_degree or 1, args.ring_degree or 1)
+    generator = HunyuanVideoGenerator(parallel=parallel)
     
     # Генерация видео
     result = generator.generate_video(
@@ -236,6 +591,7 @@ def main():
         print(f"🎲 Использованный сид: {result['seed']}")
     else:
         print(f"❌ Ошибка: {result['error']}")
+    generator.shutdown()
 
 if __name__ == "__main__":
     main()
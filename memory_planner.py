@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Daur MedIA - Memory Planner
+Выбор режима выполнения задачи по оценке пикового потребления памяти
+
+Режимы (от быстрого к экономному):
+- resident: все веса на устройстве, VAE декодирует видео целиком
+- tiled: веса на устройстве, VAE декодирует тайлами (save_memory)
+- offload: последовательная выгрузка весов в RAM и тайлы VAE
+
+Оценки построены по размерам HunyuanVideo (DiT ~13B в bf16, текстовый
+энкодер LLaVA-Llama-3-8B в fp16): в режиме tiled ~52 ГБ для 720x1280x129
+и ~47 ГБ для 544x960x129 при опубликованных требованиях модели 60 и 45 ГБ.
+"""
+
+import logging
+from typing import Any, Dict, Optional
+
+import psutil
+import torch
+
+logger = logging.getLogger(__name__)
+
+GB = 1024 ** 3
+
+# Веса (байт)
+DIT_BYTES = 12.8e9 * 2
+TEXT_ENCODER_BYTES = 8.0e9 * 2 + 0.25e9 * 2
+VAE_BYTES = 0.25e9 * 2
+# Самый крупный модуль, который держит на устройстве последовательная выгрузка
+LARGEST_MODULE_BYTES = 1.0e9
+
+# Активации одного блока DiT на латентный токен: hidden 3072, bf16,
+# qkv + MLP 4x + промежуточные буферы (внимание без N^2 памяти)
+DIT_BYTES_PER_TOKEN = 3072 * 2 * 16
+
+# Декодер VAE: 128 каналов в bf16/fp16 на пиксель, ~4 живых буфера
+VAE_BYTES_PER_PIXEL = 128 * 2 * 4
+VAE_TILE_PIXELS = 256 * 256
+VAE_TILE_FRAMES = 33
+
+# Итоговый тензор samples (float32, 3 канала)
+OUTPUT_BYTES_PER_PIXEL = 3 * 4
+
+# Доля памяти, которую оставляем под фрагментацию и буферы CUDA
+DEFAULT_HEADROOM = 0.1
+
+MODES = ('resident', 'tiled', 'offload')
+
+
+def latent_tokens(height: int, width: int, video_length: int) -> int:
+    """Число латентных токенов DiT (VAE 8x8x4, патчи 2x2)"""
+    return (height // 16) * (width // 16) * ((video_length - 1) // 4 + 1)
+
+
+class MemoryPlan:
+    """Выбранный режим выполнения задачи"""
+
+    def __init__(self, mode: str, peak_bytes: float, budget_bytes: float, fits: bool):
+        self.mode = mode
+        self.peak_bytes = peak_bytes
+        self.budget_bytes = budget_bytes
+        self.fits = fits
+
+    @property
+    def offload(self) -> bool:
+        return self.mode == 'offload'
+
+    @property
+    def vae_tiling(self) -> bool:
+        return self.mode != 'resident'
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'mode': self.mode,
+            'peak_gb': round(self.peak_bytes / GB, 2),
+            'budget_gb': round(self.budget_bytes / GB, 2),
+            'fits': self.fits
+        }
+
+
+class MemoryPlanner:
+    """Оценка пиковой памяти задачи и выбор режима выполнения"""
+
+    def __init__(self, device: str, headroom: float = DEFAULT_HEADROOM):
+        """
+        Args:
+            device: 'cuda' или 'cpu'
+            headroom: Доля памяти, не используемая при планировании
+        """
+        self.device = device
+        self.headroom = headroom
+
+    def estimate_peak(self, mode: str, height: int, width: int, video_length: int) -> float:
+        """Пиковое потребление памяти устройства (байт) в заданном режиме"""
+        pixels = height * width * video_length
+        activations = latent_tokens(height, width, video_length) * DIT_BYTES_PER_TOKEN
+        if mode == 'resident':
+            vae_peak = pixels * VAE_BYTES_PER_PIXEL
+        else:
+            tile_frames = min(video_length, VAE_TILE_FRAMES)
+            vae_peak = min(height * width, VAE_TILE_PIXELS) * tile_frames * VAE_BYTES_PER_PIXEL
+
+        if mode == 'offload':
+            weights = LARGEST_MODULE_BYTES
+        else:
+            weights = DIT_BYTES + TEXT_ENCODER_BYTES + VAE_BYTES
+        # Денойзинг и декодирование VAE не пересекаются по времени
+        return weights + max(activations, vae_peak) + pixels * OUTPUT_BYTES_PER_PIXEL
+
+    def budget(self) -> float:
+        """Память, доступная процессу на устройстве (байт)"""
+        if self.device == 'cuda' and torch.cuda.is_available():
+            free, _ = torch.cuda.mem_get_info()
+            # Уже занятое этим процессом (веса модели) тоже доступно задаче
+            available = free + torch.cuda.memory_reserved()
+        else:
+            available = psutil.virtual_memory().available + psutil.Process().memory_info().rss
+        return available * (1 - self.headroom)
+
+    def plan(self, height: int, width: int, video_length: int, budget: Optional[float] = None) -> MemoryPlan:
+        """
+        Самый быстрый режим, укладывающийся в память
+
+        Если не укладывается ни один, выбирается самый экономный
+        (fits=False): задача все равно запускается, а не падает заранее.
+        """
+        budget = self.budget() if budget is None else budget
+        # На CPU выгружать веса некуда
+        modes = MODES if self.device == 'cuda' else MODES[:2]
+        for mode in modes:
+            peak = self.estimate_peak(mode, height, width, video_length)
+            if peak <= budget:
+                return MemoryPlan(mode, peak, budget, True)
+        mode = modes[-1]
+        peak = self.estimate_peak(mode, height, width, video_length)
+        logger.warning(
+            f"Задача {width}x{height}x{video_length} может не поместиться в память: "
+            f"нужно ~{peak / GB:.1f} ГБ, доступно ~{budget / GB:.1f} ГБ"
+        )
+        return MemoryPlan(mode, peak, budget, False)
+
+    def weights_fit(self, budget: Optional[float] = None) -> bool:
+        """Помещаются ли все веса на устройство (решается при загрузке модели)"""
+        budget = self.budget() if budget is None else budget
+        return DIT_BYTES + TEXT_ENCODER_BYTES + VAE_BYTES <= budget
@@ -0,0 +1,454 @@
+#!/usr/bin/env python3
+"""
+Daur MedIA - Model Pool
+Реестр моделей и пул загруженных генераторов с выгрузкой по LRU
+
+Реестр описывает доступные чекпойнты и варианты (например, полная и
+дистиллированная модель), задача указывает нужную по имени. Модель
+загружается при первом обращении; если вместе с уже загруженными она
+не помещается в бюджет памяти, выгружаются давно не использованные.
+Модель, на которой идет генерация, не выгружается.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODELS = {
+    'hunyuan-video': {
+        'model_base': None,
+        'description': 'HunyuanVideo 13B'
+    }
+}
+
+GB = 1024 ** 3
+
+# Оценка памяти модели до первой загрузки, если в реестре не указана:
+# веса HunyuanVideo (DiT, текстовые энкодеры, VAE), как в memory_planner
+DEFAULT_MODEL_BYTES = 42.6e9
+
+
+class ModelSpec:
+    """Описание модели в реестре"""
+
+    def __init__(
+        self,
+        name: str,
+        model_base: Optional[str] = None,
+        dit_weight: Optional[str] = None,
+        description: str = '',
+        memory_gb: Optional[float] = None
+    ):
+        """
+        Args:
+            name: Имя, по которому модель указывается в задаче
+            model_base: Каталог или репозиторий чекпойнта (None - по умолчанию генератора)
+            dit_weight: Веса DiT варианта (например, дистиллированного)
+            description: Описание для клиентов
+            memory_gb: Память под веса, если известна заранее
+        """
+        self.name = name
+        self.model_base = model_base
+        self.dit_weight = dit_weight
+        self.description = description
+        self.memory_gb = memory_gb
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'model_base': self.model_base,
+            'dit_weight': self.dit_weight,
+            'description': self.description,
+            'memory_gb': self.memory_gb
+        }
+
+
+def _cuda():
+    """torch.cuda, если есть GPU (веб-сервер работает и без torch)"""
+    try:
+        import torch
+    except ImportError:
+        return None
+    return torch.cuda if torch.cuda.is_available() else None
+
+
+def _device_memory() -> float:
+    """Полный объем памяти устройства, на котором живут веса (байт)"""
+    cuda = _cuda()
+    if cuda is not None:
+        return cuda.get_device_properties(0).total_memory
+    return psutil.virtual_memory().total
+
+
+def _memory_in_use() -> float:
+    """Память, занятая процессом на устройстве (байт)"""
+    cuda = _cuda()
+    if cuda is not None:
+        return cuda.memory_allocated()
+    return psutil.Process().memory_info().rss
+
+
+class MemoryBudget:
+    """
+    Память под веса, общая для пулов всех воркеров генерации
+
+    Каждый пул сообщает, сколько занимают его модели, и при загрузке
+    сравнивает с бюджетом сумму по всем пулам. Так один работающий воркер
+    может занять весь бюджет, а добавленные делят его по факту загрузок.
+    Загрузка идет минутами, поэтому ее ожидаемая память резервируется до
+    initialize(): параллельная загрузка в другом пуле уже видит ее занятой.
+    """
+
+    def __init__(self, budget_bytes: Optional[float] = None):
+        """
+        Args:
+            budget_bytes: Бюджет (по умолчанию 90% памяти устройства)
+        """
+        self.budget_bytes = budget_bytes if budget_bytes is not None else _device_memory() * 0.9
+        # Собственная блокировка, пулы под ней не вызываются
+        self._lock = threading.Lock()
+        self._used: Dict[int, float] = {}
+        self._reserved: Dict[int, float] = {}
+
+    @classmethod
+    def from_env(cls) -> 'MemoryBudget':
+        """Бюджет из DAUR_MEDIA_MODEL_MEMORY_GB"""
+        budget = os.environ.get('DAUR_MEDIA_MODEL_MEMORY_GB')
+        return cls(float(budget) * GB if budget else None)
+
+    def report(self, pool: 'ModelPool', used_bytes: float) -> None:
+        """Память, занятая моделями пула"""
+        with self._lock:
+            self._used[id(pool)] = used_bytes
+
+    def reserve(self, pool: 'ModelPool', needed_bytes: float) -> bool:
+        """
+        Резерв памяти под загрузку модели пула
+
+        Returns:
+            bool: Все пулы вместе с резервом укладываются в бюджет
+        """
+        with self._lock:
+            self._reserved[id(pool)] = needed_bytes
+            return self._total() <= self.budget_bytes
+
+    def release(self, pool: 'ModelPool') -> None:
+        """Снятие резерва: загрузка завершилась или не удалась"""
+        with self._lock:
+            self._reserved.pop(id(pool), None)
+
+    def remove(self, pool: 'ModelPool') -> None:
+        """Пул завершившегося воркера"""
+        with self._lock:
+            self._used.pop(id(pool), None)
+            self._reserved.pop(id(pool), None)
+
+    def used_bytes(self, exclude: Optional['ModelPool'] = None) -> float:
+        """Занято и зарезервировано всеми пулами (кроме exclude)"""
+        with self._lock:
+            return self._total(exclude)
+
+    def _total(self, exclude: Optional['ModelPool'] = None) -> float:
+        return sum(
+            used for items in (self._used, self._reserved) for key, used in items.items() if key != id(exclude)
+        )
+
+
+class _LoadedModel:
+    __slots__ = ('generator', 'memory_bytes', 'loaded_at', 'last_used', 'in_use')
+
+    def __init__(self, generator, memory_bytes: float):
+        self.generator = generator
+        self.memory_bytes = memory_bytes
+        self.loaded_at = time.time()
+        self.last_used = self.loaded_at
+        self.in_use = 0
+
+
+class ModelPool:
+    """Загруженные генераторы по именам моделей из реестра"""
+
+    def __init__(
+        self,
+        specs: Dict[str, ModelSpec],
+        factory: Callable[[ModelSpec], Any],
+        budget_bytes: Optional[float] = None,
+        default_model: Optional[str] = None,
+        max_loaded: Optional[int] = None,
+        budget: Optional[MemoryBudget] = None
+    ):
+        """
+        Args:
+            specs: Реестр моделей
+            factory: Создание (незагруженного) генератора по описанию модели
+            budget_bytes: Память под веса всех загруженных моделей
+                (по умолчанию 90% памяти устройства)
+            default_model: Модель для задач без явного указания (по умолчанию первая)
+            max_loaded: Предел числа одновременно загруженных моделей
+            budget: Бюджет, общий с другими пулами (вместо budget_bytes)
+        """
+        if not specs:
+            raise ValueError("Реестр моделей пуст")
+        self.specs = specs
+        self.factory = factory
+        self.budget = budget or MemoryBudget(budget_bytes)
+        self.default_model = default_model or next(iter(specs))
+        if self.default_model not in specs:
+            raise ValueError(f"Модель по умолчанию {self.default_model} не описана в реестре")
+        self.max_loaded = max_loaded
+
+        # _lock - учет загруженных моделей, _load_lock - одна загрузка за раз:
+        # статистика и попадания не ждут загрузку, которая идет минутами
+        self._lock = threading.RLock()
+        self._load_lock = threading.Lock()
+        # Порядок - от давно использованных к недавним
+        self._loaded: 'OrderedDict[str, _LoadedModel]' = OrderedDict()
+        # Измеренная при прошлой загрузке память: точнее оценки из реестра
+        self._measured_bytes: Dict[str, float] = {}
+        self._idle: Dict[str, Any] = {}
+        self.metrics = {'hits': 0, 'loads': 0, 'load_failures': 0, 'evictions': 0, 'load_seconds': 0.0}
+
+    @classmethod
+    def from_env(cls, factory: Callable[[ModelSpec], Any], budget: Optional[MemoryBudget] = None) -> 'ModelPool':
+        """
+        Пул из окружения (budget - бюджет, общий для пулов воркеров
+        генерации; по умолчанию - собственный, см. MemoryBudget.from_env):
+        - DAUR_MEDIA_MODELS: JSON реестра или путь к JSON-файлу,
+          {"имя": {"model_base": ..., "dit_weight": ..., "description": ..., "memory_gb": ...}}
+        - DAUR_MEDIA_DEFAULT_MODEL: модель по умолчанию
+        - DAUR_MEDIA_MODEL_MEMORY_GB: бюджет памяти под веса
+        - DAUR_MEDIA_MAX_MODELS: предел числа загруженных моделей
+          (при параллелизме по последовательности по умолчанию 1)
+        """
+        registry = DEFAULT_MODELS
+        source = os.environ.get('DAUR_MEDIA_MODELS', '').strip()
+        if source:
+            if source.startswith('{'):
+                registry = json.loads(source)
+            else:
+                with open(source) as f:
+                    registry = json.load(f)
+        specs = {name: ModelSpec(name, **options) for name, options in registry.items()}
+
+        max_loaded = os.environ.get('DAUR_MEDIA_MAX_MODELS')
+        degree = int(os.environ.get('DAUR_MEDIA_ULYSSES_DEGREE', '1')) * int(os.environ.get('DAUR_MEDIA_RING_DEGREE', '1'))
+        if not max_loaded and degree > 1:
+            # Группа процессов параллелизма по последовательности одна на сервер
+            max_loaded = '1'
+        return cls(
+            specs,
+            factory,
+            budget=budget or MemoryBudget.from_env(),
+            default_model=os.environ.get('DAUR_MEDIA_DEFAULT_MODEL') or None,
+            max_loaded=int(max_loaded) if max_loaded else None
+        )
+
+    def resolve(self, name: Optional[str]) -> str:
+        """Имя модели задачи (None - модель по умолчанию)"""
+        name = name or self.default_model
+        if name not in self.specs:
+            raise ValueError(f"Неизвестная модель: {name}. Доступны: {', '.join(self.specs)}")
+        return name
+
+    def is_loaded(self, name: Optional[str] = None) -> bool:
+        with self._lock:
+            return self.resolve(name) in self._loaded
+
+    def peek(self, name: Optional[str] = None):
+        """Генератор модели без загрузки (для информации о модели)"""
+        name = self.resolve(name)
+        with self._lock:
+            entry = self._loaded.get(name)
+            if entry is not None:
+                return entry.generator
+            if name not in self._idle:
+                self._idle[name] = self.factory(self.specs[name])
+            return self._idle[name]
+
+    def load(self, name: Optional[str] = None):
+        """Загрузка модели (если еще не загружена); возвращает генератор"""
+        with self.acquire(name) as generator:
+            return generator
+
+    @contextmanager
+    def acquire(self, name: Optional[str] = None) -> Iterator[Any]:
+        """
+        Загруженный генератор на время генерации
+
+        Пока контекст открыт, модель не выгружается. Ошибка загрузки
+        выбрасывается как RuntimeError.
+        """
+        name = self.resolve(name)
+        entry = self._checkout(name, count_hit=True)
+        if entry is None:
+            with self._load_lock:
+                # Модель могли загрузить, пока ждали блокировку
+                entry = self._checkout(name) or self._load(name)
+        try:
+            yield entry.generator
+        finally:
+            with self._lock:
+                entry.in_use -= 1
+                entry.last_used = time.time()
+
+    def unload(self, name: str) -> bool:
+        """Выгрузка модели, если она не занята генерацией"""
+        with self._lock:
+            entry = self._loaded.get(name)
+            if entry is None or entry.in_use:
+                return False
+            self._evict(name)
+        self._unload([(name, entry)])
+        return True
+
+    def expected_bytes(self, name: Optional[str] = None) -> float:
+        """Память под веса модели: замер прошлой загрузки или оценка"""
+        return self._expected_bytes(self.resolve(name))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Реестр, загруженные модели и счетчики"""
+        with self._lock:
+            now = time.time()
+            loaded = {
+                name: {
+                    'memory_gb': round(entry.memory_bytes / GB, 2),
+                    'loaded_seconds_ago': round(now - entry.loaded_at, 1),
+                    'idle_seconds': round(now - entry.last_used, 1),
+                    'in_use': entry.in_use > 0
+                }
+                for name, entry in self._loaded.items()
+            }
+            return {
+                'default_model': self.default_model,
+                'models': {name: spec.to_dict() for name, spec in self.specs.items()},
+                'loaded': loaded,
+                'lru_order': list(self._loaded),
+                'memory_used_gb': round(self._used_bytes() / GB, 2),
+                'memory_budget_used_gb': round(self.budget.used_bytes() / GB, 2),
+                'memory_budget_gb': round(self.budget_bytes / GB, 2),
+                'max_loaded': self.max_loaded,
+                'metrics': dict(self.metrics, load_seconds=round(self.metrics['load_seconds'], 1))
+            }
+
+    @property
+    def budget_bytes(self) -> float:
+        return self.budget.budget_bytes
+
+    def _expected_bytes(self, name: str) -> float:
+        spec = self.specs[name]
+        if name in self._measured_bytes:
+            return self._measured_bytes[name]
+        if spec.memory_gb is not None:
+            return spec.memory_gb * GB
+        return DEFAULT_MODEL_BYTES
+
+    def _used_bytes(self) -> float:
+        return sum(entry.memory_bytes for entry in self._loaded.values())
+
+    def _make_room(self, needed: float) -> List[Tuple[str, _LoadedModel]]:
+        """
+        Снятие с учета давно не использованных моделей, пока новая не поместится
+
+        Returns:
+            Снятые модели: выгружать их вызывающий код должен вне _lock
+        """
+        evicted = []
+        others = self.budget.used_bytes(exclude=self)
+        for name in list(self._loaded):
+            over_budget = others + self._used_bytes() + needed > self.budget_bytes
+            over_count = self.max_loaded is not None and len(self._loaded) >= self.max_loaded
+            if not over_budget and not over_count:
+                return evicted
+            if not self._loaded[name].in_use:
+                evicted.append((name, self._evict(name)))
+        if others + self._used_bytes() + needed > self.budget_bytes:
+            logger.warning(
+                f"Модели не помещаются в бюджет: занято {(others + self._used_bytes()) / GB:.1f} ГБ, "
+                f"нужно еще {needed / GB:.1f} ГБ из {self.budget_bytes / GB:.1f} ГБ"
+            )
+        return evicted
+
+    def _checkout(self, name: str, count_hit: bool = False) -> Optional[_LoadedModel]:
+        """Отметка загруженной модели занятой (None - не загружена)"""
+        with self._lock:
+            entry = self._loaded.get(name)
+            if entry is not None:
+                if count_hit:
+                    self.metrics['hits'] += 1
+                self._loaded.move_to_end(name)
+                entry.in_use += 1
+                entry.last_used = time.time()
+            return entry
+
+    def _load(self, name: str) -> _LoadedModel:
+        needed = self._expected_bytes(name)
+        with self._lock:
+            evicted = self._make_room(needed)
+            fits = self.budget.used_bytes(exclude=self) + self._used_bytes() + needed <= self.budget_bytes
+            if not self.budget.reserve(self, needed) and fits:
+                # Другой пул зарезервировал память между проверкой и резервом
+                evicted += self._make_room(needed)
+            generator = self._idle.pop(name, None) or self.factory(self.specs[name])
+        # Память вытесненных моделей освобождается до загрузки новой
+        self._unload(evicted)
+
+        memory_before = _memory_in_use()
+        started = time.time()
+        initialized = False
+        try:
+            initialized = generator.initialize()
+        finally:
+            if not initialized:
+                with self._lock:
+                    self.budget.release(self)
+                    self.metrics['load_failures'] += 1
+                    self._idle[name] = generator
+        if not initialized:
+            raise RuntimeError(f"Не удалось загрузить модель {name}")
+        elapsed = time.time() - started
+
+        # Генератор, держащий веса в другом процессе (зигота), сообщает их
+        # объем сам; иначе - фактический прирост памяти процесса, а если
+        # замер невозможен (память освободилась параллельно), остается оценка
+        memory_bytes = getattr(generator, 'memory_bytes', None)
+        if memory_bytes is None:
+            measured = _memory_in_use() - memory_before
+            memory_bytes = measured if measured > 0 else self._expected_bytes(name)
+        self._measured_bytes[name] = memory_bytes
+
+        entry = _LoadedModel(generator, memory_bytes)
+        entry.in_use = 1
+        with self._lock:
+            self._loaded[name] = entry
+            self.budget.report(self, self._used_bytes())
+            self.budget.release(self)
+            self.metrics['loads'] += 1
+            self.metrics['load_seconds'] += elapsed
+        logger.info(f"Модель {name} загружена за {elapsed:.1f} с, {memory_bytes / GB:.1f} ГБ")
+        return entry
+
+    def _evict(self, name: str) -> _LoadedModel:
+        """Снятие модели с учета (под _lock); выгрузка - в _unload"""
+        entry = self._loaded.pop(name)
+        self.budget.report(self, self._used_bytes())
+        self.metrics['evictions'] += 1
+        return entry
+
+    @staticmethod
+    def _unload(evicted: List[Tuple[str, _LoadedModel]]) -> None:
+        """
+        Выгрузка снятых с учета моделей вне _lock: остановка воркера зиготы
+        или процессов параллелизма идет секундами, а статистика не ждет
+        """
+        for name, entry in evicted:
+            entry.generator.unload()
+            logger.info(f"Модель {name} выгружена, освобождено ~{entry.memory_bytes / GB:.1f} ГБ")
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Daur MedIA - Quantization
+int8-квантизация линейных слоев DiT и текстового энкодера для CPU
+
+Режимы:
+- dynamic: веса int8, активации квантуются на лету (quantize_dynamic,
+  ядра fbgemm/oneDNN) - самый быстрый вариант на CPU
+- weight_only: веса int8 с масштабом на выходной канал, умножение в
+  исходной точности - экономит память и работает вместе с bf16 autocast
+
+Слои, имена которых совпадают с шаблонами пропуска (fnmatch), остаются
+в исходной точности: по умолчанию это входные и выходные проекции DiT,
+к ошибкам которых результат наиболее чувствителен.
+"""
+
+import os
+import fnmatch
+import logging
+from typing import Any, Dict, Iterable, Optional
+
+import torch
+import torch.nn.functional as F
+from torch import nn
+from torch.nn.modules.linear import NonDynamicallyQuantizableLinear
+
+logger = logging.getLogger(__name__)
+
+QUANTIZATION_MODES = ('dynamic', 'weight_only')
+
+DEFAULT_SKIP_PATTERNS = (
+    '*img_in*', '*txt_in*', '*time_in*', '*vector_in*', '*guidance_in*',
+    '*final_layer*', '*lm_head*'
+)
+
+
+class WeightOnlyInt8Linear(nn.Module):
+    """Linear с весами int8 и масштабом на выходной канал"""
+
+    def __init__(self, linear: nn.Linear):
+        super().__init__()
+        weight = linear.weight.detach().float()
+        scale = weight.abs().amax(dim=1, keepdim=True).clamp(min=1e-8) / 127
+        self.register_buffer('weight_int8', torch.round(weight / scale).to(torch.int8))
+        self.register_buffer('scale', scale.to(linear.weight.dtype))
+        self.bias = linear.bias
+        self.in_features = linear.in_features
+        self.out_features = linear.out_features
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        weight = self.weight_int8.to(x.dtype) * self.scale.to(x.dtype)
+        bias = self.bias.to(x.dtype) if self.bias is not None else None
+        return F.linear(x, weight, bias)
+
+    def extra_repr(self) -> str:
+        return f"in_features={self.in_features}, out_features={self.out_features}, int8"
+
+
+def _skipped(name: str, skip_patterns: Iterable[str]) -> bool:
+    return any(fnmatch.fnmatch(name, pattern) for pattern in skip_patterns)
+
+
+def module_bytes(module: nn.Module) -> int:
+    """Размер параметров и буферов модуля, включая упакованные int8-веса"""
+    total = sum(t.numel() * t.element_size() for t in module.parameters())
+    total += sum(t.numel() * t.element_size() for t in module.buffers())
+    for submodule in module.modules():
+        # Веса quantize_dynamic хранятся в packed params, а не в parameters()
+        if hasattr(submodule, '_packed_params') and hasattr(submodule, 'weight'):
+            weight = submodule.weight()
+            total += weight.numel() * weight.element_size()
+    return total
+
+
+def _quantize_layer(linear: nn.Linear, mode: str) -> nn.Module:
+    """
+    Квантованная замена одного слоя
+
+    Слои квантуются по одному: в float32 переводится только текущий
+    слой, поэтому пик памяти - исходная модель плюс один слой float32,
+    а не вся модель в float32.
+    """
+    if mode == 'weight_only':
+        return WeightOnlyInt8Linear(linear)
+    linear = linear.float()
+    linear.qconfig = torch.ao.quantization.default_dynamic_qconfig
+    return torch.ao.nn.quantized.dynamic.Linear.from_float(linear)
+
+
+def quantize_linear_layers(
+    model: nn.Module,
+    mode: str = 'dynamic',
+    skip_patterns: Optional[Iterable[str]] = None
+) -> Dict[str, Any]:
+    """
+    Квантизация линейных слоев модели (на месте)
+
+    Args:
+        model: Модель
+        mode: 'dynamic' или 'weight_only'
+        skip_patterns: Шаблоны имен слоев, которые не квантуются
+
+    Returns:
+        Отчет: число квантованных и пропущенных слоев, размер до и после
+    """
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"Неизвестный режим квантизации: {mode}")
+    skip_patterns = tuple(DEFAULT_SKIP_PATTERNS if skip_patterns is None else skip_patterns)
+
+    bytes_before = module_bytes(model)
+    targets = []
+    skipped = []
+    for name, module in model.named_modules():
+        if not isinstance(module, nn.Linear):
+            continue
+        # out_proj у nn.MultiheadAttention: его веса читаются напрямую
+        if isinstance(module, NonDynamicallyQuantizableLinear) or _skipped(name, skip_patterns):
+            skipped.append(name)
+        else:
+            targets.append(name)
+
+    for name in targets:
+        parent_name, _, child_name = name.rpartition('.')
+        parent = model.get_submodule(parent_name) if parent_name else model
+        setattr(parent, child_name, _quantize_layer(getattr(parent, child_name), mode))
+
+    if mode == 'dynamic':
+        # Динамические int8-ядра принимают только float32 активации,
+        # поэтому остальные слои модели тоже переводятся в float32; веса
+        # квантованных слоев хранятся в packed params и не затрагиваются
+        model.float()
+
+    report = {
+        'mode': mode,
+        'quantized_layers': len(targets),
+        'skipped_layers': skipped,
+        'bytes_before': bytes_before,
+        'bytes_after': module_bytes(model)
+    }
+    logger.info(
+        f"Квантизация {mode}: {len(targets)} слоев, пропущено {len(skipped)}, "
+        f"{bytes_before / 1024**2:.0f} -> {report['bytes_after'] / 1024**2:.0f} MB"
+    )
+    return report
+
+
+def quantization_from_env() -> Dict[str, Any]:
+    """
+    Настройки из окружения: DAUR_MEDIA_QUANTIZE (dynamic/weight_only, пусто - выключено)
+    и DAUR_MEDIA_QUANTIZE_SKIP (шаблоны через запятую, заменяют шаблоны по умолчанию)
+    """
+    mode = os.environ.get('DAUR_MEDIA_QUANTIZE', '').strip() or None
+    skip = os.environ.get('DAUR_MEDIA_QUANTIZE_SKIP')
+    return {
+        'mode': mode,
+        'skip_patterns': [p.strip() for p in skip.split(',') if p.strip()] if skip is not None else None
+    }
+
+
+def compare_outputs(reference: torch.Tensor, candidate: torch.Tensor) -> Dict[str, float]:
+    """Отклонение квантованного результата от исходного"""
+    reference = reference.float().flatten()
+    candidate = candidate.float().flatten()
+    error = candidate - reference
+    mse = error.pow(2).mean().item()
+    value_range = (reference.max() - reference.min()).item() or 1.0
+    return {
+        'max_abs_error': error.abs().max().item(),
+        'relative_error': (error.norm() / reference.norm().clamp(min=1e-12)).item(),
+        'cosine_similarity': F.cosine_similarity(reference, candidate, dim=0).item(),
+        'psnr_db': float('inf') if mse == 0 else 10 * torch.log10(torch.tensor(value_range ** 2 / mse)).item()
+    }
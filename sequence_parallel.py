@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""
+Daur MedIA - Sequence Parallel
+Параллелизм по последовательности на CPU: одна генерация делится между
+несколькими локальными процессами через torch.distributed (gloo)
+
+Латентные токены видео делятся между ulysses_degree x ring_degree
+процессами (как в xDiT/USP, которые HunyuanVideo использует на GPU):
+- Ulysses: all-to-all внутри группы меняет разбиение по токенам на
+  разбиение по головам внимания
+- Ring: K/V передаются по кольцу, результаты блоков внимания
+  объединяются через log-sum-exp
+
+Текстовые токены есть у всех процессов целиком. Выход DiT собирается
+all-gather, поэтому семплер и VAE работают с полными латентами.
+"""
+
+import os
+import logging
+import multiprocessing
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import torch
+import torch.distributed as dist
+import torch.nn.functional as F
+
+logger = logging.getLogger(__name__)
+
+# Ожидание следующей задачи в основной группе: процессы группы
+# простаивают между задачами сколько угодно долго
+IDLE_TIMEOUT = timedelta(days=365)
+
+
+class ParallelConfig:
+    """Степени параллелизма и адрес для сборки группы процессов"""
+
+    def __init__(
+        self,
+        ulysses_degree: int = 1,
+        ring_degree: int = 1,
+        master_addr: str = '127.0.0.1',
+        master_port: int = 29511,
+        timeout: float = 600.0
+    ):
+        """
+        Args:
+            ulysses_degree: Процессов в группе all-to-all (делит число голов внимания)
+            ring_degree: Процессов в кольце K/V
+            master_addr: Адрес процесса с rank 0
+            master_port: Порт для сборки группы
+            timeout: Секунд ожидания обмена внутри шага, после которых
+                зависший процесс группы считается потерянным
+        """
+        if ulysses_degree < 1 or ring_degree < 1:
+            raise ValueError("Степени параллелизма должны быть не меньше 1")
+        self.ulysses_degree = ulysses_degree
+        self.ring_degree = ring_degree
+        self.master_addr = master_addr
+        self.master_port = master_port
+        self.timeout = timeout
+
+    @classmethod
+    def from_env(cls) -> 'ParallelConfig':
+        """
+        Параметры из окружения: DAUR_MEDIA_ULYSSES_DEGREE, DAUR_MEDIA_RING_DEGREE,
+        DAUR_MEDIA_PARALLEL_ADDR, DAUR_MEDIA_PARALLEL_PORT, DAUR_MEDIA_PARALLEL_TIMEOUT
+        """
+        return cls(
+            ulysses_degree=int(os.environ.get('DAUR_MEDIA_ULYSSES_DEGREE', '1')),
+            ring_degree=int(os.environ.get('DAUR_MEDIA_RING_DEGREE', '1')),
+            master_addr=os.environ.get('DAUR_MEDIA_PARALLEL_ADDR', '127.0.0.1'),
+            master_port=int(os.environ.get('DAUR_MEDIA_PARALLEL_PORT', '29511')),
+            timeout=float(os.environ.get('DAUR_MEDIA_PARALLEL_TIMEOUT', '600'))
+        )
+
+    @property
+    def world_size(self) -> int:
+        return self.ulysses_degree * self.ring_degree
+
+    @property
+    def enabled(self) -> bool:
+        return self.world_size > 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'ulysses_degree': self.ulysses_degree,
+            'ring_degree': self.ring_degree,
+            'world_size': self.world_size
+        }
+
+
+class SequenceParallelGroup:
+    """
+    Группа процессов одной генерации
+
+    Rank раскладывается как ring_rank * ulysses_degree + ulysses_rank:
+    группы Ulysses состоят из соседних рангов, поэтому после all-to-all
+    у каждой из них оказывается непрерывный участок последовательности.
+
+    Задачи рассылаются в основной группе без ограничения ожидания
+    (процессы простаивают между задачами), обмены внутри шага - в
+    группах с таймаутом config.timeout: если процесс группы погиб или
+    завис, обмен у остальных завершается ошибкой, а не ждет вечно.
+    """
+
+    def __init__(self, config: ParallelConfig, rank: int):
+        self.config = config
+        self.rank = rank
+        self.world_size = config.world_size
+        self.ulysses_rank = rank % config.ulysses_degree
+        self.ring_rank = rank // config.ulysses_degree
+
+        if not dist.is_initialized():
+            dist.init_process_group(
+                'gloo',
+                init_method=f"tcp://{config.master_addr}:{config.master_port}",
+                rank=rank,
+                world_size=self.world_size,
+                timeout=IDLE_TIMEOUT
+            )
+        timeout = timedelta(seconds=config.timeout)
+
+        # new_group вызывается всеми процессами для всех групп в одном порядке
+        self.ulysses_group = None
+        self.ring_group = None
+        self.ring_ranks: List[int] = []
+        for ring_rank in range(config.ring_degree):
+            ranks = [ring_rank * config.ulysses_degree + i for i in range(config.ulysses_degree)]
+            group = dist.new_group(ranks, timeout=timeout)
+            if rank in ranks:
+                self.ulysses_group = group
+        for ulysses_rank in range(config.ulysses_degree):
+            ranks = [r * config.ulysses_degree + ulysses_rank for r in range(config.ring_degree)]
+            group = dist.new_group(ranks, timeout=timeout)
+            if rank in ranks:
+                self.ring_group = group
+                self.ring_ranks = ranks
+        self.compute_group = dist.new_group(list(range(self.world_size)), timeout=timeout)
+        logger.info(f"Процесс {rank}/{self.world_size} в группе параллелизма {config.to_dict()}")
+
+    def broadcast_job(self, job: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Параметры задачи от rank 0 всем процессам (None - завершение работы)"""
+        payload = [job]
+        dist.broadcast_object_list(payload, src=0)
+        return payload[0]
+
+    def all_gather(self, tensor: torch.Tensor, dim: int) -> torch.Tensor:
+        """Сборка частей тензора со всех процессов"""
+        tensor = tensor.contiguous()
+        parts = [torch.empty_like(tensor) for _ in range(self.world_size)]
+        dist.all_gather(parts, tensor, group=self.compute_group)
+        return torch.cat(parts, dim=dim)
+
+    def destroy(self) -> None:
+        if dist.is_initialized():
+            dist.destroy_process_group()
+
+
+def _scatter_heads(x: torch.Tensor, group, degree: int) -> torch.Tensor:
+    """[b, s, H, d] -> [b, s * degree, H / degree, d]: головы по процессам, токены собраны"""
+    b, s, h, d = x.shape
+    x = x.reshape(b, s, degree, h // degree, d).permute(2, 0, 1, 3, 4).contiguous()
+    out = torch.empty_like(x)
+    dist.all_to_all_single(out, x, group=group)
+    return out.permute(1, 0, 2, 3, 4).reshape(b, degree * s, h // degree, d)
+
+
+def _gather_heads(x: torch.Tensor, group, degree: int) -> torch.Tensor:
+    """Обратная операция: [b, s * degree, H / degree, d] -> [b, s, H, d]"""
+    b, s, h, d = x.shape
+    s //= degree
+    x = x.reshape(b, degree, s, h, d).permute(1, 0, 2, 3, 4).contiguous()
+    out = torch.empty_like(x)
+    dist.all_to_all_single(out, x, group=group)
+    return out.permute(1, 2, 0, 3, 4).reshape(b, s, degree * h, d)
+
+
+def _block_attention(
+    q: torch.Tensor, k: torch.Tensor, v: torch.Tensor, scale: float
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Внимание к одному блоку K/V ([b, H, s, d]) и log-sum-exp по строкам"""
+    flash = getattr(torch.ops.aten, '_scaled_dot_product_flash_attention_for_cpu', None)
+    if flash is not None:
+        # Flash-ядро PyTorch для CPU возвращает и log-sum-exp, без матрицы s x s
+        out, lse = flash(q, k, v, scale=scale)
+        return out.float(), lse.unsqueeze(-1)
+    scores = torch.matmul(q, k.transpose(-1, -2)).float() * scale
+    lse = torch.logsumexp(scores, dim=-1, keepdim=True)
+    return torch.matmul(torch.exp(scores - lse), v.float()), lse
+
+
+def _merge(
+    out: Optional[torch.Tensor], lse: Optional[torch.Tensor],
+    block_out: torch.Tensor, block_lse: torch.Tensor
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    if out is None:
+        return block_out, block_lse
+    new_lse = torch.logaddexp(lse, block_lse)
+    return out * torch.exp(lse - new_lse) + block_out * torch.exp(block_lse - new_lse), new_lse
+
+
+class SequenceParallelAttention:
+    """
+    Внимание к полной последовательности, когда у процесса только ее часть
+
+    Вызов совместим с hybrid_seq_parallel_attn блоков HunyuanVideo:
+    токены видео (локальная часть) и текстовые joint-токены (целиком)
+    в раскладке [b, s, H, d]. Возвращает выход для локальных токенов
+    видео и следом для текстовых токенов.
+    """
+
+    def __init__(self, group: SequenceParallelGroup):
+        self.group = group
+
+    def __call__(
+        self,
+        q: torch.Tensor,
+        k: torch.Tensor,
+        v: torch.Tensor,
+        joint_q: Optional[torch.Tensor] = None,
+        joint_k: Optional[torch.Tensor] = None,
+        joint_v: Optional[torch.Tensor] = None
+    ) -> torch.Tensor:
+        group = self.group
+        ulysses = group.config.ulysses_degree
+        heads = q.shape[2]
+        if heads % ulysses:
+            raise ValueError(f"Число голов {heads} не делится на ulysses_degree={ulysses}")
+        local_len = q.shape[1]
+
+        if ulysses > 1:
+            q, k, v = (_scatter_heads(t, group.ulysses_group, ulysses) for t in (q, k, v))
+        image_len = q.shape[1]
+
+        # Голов текстовых токенов столько же, сколько у процесса после all-to-all
+        head_slice = slice(group.ulysses_rank * heads // ulysses, (group.ulysses_rank + 1) * heads // ulysses)
+        if joint_q is not None:
+            q = torch.cat([q, joint_q[:, :, head_slice]], dim=1)
+
+        q = q.transpose(1, 2)
+        scale = q.shape[-1] ** -0.5
+        out = lse = None
+        if joint_k is not None:
+            # Текстовые K/V есть у всех процессов: этот блок без обмена
+            out, lse = _block_attention(
+                q, joint_k[:, :, head_slice].transpose(1, 2), joint_v[:, :, head_slice].transpose(1, 2), scale
+            )
+
+        # Кольцо: пока считается текущий блок, следующий уже передается
+        kv = torch.stack([k.transpose(1, 2), v.transpose(1, 2)]).contiguous()
+        ring = group.config.ring_degree
+        next_rank = group.ring_ranks[(group.ring_rank + 1) % ring]
+        prev_rank = group.ring_ranks[(group.ring_rank - 1) % ring]
+        for step in range(ring):
+            requests = []
+            if step < ring - 1:
+                incoming = torch.empty_like(kv)
+                requests = [
+                    dist.isend(kv, dst=next_rank, group=group.ring_group),
+                    dist.irecv(incoming, src=prev_rank, group=group.ring_group)
+                ]
+            block_out, block_lse = _block_attention(q, kv[0], kv[1], scale)
+            out, lse = _merge(out, lse, block_out, block_lse)
+            for request in requests:
+                request.wait()
+            if requests:
+                kv = incoming
+
+        out = out.to(k.dtype).transpose(1, 2)
+        image_out, text_out = out[:, :image_len], out[:, image_len:]
+        if ulysses > 1:
+            image_out = _gather_heads(image_out, group.ulysses_group, ulysses)
+            if text_out.shape[1]:
+                parts = [torch.empty_like(text_out) for _ in range(ulysses)]
+                dist.all_gather(parts, text_out.contiguous(), group=group.ulysses_group)
+                text_out = torch.cat(parts, dim=2)
+        assert image_out.shape[1] == local_len
+        return torch.cat([image_out, text_out], dim=1)
+
+
+def parallel_attention(
+    hybrid_seq_parallel_attn,
+    q: torch.Tensor,
+    k: torch.Tensor,
+    v: torch.Tensor,
+    img_q_len: int,
+    img_kv_len: int,
+    cu_seqlens_q: torch.Tensor,
+    cu_seqlens_kv: torch.Tensor
+) -> torch.Tensor:
+    """
+    Замена hyvideo.modules.attenion.parallel_attention без flash-attn
+
+    Как и в оригинале: токены видео и значимые текстовые токены внимают
+    друг другу, паддинг текста - только сам себе.
+    """
+    text_q_end = int(cu_seqlens_q[1])
+    text_kv_end = int(cu_seqlens_kv[1])
+    attn = hybrid_seq_parallel_attn(
+        q[:, :img_q_len], k[:, :img_kv_len], v[:, :img_kv_len],
+        joint_q=q[:, img_q_len:text_q_end],
+        joint_k=k[:, img_kv_len:text_kv_end],
+        joint_v=v[:, img_kv_len:text_kv_end]
+    )
+    if q.shape[1] > text_q_end:
+        padding = F.scaled_dot_product_attention(
+            q[:, text_q_end:].transpose(1, 2),
+            k[:, text_kv_end:].transpose(1, 2),
+            v[:, text_kv_end:].transpose(1, 2)
+        ).transpose(1, 2)
+        attn = torch.cat([attn, padding], dim=1)
+    b, s, _, _ = attn.shape
+    return attn.reshape(b, s, -1)
+
+
+def parallelize_transformer(transformer: torch.nn.Module, group: SequenceParallelGroup) -> None:
+    """
+    Деление латентов между процессами в forward DiT
+
+    Латенты [b, c, t, h, w] делятся по высоте (или ширине) с учетом
+    патчей 2x2, вместе с ними - частоты RoPE. Блокам с атрибутом
+    hybrid_seq_parallel_attn назначается SequenceParallelAttention.
+    """
+    attention = SequenceParallelAttention(group)
+    for module in transformer.modules():
+        if hasattr(module, 'hybrid_seq_parallel_attn'):
+            module.hybrid_seq_parallel_attn = attention
+
+    original_forward = transformer.forward
+    world_size = group.world_size
+
+    def forward(x, t, *args, freqs_cos=None, freqs_sin=None, **kwargs):
+        if x.shape[-2] // 2 % world_size == 0:
+            split_dim = -2
+        elif x.shape[-1] // 2 % world_size == 0:
+            split_dim = -1
+        else:
+            raise ValueError(
+                f"Латенты {tuple(x.shape[-2:])} не делятся на {world_size} процессов"
+            )
+        frames, height, width = x.shape[2], x.shape[3] // 2, x.shape[4] // 2
+        x = torch.chunk(x, world_size, dim=split_dim)[group.rank]
+
+        def split_freqs(freqs):
+            if freqs is None:
+                return None
+            dim = freqs.shape[-1]
+            freqs = freqs.reshape(frames, height, width, dim)
+            return torch.chunk(freqs, world_size, dim=split_dim - 1)[group.rank].reshape(-1, dim)
+
+        output = original_forward(
+            x, t, *args, freqs_cos=split_freqs(freqs_cos), freqs_sin=split_freqs(freqs_sin), **kwargs
+        )
+        if isinstance(output, dict):
+            output['x'] = group.all_gather(output['x'], dim=split_dim)
+            return output
+        return group.all_gather(output, dim=split_dim)
+
+    transformer.forward = forward
+
+
+def start_followers(config: ParallelConfig, target: Callable, *args) -> List[multiprocessing.Process]:
+    """
+    Запуск процессов с rank 1..world_size-1
+
+    target(rank, config, *args) выполняется в новом процессе (spawn:
+    ведомые не наследуют память и потоки родителя); rank 0 - вызывающий.
+    """
+    context = multiprocessing.get_context('spawn')
+    processes = []
+    for rank in range(1, config.world_size):
+        process = context.Process(
+            target=target, args=(rank, config, *args), name=f"sequence-parallel-{rank}", daemon=True
+        )
+        process.start()
+        processes.append(process)
+    return processes
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Daur MedIA - Shape Buckets
+Приведение размеров запроса к фиксированному набору корзин
+
+Произвольные ширина, высота и длина видео мешают объединять задачи в
+батчи, переиспользовать скомпилированные графы и буферы памяти. Запрос
+приводится к ближайшей корзине: уровень разрешения (360p/540p/720p) x
+стандартное соотношение сторон x длина вида 4k+1. Размеры корзин
+считаются от площади уровня так же, как таблица разрешений HunyuanVideo
+(720p 16:9 - 1280x720, 4:3 - 1104x832, 1:1 - 960x960 и т.д.).
+
+Некорректные размеры (не числа, вне допустимых пределов, слишком
+вытянутый кадр) отклоняются сразу, до постановки в очередь.
+"""
+
+import os
+import math
+from typing import Any, Dict, Sequence, Tuple
+
+# Размеры кратны 16 (VAE сжимает в 8 раз, патчи DiT - 2x2)
+SIZE_MULTIPLE = 16
+
+DEFAULT_TIERS = ('360p', '540p', '720p')
+DEFAULT_ASPECTS = ('16:9', '9:16', '4:3', '3:4', '1:1')
+DEFAULT_LENGTHS = (17, 33, 49, 65, 97, 129)
+
+# Допустимое отклонение соотношения сторон от ближайшего стандартного
+DEFAULT_ASPECT_TOLERANCE = 1.25
+
+# Запрос больше самой крупной корзины во столько раз по площади отклоняется
+MAX_AREA_FACTOR = 2.0
+
+
+def _parse_tier(name: str) -> float:
+    """Площадь уровня разрешения '<N>p' (кадр 16:9 высотой N)"""
+    if not name.endswith('p') or not name[:-1].isdigit():
+        raise ValueError(f"Уровень разрешения задается как '<высота>p': {name}")
+    height = int(name[:-1])
+    return height * height * 16 / 9
+
+
+def _parse_aspect(name: str) -> float:
+    width, _, height = name.partition(':')
+    if not width.isdigit() or not height.isdigit() or not int(width) or not int(height):
+        raise ValueError(f"Соотношение сторон задается как 'W:H': {name}")
+    return int(width) / int(height)
+
+
+def _round_size(value: float) -> int:
+    return max(SIZE_MULTIPLE, int(round(value / SIZE_MULTIPLE)) * SIZE_MULTIPLE)
+
+
+def _as_int(value: Any, name: str) -> int:
+    if isinstance(value, bool):
+        raise ValueError(f"{name} должно быть целым числом")
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} должно быть целым числом")
+    if not number.is_integer():
+        raise ValueError(f"{name} должно быть целым числом")
+    return int(number)
+
+
+class ShapeBucket:
+    """Корзина: канонические ширина, высота и длина видео"""
+
+    __slots__ = ('width', 'height', 'video_length', 'tier', 'aspect')
+
+    def __init__(self, width: int, height: int, video_length: int, tier: str, aspect: str):
+        self.width = width
+        self.height = height
+        self.video_length = video_length
+        self.tier = tier
+        self.aspect = aspect
+
+    @property
+    def key(self) -> str:
+        """Ключ корзины для кешей и группировки задач"""
+        return f"{self.width}x{self.height}x{self.video_length}"
+
+    def params(self) -> Dict[str, int]:
+        return {
+            'video_width': self.width,
+            'video_height': self.height,
+            'video_length': self.video_length
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.params(), key=self.key, tier=self.tier, aspect=self.aspect)
+
+
+class ShapeBuckets:
+    """Набор корзин и приведение к ним размеров запроса"""
+
+    def __init__(
+        self,
+        tiers: Sequence[str] = DEFAULT_TIERS,
+        aspects: Sequence[str] = DEFAULT_ASPECTS,
+        lengths: Sequence[int] = DEFAULT_LENGTHS,
+        aspect_tolerance: float = DEFAULT_ASPECT_TOLERANCE
+    ):
+        """
+        Args:
+            tiers: Уровни разрешения ('540p', '720p', ...)
+            aspects: Соотношения сторон ('16:9', '1:1', ...)
+            lengths: Допустимые длины видео (4k+1)
+            aspect_tolerance: Во сколько раз соотношение сторон запроса может
+                отличаться от ближайшего стандартного
+        """
+        if not tiers or not aspects or not lengths:
+            raise ValueError("Набор корзин пуст")
+        invalid = [length for length in lengths if length < 1 or (length - 1) % 4]
+        if invalid:
+            raise ValueError(f"Длины видео должны иметь вид 4k+1: {invalid}")
+
+        self.lengths = tuple(sorted(set(lengths)))
+        self.aspect_tolerance = aspect_tolerance
+        self.aspects = {name: _parse_aspect(name) for name in aspects}
+        # (уровень, соотношение) -> (ширина, высота), по возрастанию площади
+        self.sizes: Dict[Tuple[str, str], Tuple[int, int]] = {}
+        for tier in sorted(tiers, key=_parse_tier):
+            area = _parse_tier(tier)
+            for aspect, ratio in self.aspects.items():
+                self.sizes[(tier, aspect)] = (_round_size(math.sqrt(area * ratio)), _round_size(math.sqrt(area / ratio)))
+        self.max_area = max(width * height for width, height in self.sizes.values())
+
+    @classmethod
+    def from_env(cls) -> 'ShapeBuckets':
+        """
+        Корзины из окружения (значения через запятую): DAUR_MEDIA_BUCKET_TIERS,
+        DAUR_MEDIA_BUCKET_ASPECTS, DAUR_MEDIA_BUCKET_LENGTHS
+        """
+        def _list(name, default):
+            value = os.environ.get(name)
+            return [item.strip() for item in value.split(',') if item.strip()] if value else list(default)
+
+        return cls(
+            tiers=_list('DAUR_MEDIA_BUCKET_TIERS', DEFAULT_TIERS),
+            aspects=_list('DAUR_MEDIA_BUCKET_ASPECTS', DEFAULT_ASPECTS),
+            lengths=[int(value) for value in _list('DAUR_MEDIA_BUCKET_LENGTHS', DEFAULT_LENGTHS)]
+        )
+
+    def canonicalize(self, width: Any, height: Any, video_length: Any, round_down: bool = False) -> ShapeBucket:
+        """
+        Корзина для запрошенных размеров
+
+        Args:
+            width: Ширина видео
+            height: Высота видео
+            video_length: Длина видео в кадрах
+            round_down: Не превышать запрошенные размеры (для черновиков
+                и снижения качества); по умолчанию - ближайшая корзина
+
+        Raises:
+            ValueError: размеры некорректны или не приводятся ни к одной корзине
+        """
+        width = _as_int(width, 'video_width')
+        height = _as_int(height, 'video_height')
+        video_length = _as_int(video_length, 'video_length')
+        if width <= 0 or height <= 0:
+            raise ValueError("Ширина и высота видео должны быть положительными")
+        if not 1 <= video_length <= self.lengths[-1]:
+            raise ValueError(f"Длина видео должна быть от 1 до {self.lengths[-1]} кадров")
+
+        ratio = width / height
+        aspect = min(self.aspects, key=lambda name: abs(math.log(ratio / self.aspects[name])))
+        if abs(math.log(ratio / self.aspects[aspect])) > math.log(self.aspect_tolerance):
+            raise ValueError(
+                f"Соотношение сторон {width}x{height} не поддерживается "
+                f"(доступны: {', '.join(self.aspects)})"
+            )
+        area = width * height
+        if area > self.max_area * MAX_AREA_FACTOR:
+            raise ValueError(f"Разрешение {width}x{height} больше максимального для модели")
+
+        candidates = [(tier, size) for (tier, name), size in self.sizes.items() if name == aspect]
+        if round_down:
+            fitting = [item for item in candidates if item[1][0] * item[1][1] <= area]
+            tier, (bucket_width, bucket_height) = fitting[-1] if fitting else candidates[0]
+        else:
+            tier, (bucket_width, bucket_height) = min(
+                candidates, key=lambda item: abs(math.log(item[1][0] * item[1][1] / area))
+            )
+
+        return ShapeBucket(bucket_width, bucket_height, self._snap_length(video_length, round_down), tier, aspect)
+
+    def snap_params(self, params: Dict[str, Any], round_down: bool = False) -> Dict[str, Any]:
+        """Копия параметров генерации с размерами корзины"""
+        return dict(params, **self.bucket_for(params, round_down).params())
+
+    def bucket_for(self, params: Dict[str, Any], round_down: bool = False) -> ShapeBucket:
+        """Корзина для параметров генерации (video_width, video_height, video_length)"""
+        return self.canonicalize(
+            params['video_width'], params['video_height'], params['video_length'], round_down
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'resolutions': [
+                {'tier': tier, 'aspect': aspect, 'video_width': width, 'video_height': height}
+                for (tier, aspect), (width, height) in self.sizes.items()
+            ],
+            'video_lengths': list(self.lengths),
+            'aspect_tolerance': self.aspect_tolerance
+        }
+
+    def _snap_length(self, video_length: int, round_down: bool) -> int:
+        if round_down:
+            fitting = [length for length in self.lengths if length <= video_length]
+            return fitting[-1] if fitting else self.lengths[0]
+        # Ближайшая длина; при равном расстоянии - большая
+        return min(self.lengths, key=lambda length: (abs(length - video_length), -length))
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Daur MedIA - Streaming Decode
+Декодирование латентов VAE по временным тайлам с записью кадров по мере готовности
+
+Пайплайн HunyuanVideo декодирует все латенты одним вызовом vae.decode и
+возвращает видео целиком, поэтому потоковая запись начиналась только
+после VAE. На время потоковой задачи vae.decode подменяется: латенты
+декодируются теми же перекрывающимися временными тайлами, что и в
+temporal_tiled_decode причинного 3D VAE, а кадры каждого тайла после
+смешивания с предыдущим сразу уходят во FragmentedMP4Writer. Первый
+фрагмент появляется после декодирования первого тайла, а не всего видео.
+
+Кадр тайла зависит только от него и предыдущего тайла, поэтому
+результат совпадает с temporal_tiled_decode. Потоковая задача
+декодируется тайлами по времени, даже если план памяти тайлы VAE
+выключил; короткие видео (латентов не больше одного тайла) - одним
+вызовом, как и без подмены.
+"""
+
+import time
+import logging
+from types import SimpleNamespace
+from typing import Any, Dict, Optional
+
+import torch
+
+from video_encoder import FragmentedMP4Writer, iter_frame_chunks
+
+logger = logging.getLogger(__name__)
+
+
+class StreamingDecode:
+    """
+    Подмена vae.decode на время задачи с записью кадров во фрагментированный MP4
+
+    Использование:
+        with StreamingDecode(pipeline.vae, path, fps=24) as stream:
+            outputs = sampler.predict(...)
+    """
+
+    def __init__(self, vae, path: str, fps: int = 24, encode_options: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            vae: VAE пайплайна (AutoencoderKLCausal3D)
+            path: Путь к итоговому файлу
+            fps: Частота кадров
+            encode_options: codec/preset/crf (см. resolve_encode_options)
+        """
+        self.vae = vae
+        self.path = path
+        self.fps = fps
+        self.encode_options = encode_options or {}
+        self._writer: Optional[FragmentedMP4Writer] = None
+        self._started = 0.0
+        self.stats = {'chunks': 0, 'frames': 0, 'first_chunk_seconds': None}
+
+    def __enter__(self) -> 'StreamingDecode':
+        self._started = time.time()
+        # Атрибут экземпляра перекрывает метод класса до выхода из контекста
+        self.vae.decode = self._decode
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        del self.vae.decode
+        if self._writer is None:
+            return
+        if exc_type is None:
+            self._writer.close()
+        else:
+            self._writer.abort()
+
+    def _decode(self, z, return_dict: bool = True, generator=None):
+        """Замена vae.decode: латенты (b, c, t, h, w), уже деленные на scaling_factor"""
+        vae = self.vae
+        tile_size = getattr(vae, 'tile_latent_min_tsize', None)
+        if tile_size is None or z.dim() != 5 or z.shape[2] <= tile_size:
+            decoded = type(vae).decode(vae, z, return_dict=False)[0]
+            self._emit(decoded)
+            return self._output(decoded, return_dict)
+
+        overlap_size = int(tile_size * (1 - vae.tile_overlap_factor))
+        blend_extent = int(vae.tile_sample_min_tsize * vae.tile_overlap_factor)
+        t_limit = vae.tile_sample_min_tsize - blend_extent
+        chunks = []
+        previous = None
+        for start in range(0, z.shape[2], overlap_size):
+            tile = z[:, :, start:start + tile_size + 1]
+            decoded = self._decode_tile(tile)
+            if previous is None:
+                chunk = decoded[:, :, :t_limit + 1]
+            else:
+                # Смешивание на месте: следующий тайл, как и в temporal_tiled_decode,
+                # смешивается с уже смешанным предыдущим
+                decoded = vae.blend_t(previous, decoded[:, :, 1:], blend_extent)
+                chunk = decoded[:, :, :t_limit]
+            previous = decoded
+            self._emit(chunk)
+            chunks.append(chunk)
+        return self._output(torch.cat(chunks, dim=2), return_dict)
+
+    def _decode_tile(self, tile):
+        vae = self.vae
+        if vae.use_spatial_tiling and (
+            tile.shape[-1] > vae.tile_latent_min_size or tile.shape[-2] > vae.tile_latent_min_size
+        ):
+            return vae.spatial_tiled_decode(tile, return_dict=True).sample
+        return vae.decoder(vae.post_quant_conv(tile))
+
+    def _emit(self, chunk) -> None:
+        """Запись кадров чанка (значения в [-1, 1], как у выхода VAE)"""
+        frames = (chunk.detach() / 2 + 0.5).clamp(0, 1).cpu().float()
+        if self._writer is None:
+            self._writer = FragmentedMP4Writer(
+                self.path, frames.shape[-1], frames.shape[-2], fps=self.fps, **self.encode_options
+            )
+        for part in iter_frame_chunks(frames):
+            self._writer.write(part)
+        self.stats['chunks'] += 1
+        self.stats['frames'] += frames.shape[2]
+        if self.stats['first_chunk_seconds'] is None:
+            self.stats['first_chunk_seconds'] = round(time.time() - self._started, 2)
+            logger.info(f"Первые {frames.shape[2]} кадров записаны: {self.path}")
+
+    @staticmethod
+    def _output(decoded, return_dict: bool):
+        if return_dict:
+            return SimpleNamespace(sample=decoded)
+        return (decoded,)
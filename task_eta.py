@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Daur MedIA - Task ETA
+Прогноз позиции в очереди, времени начала и завершения задач
+
+Задачи генерации выполняют несколько воркеров параллельно: каждая
+задача очереди в порядке поступления достается воркеру, который
+освободится раньше остальных (с учетом оставшегося времени выполняемых
+задач). Диспетчер может отдать воркеру прогретую задачу вне очереди,
+поэтому порядок - приближение, а суммарная загрузка воркеров - нет.
+Оценки берутся из CostModel на момент запроса, так что прогноз
+уточняется по мере калибровки модели.
+"""
+
+import heapq
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def predict_schedule(
+    running: Iterable,
+    queued: Iterable,
+    estimate: Callable[[Any], float],
+    now: Optional[datetime] = None,
+    workers: int = 1
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Прогноз для выполняемых и ожидающих задач
+
+    Args:
+        running: Выполняемые задачи (TaskRecord)
+        queued: Задачи в очереди в порядке выполнения
+        estimate: Оценка длительности задачи в секундах
+        now: Текущее время (для тестов)
+        workers: Число воркеров, получающих задачи
+
+    Returns:
+        Dict task_id -> queue_position, predicted_start, predicted_finish,
+        estimated_seconds, eta_seconds (время - в ISO-формате)
+    """
+    return simulate_schedule(running, queued, estimate, now, workers)[0]
+
+
+def simulate_schedule(
+    running: Iterable,
+    queued: Iterable,
+    estimate: Callable[[Any], float],
+    now: Optional[datetime] = None,
+    workers: int = 1
+) -> Tuple[Dict[str, Dict[str, Any]], datetime]:
+    """
+    Прогноз задач и время, когда воркер освободится для новой задачи
+
+    Args: как у predict_schedule
+
+    Returns:
+        (прогноз по задачам, начало задачи, поставленной в конец очереди)
+    """
+    now = now or datetime.now()
+    schedule = {}
+    # Время освобождения каждого воркера
+    free_at = []
+
+    for task in running:
+        seconds = estimate(task)
+        started = _parse_time(task.started_at) or now
+        finish = started + timedelta(seconds=seconds)
+        schedule[task.id] = _entry(0, started, finish, seconds, now)
+        # Задача, вышедшая за оценку, считается завершающейся сейчас
+        free_at.append(max(now, finish))
+
+    # Выполняемых задач может быть больше воркеров (выводимый воркер
+    # дорабатывает задачу), но новые задачи берут только workers из них
+    workers = max(workers, 1)
+    free_at = heapq.nsmallest(workers, free_at) + [now] * max(0, workers - len(free_at))
+    heapq.heapify(free_at)
+
+    for position, task in enumerate(queued, start=1):
+        seconds = estimate(task)
+        start = heapq.heappop(free_at)
+        finish = start + timedelta(seconds=seconds)
+        schedule[task.id] = _entry(position, start, finish, seconds, now)
+        heapq.heappush(free_at, finish)
+
+    return schedule, free_at[0]
+
+
+def _entry(position: int, start: datetime, finish: datetime, seconds: float, now: datetime) -> Dict[str, Any]:
+    return {
+        'queue_position': position,
+        'predicted_start': start.isoformat(),
+        'predicted_finish': finish.isoformat(),
+        'estimated_seconds': round(seconds, 1),
+        'eta_seconds': round(max(0.0, (finish - now).total_seconds()), 1),
+        'overdue': finish < now
+    }
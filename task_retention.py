@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Daur MedIA - Task Retention
+Политика хранения задач и фоновый сборщик старых задач и видеофайлов
+"""
+
+import os
+import threading
+import time
+import logging
+from datetime import datetime
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Статусы, задачи в которых можно удалять (активные задачи не трогаем)
+EVICTABLE_STATUSES = ('completed', 'failed')
+
+# Файлы без задачи моложе этого возраста не трогаем: их может еще писать воркер
+ORPHAN_GRACE_SECONDS = 3600
+
+
+class RetentionPolicy:
+    """Ограничения на хранение задач: по возрасту, количеству и объему"""
+
+    def __init__(
+        self,
+        max_age_seconds: Optional[float] = 24 * 3600,
+        max_tasks: Optional[int] = 500,
+        max_total_bytes: Optional[int] = 20 * 1024**3,
+        batch_size: int = 20,
+        interval: float = 60.0
+    ):
+        """
+        Args:
+            max_age_seconds: Максимальный возраст завершенной задачи (None - без ограничения)
+            max_tasks: Максимальное число завершенных задач (None - без ограничения)
+            max_total_bytes: Максимальный объем видеофайлов (None - без ограничения)
+            batch_size: Сколько задач удаляется за один проход
+            interval: Пауза между проходами в секундах
+        """
+        self.max_age_seconds = max_age_seconds
+        self.max_tasks = max_tasks
+        self.max_total_bytes = max_total_bytes
+        self.batch_size = batch_size
+        self.interval = interval
+
+    @classmethod
+    def from_env(cls) -> 'RetentionPolicy':
+        """Создание политики из переменных окружения DAUR_MEDIA_RETENTION_*"""
+        def _get(name, cast, default):
+            value = os.environ.get(f'DAUR_MEDIA_RETENTION_{name}')
+            if value is None:
+                return default
+            if value.lower() in ('', 'none', 'off', '0'):
+                return None
+            return cast(value)
+
+        max_age_hours = _get('MAX_AGE_HOURS', float, 24.0)
+        max_gb = _get('MAX_GB', float, 20.0)
+        return cls(
+            max_age_seconds=max_age_hours * 3600 if max_age_hours is not None else None,
+            max_tasks=_get('MAX_TASKS', int, 500),
+            max_total_bytes=int(max_gb * 1024**3) if max_gb is not None else None,
+            batch_size=_get('BATCH_SIZE', int, 20) or 20,
+            interval=_get('INTERVAL', float, 60.0) or 60.0
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Политика в виде словаря для API"""
+        return {
+            'max_age_seconds': self.max_age_seconds,
+            'max_tasks': self.max_tasks,
+            'max_total_bytes': self.max_total_bytes,
+            'batch_size': self.batch_size,
+            'interval': self.interval
+        }
+
+
+class TaskGarbageCollector:
+    """
+    Фоновый сборщик задач
+
+    Доступ к хранилищу задач идет через функции list_tasks/remove_task,
+    поэтому сборщик не зависит от того, как именно хранятся задачи.
+    За один проход удаляется не больше batch_size записей, чтобы
+    не держать блокировку хранилища и диск подолгу.
+    """
+
+    def __init__(
+        self,
+        list_tasks: Callable[[], List[Dict[str, Any]]],
+        remove_task: Callable[[str], Optional[Dict[str, Any]]],
+        policy: RetentionPolicy,
+        output_dir: str = './generated_videos'
+    ):
+        """
+        Args:
+            list_tasks: Функция, возвращающая список задач (словари с id, status, created_at, ...)
+            remove_task: Функция удаления задачи по id
+            policy: Политика хранения
+            output_dir: Директория с видеофайлами
+        """
+        self.list_tasks = list_tasks
+        self.remove_task = remove_task
+        self.policy = policy
+        self.output_dir = output_dir
+
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._metrics_lock = threading.Lock()
+        self.metrics = {
+            'runs': 0,
+            'evicted_tasks': 0,
+            'deleted_files': 0,
+            'orphan_files_deleted': 0,
+            'reclaimed_bytes': 0,
+            'tracked_tasks': 0,
+            'tracked_bytes': 0,
+            'last_run_at': None,
+            'last_run_duration': 0.0
+        }
+
+    def start(self) -> None:
+        """Запуск фонового потока"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='task-gc')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Остановка фонового потока"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Снимок метрик сборщика"""
+        with self._metrics_lock:
+            metrics = dict(self.metrics)
+        metrics['policy'] = self.policy.to_dict()
+        return metrics
+
+    def collect_once(self) -> int:
+        """
+        Один проход сборщика
+
+        Returns:
+            int: количество удаленных записей (задач и файлов-сирот)
+        """
+        started = time.time()
+        candidates, total_tasks, total_bytes = self._scan(started)
+        victims = self._select(candidates, total_bytes, started)
+
+        evicted = deleted = orphans = reclaimed = 0
+        for item in victims:
+            if item['task_id'] is not None:
+                if self.remove_task(item['task_id']) is None:
+                    continue
+                evicted += 1
+            if item['path'] and self._owns(item['path']):
+                freed = _remove_file(item['path'])
+                if freed is not None:
+                    reclaimed += freed
+                    if item['task_id'] is None:
+                        orphans += 1
+                    else:
+                        deleted += 1
+
+        with self._metrics_lock:
+            self.metrics['runs'] += 1
+            self.metrics['evicted_tasks'] += evicted
+            self.metrics['deleted_files'] += deleted
+            self.metrics['orphan_files_deleted'] += orphans
+            self.metrics['reclaimed_bytes'] += reclaimed
+            self.metrics['tracked_tasks'] = total_tasks - evicted
+            self.metrics['tracked_bytes'] = total_bytes - reclaimed
+            self.metrics['last_run_at'] = datetime.now().isoformat()
+            self.metrics['last_run_duration'] = round(time.time() - started, 4)
+
+        if evicted or orphans:
+            logger.info(
+                f"Очистка задач: удалено задач={evicted}, файлов-сирот={orphans}, "
+                f"освобождено={reclaimed / 1024**2:.1f} MB"
+            )
+        return evicted + orphans
+
+    def _owns(self, path: str) -> bool:
+        """Удаляем только файлы внутри output_dir"""
+        root = os.path.abspath(self.output_dir)
+        return os.path.commonpath([root, os.path.abspath(path)]) == root
+
+    def _scan(self, now: float) -> Tuple[List[Dict[str, Any]], int, int]:
+        """Сбор кандидатов на удаление и общего объема файлов"""
+        candidates = []
+        referenced = set()
+        total_bytes = 0
+
+        tasks = self.list_tasks()
+        for task in tasks:
+            path = task.get('output_path')
+            size = _file_size(path)
+            if path:
+                referenced.add(os.path.abspath(path))
+            total_bytes += size
+            if task.get('status') not in EVICTABLE_STATUSES:
+                continue
+            candidates.append({
+                'task_id': task['id'],
+                'path': path,
+                'size': size,
+                'timestamp': _parse_timestamp(task.get('completed_at') or task.get('created_at'), now)
+            })
+
+        # Файлы без задачи (например, оставшиеся после перезапуска сервера)
+        if os.path.isdir(self.output_dir):
+            for entry in os.scandir(self.output_dir):
+                if not entry.is_file() or os.path.abspath(entry.path) in referenced:
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                total_bytes += stat.st_size
+                if now - stat.st_mtime < ORPHAN_GRACE_SECONDS:
+                    continue
+                candidates.append({
+                    'task_id': None,
+                    'path': entry.path,
+                    'size': stat.st_size,
+                    'timestamp': stat.st_mtime
+                })
+
+        candidates.sort(key=lambda item: item['timestamp'])
+        return candidates, len(tasks), total_bytes
+
+    def _select(self, candidates, total_bytes: int, now: float) -> List[Dict[str, Any]]:
+        """Выбор жертв по политике (самые старые первыми)"""
+        policy = self.policy
+        task_count = sum(1 for item in candidates if item['task_id'] is not None)
+        victims = []
+
+        for item in candidates:
+            expired = policy.max_age_seconds is not None and now - item['timestamp'] > policy.max_age_seconds
+            over_count = (
+                policy.max_tasks is not None and item['task_id'] is not None
+                and task_count > policy.max_tasks
+            )
+            over_bytes = policy.max_total_bytes is not None and total_bytes > policy.max_total_bytes
+            if not (expired or over_count or over_bytes):
+                continue
+
+            victims.append(item)
+            total_bytes -= item['size']
+            if item['task_id'] is not None:
+                task_count -= 1
+            if len(victims) >= policy.batch_size:
+                break
+
+        return victims
+
+    def _run(self) -> None:
+        """Цикл фонового потока"""
+        while not self._stop_event.is_set():
+            try:
+                removed = self.collect_once()
+            except Exception as e:
+                logger.error(f"Ошибка сборщика задач: {e}")
+                removed = 0
+            # Если пакет заполнен целиком, скорее всего есть еще что удалять
+            delay = 1.0 if removed >= self.policy.batch_size else self.policy.interval
+            self._stop_event.wait(delay)
+
+
+def _file_size(path: Optional[str]) -> int:
+    """Размер файла или 0, если его нет"""
+    if not path:
+        return 0
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _remove_file(path: str) -> Optional[int]:
+    """Удаление файла, возвращает освобожденный объем или None"""
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+        return size
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        logger.warning(f"Не удалось удалить файл {path}: {e}")
+        return None
+
+
+def _parse_timestamp(value: Optional[str], default: float) -> float:
+    """ISO-время задачи в unix timestamp"""
+    if not value:
+        return default
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return default
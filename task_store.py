@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Daur MedIA - Task Store
+Компактные записи задач и хранилище со снимками copy-on-write
+
+Писатели (воркеры) работают под общей блокировкой и на каждое изменение
+собирают новый снимок. Читатели берут текущий снимок без блокировки:
+замена ссылки на снимок атомарна, а сами снимки и записи неизменяемы.
+"""
+
+import threading
+from enum import Enum
+from types import MappingProxyType
+from typing import Any, Dict, Iterator, List, Optional
+
+
+class TaskStatus(str, Enum):
+    """Статусы задачи (единственный экземпляр строки на статус)"""
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+    TESTING = 'testing'
+
+    def __str__(self) -> str:
+        return self.value
+
+
+class TaskRecord:
+    """Неизменяемая запись задачи генерации"""
+
+    __slots__ = (
+        'id', 'prompt', 'video_width', 'video_height', 'video_length',
+        'infer_steps', 'cfg_scale', 'seed', 'status', 'created_at',
+        'started_at', 'completed_at', 'output_path', 'error', 'platform',
+        'stream_path', 'encode_options', 'mode', 'parent_id', 'refine_params',
+        'profile', 'estimated_seconds', 'deadline', 'deadline_bounds', 'degradation',
+        'memory_mode', 'model', 'shape_bucket'
+    )
+
+    # Поля, которые попадают в JSON только если заданы
+    OPTIONAL_FIELDS = (
+        'started_at', 'completed_at', 'output_path', 'error', 'platform', 'stream_path',
+        'encode_options', 'mode', 'parent_id', 'refine_params',
+        'profile', 'estimated_seconds', 'deadline', 'deadline_bounds', 'degradation',
+        'memory_mode', 'model', 'shape_bucket'
+    )
+
+    def __init__(
+        self,
+        id: str,
+        prompt: str,
+        video_width: int = 1280,
+        video_height: int = 720,
+        video_length: int = 129,
+        infer_steps: int = 50,
+        cfg_scale: float = 6.0,
+        seed: Optional[int] = None,
+        status: TaskStatus = TaskStatus.PENDING,
+        created_at: Optional[str] = None,
+        started_at: Optional[str] = None,
+        completed_at: Optional[str] = None,
+        output_path: Optional[str] = None,
+        error: Optional[str] = None,
+        platform: Optional[str] = None,
+        stream_path: Optional[str] = None,
+        encode_options: Optional[Dict[str, Any]] = None,
+        mode: Optional[str] = None,
+        parent_id: Optional[str] = None,
+        refine_params: Optional[Dict[str, Any]] = None,
+        profile: Optional[str] = None,
+        estimated_seconds: Optional[float] = None,
+        deadline: Optional[str] = None,
+        deadline_bounds: Optional[Dict[str, Any]] = None,
+        degradation: Optional[Dict[str, Any]] = None,
+        memory_mode: Optional[str] = None,
+        model: Optional[str] = None,
+        shape_bucket: Optional[str] = None
+    ):
+        _set = object.__setattr__
+        _set(self, 'id', id)
+        _set(self, 'prompt', prompt)
+        _set(self, 'video_width', video_width)
+        _set(self, 'video_height', video_height)
+        _set(self, 'video_length', video_length)
+        _set(self, 'infer_steps', infer_steps)
+        _set(self, 'cfg_scale', cfg_scale)
+        _set(self, 'seed', seed)
+        _set(self, 'status', TaskStatus(status))
+        _set(self, 'created_at', created_at)
+        _set(self, 'started_at', started_at)
+        _set(self, 'completed_at', completed_at)
+        _set(self, 'output_path', output_path)
+        _set(self, 'error', error)
+        _set(self, 'platform', platform)
+        _set(self, 'stream_path', stream_path)
+        _set(self, 'encode_options', encode_options)
+        _set(self, 'mode', mode)
+        _set(self, 'parent_id', parent_id)
+        _set(self, 'refine_params', refine_params)
+        _set(self, 'profile', profile)
+        _set(self, 'estimated_seconds', estimated_seconds)
+        _set(self, 'deadline', deadline)
+        _set(self, 'deadline_bounds', deadline_bounds)
+        _set(self, 'degradation', degradation)
+        _set(self, 'memory_mode', memory_mode)
+        _set(self, 'model', model)
+        _set(self, 'shape_bucket', shape_bucket)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("TaskRecord неизменяем, используйте replace()")
+
+    def __getitem__(self, name: str) -> Any:
+        """Доступ как к словарю (совместимость со старым кодом)"""
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            raise KeyError(name)
+
+    def get(self, name: str, default: Any = None) -> Any:
+        """Аналог dict.get"""
+        value = getattr(self, name, None)
+        return default if value is None else value
+
+    def replace(self, **changes) -> 'TaskRecord':
+        """Копия записи с измененными полями"""
+        fields = {name: getattr(self, name) for name in self.__slots__}
+        fields.update(changes)
+        return TaskRecord(**fields)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Запись в виде словаря для JSON"""
+        data = {}
+        for name in self.__slots__:
+            value = getattr(self, name)
+            if value is None and name in self.OPTIONAL_FIELDS:
+                continue
+            data[name] = value.value if name == 'status' else value
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'TaskRecord':
+        """Создание записи из словаря (лишние ключи игнорируются)"""
+        return cls(**{k: v for k, v in data.items() if k in cls.__slots__})
+
+
+class TaskSnapshot:
+    """Неизменяемый снимок всех задач"""
+
+    __slots__ = ('version', 'records', '_sorted_dicts')
+
+    def __init__(self, version: int, records: Dict[str, TaskRecord]):
+        self.version = version
+        self.records = MappingProxyType(records)
+        self._sorted_dicts = None
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __iter__(self) -> Iterator[TaskRecord]:
+        return iter(self.records.values())
+
+    def get(self, task_id: str) -> Optional[TaskRecord]:
+        return self.records.get(task_id)
+
+    def as_sorted_dicts(self) -> List[Dict[str, Any]]:
+        """
+        Задачи в виде словарей, новые сначала
+
+        Результат кешируется в снимке: пока нет записей, все опросы
+        списка задач получают один и тот же готовый список.
+        """
+        cached = self._sorted_dicts
+        if cached is None:
+            cached = [record.to_dict() for record in self.records.values()]
+            cached.sort(key=lambda x: x['created_at'] or '', reverse=True)
+            self._sorted_dicts = cached
+        return cached
+
+
+class TaskStore:
+    """Хранилище задач с copy-on-write снимками для читателей"""
+
+    def __init__(self):
+        self._write_lock = threading.Lock()
+        self._snapshot = TaskSnapshot(0, {})
+
+    def snapshot(self) -> TaskSnapshot:
+        """Текущий снимок (без блокировки)"""
+        return self._snapshot
+
+    def get(self, task_id: str) -> Optional[TaskRecord]:
+        """Запись задачи из текущего снимка"""
+        return self._snapshot.records.get(task_id)
+
+    def __contains__(self, task_id: str) -> bool:
+        return task_id in self._snapshot.records
+
+    def __len__(self) -> int:
+        return len(self._snapshot)
+
+    def add(self, record: TaskRecord) -> TaskRecord:
+        """Добавление задачи"""
+        with self._write_lock:
+            records = dict(self._snapshot.records)
+            records[record.id] = record
+            self._publish(records)
+        return record
+
+    def update(self, task_id: str, **changes) -> Optional[TaskRecord]:
+        """
+        Изменение полей задачи
+
+        Returns:
+            Новая запись или None, если задачи нет
+        """
+        with self._write_lock:
+            current = self._snapshot.records.get(task_id)
+            if current is None:
+                return None
+            record = current.replace(**changes)
+            records = dict(self._snapshot.records)
+            records[task_id] = record
+            self._publish(records)
+        return record
+
+    def remove(self, task_id: str) -> Optional[TaskRecord]:
+        """Удаление задачи, возвращает удаленную запись или None"""
+        with self._write_lock:
+            if task_id not in self._snapshot.records:
+                return None
+            records = dict(self._snapshot.records)
+            record = records.pop(task_id)
+            self._publish(records)
+        return record
+
+    def _publish(self, records: Dict[str, TaskRecord]) -> None:
+        """Атомарная замена снимка (вызывается под _write_lock)"""
+        self._snapshot = TaskSnapshot(self._snapshot.version + 1, records)
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Черновик со сроком: план срока строится от параметров черновика, а
+доработка сохраняет полное качество
+"""
+
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DAUR_MEDIA_COST_HISTORY', os.path.join(tempfile.mkdtemp(), 'cost_history.json'))
+
+import daur_media_web  # noqa: E402
+
+SHAPE = ('video_width', 'video_height', 'video_length', 'infer_steps')
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # Задачи только ставятся в очередь, без запуска воркеров генерации
+    monkeypatch.setattr(daur_media_web, 'ensure_generation_worker', lambda: None)
+    return daur_media_web.app.test_client()
+
+
+def test_draft_with_deadline_keeps_draft_shape(client):
+    deadline = (datetime.now() + timedelta(days=1)).isoformat()
+    response = client.post('/api/generate', json={'prompt': 'test', 'mode': 'draft', 'deadline': deadline})
+    assert response.status_code == 200
+    task_id = response.get_json()['task_id']
+    record = daur_media_web.task_store.get(task_id)
+    draft = {name: record[name] for name in SHAPE}
+
+    assert draft['infer_steps'] < 50
+    assert draft['video_width'] < 1280
+    assert record.deadline_bounds['requested'] == draft
+
+    # Пересчет в момент начала не возвращает задачу к полному качеству
+    replanned = daur_media_web.replan_for_deadline(record)
+    assert {name: replanned[name] for name in SHAPE} == draft
+
+    refine = record.refine_params
+    assert (refine['video_width'], refine['video_height'], refine['video_length'], refine['infer_steps']) == (1280, 720, 129, 50)
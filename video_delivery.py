@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Daur MedIA - Video Delivery
+Отдача видеофайлов с поддержкой Range, условных запросов и offload на веб-сервер
+
+Режимы отдачи:
+- X-Accel-Redirect (nginx): задается DAUR_MEDIA_ACCEL_REDIRECT (префикс internal location)
+  и DAUR_MEDIA_ACCEL_ROOT (директория, которую этот location отдает)
+- X-Sendfile (Apache/lighttpd): DAUR_MEDIA_X_SENDFILE=1
+- Иначе файл отдает сам Flask: Range/206, ETag и Last-Modified с 304,
+  а полный файл уходит через wsgi.file_wrapper (os.sendfile в gunicorn)
+"""
+
+import os
+from typing import Optional
+from urllib.parse import quote
+
+from flask import Response, current_app, request, send_file
+
+VIDEO_MIMETYPE = 'video/mp4'
+
+# Готовые видео не меняются, поэтому кешировать их можно долго
+DEFAULT_MAX_AGE = 24 * 3600
+
+
+def configure_video_delivery(app) -> None:
+    """Настройка приложения из переменных окружения"""
+    app.config.setdefault('VIDEO_ACCEL_REDIRECT', os.environ.get('DAUR_MEDIA_ACCEL_REDIRECT'))
+    app.config.setdefault('VIDEO_ACCEL_ROOT', os.environ.get('DAUR_MEDIA_ACCEL_ROOT'))
+    if os.environ.get('DAUR_MEDIA_X_SENDFILE') == '1':
+        app.config['USE_X_SENDFILE'] = True
+
+
+def wants_inline() -> bool:
+    """Запрошен ли просмотр в браузере вместо скачивания (?inline=1)"""
+    return request.args.get('inline', '').lower() in ('1', 'true', 'yes')
+
+
+def send_video(
+    path: str,
+    download_name: str,
+    inline: Optional[bool] = None,
+    max_age: int = DEFAULT_MAX_AGE
+) -> Response:
+    """
+    Отдача видеофайла
+
+    Args:
+        path: Путь к файлу
+        download_name: Имя файла для Content-Disposition
+        inline: Отдать для просмотра (True) или как вложение (False);
+            по умолчанию определяется параметром запроса ?inline=1
+        max_age: Время кеширования в секундах
+
+    Returns:
+        Response (200, 206, 304 или 416)
+    """
+    if inline is None:
+        inline = wants_inline()
+
+    accel_response = _accel_redirect(path, download_name, inline, max_age)
+    if accel_response is not None:
+        return accel_response
+
+    response = send_file(
+        path,
+        mimetype=VIDEO_MIMETYPE,
+        as_attachment=not inline,
+        download_name=download_name,
+        conditional=True,
+        etag=True,
+        max_age=max_age
+    )
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def _accel_redirect(path: str, download_name: str, inline: bool, max_age: int) -> Optional[Response]:
+    """
+    Передача файла nginx через X-Accel-Redirect
+
+    nginx сам обрабатывает Range и условные запросы и отдает файл через
+    sendfile, поток Flask освобождается сразу после ответа.
+    """
+    prefix = current_app.config.get('VIDEO_ACCEL_REDIRECT')
+    root = current_app.config.get('VIDEO_ACCEL_ROOT')
+    if not prefix or not root:
+        return None
+
+    root = os.path.abspath(root)
+    full_path = os.path.abspath(path)
+    if os.path.commonpath([root, full_path]) != root:
+        return None
+
+    relative = os.path.relpath(full_path, root).replace(os.sep, '/')
+    disposition = 'inline' if inline else 'attachment'
+
+    response = Response(status=200, mimetype=VIDEO_MIMETYPE)
+    response.headers['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(relative)
+    response.headers['Content-Disposition'] = (
+        f"{disposition}; filename*=UTF-8''{quote(download_name)}"
+    )
+    response.headers['Cache-Control'] = f'public, max-age={max_age}'
+    return response
@@ -0,0 +1,485 @@
+#!/usr/bin/env python3
+"""
+Daur MedIA - Video Encoder
+Кодирование кадров в MP4 по мере их готовности
+
+Вместо save_videos_grid, которая переводит в uint8 весь тензор видео
+сразу, кадры конвертируются и кодируются чанками фиксированного размера
+через заранее выделенные буферы, так что пиковая память не зависит
+от длины видео.
+"""
+
+import os
+import math
+import time
+import shutil
+import tempfile
+import resource
+import subprocess
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Сколько кадров конвертируется и кодируется за раз
+DEFAULT_CHUNK_FRAMES = 16
+
+SUPPORTED_CODECS = ('libx264', 'libx265')
+CODEC_PRESETS = (
+    'ultrafast', 'superfast', 'veryfast', 'faster', 'fast',
+    'medium', 'slow', 'slower', 'veryslow'
+)
+
+# Профили кодирования: быстрый предпросмотр, по умолчанию и архивное качество
+ENCODE_PROFILES = {
+    'preview': {'codec': 'libx264', 'preset': 'ultrafast', 'crf': 30},
+    'balanced': {'codec': 'libx264', 'preset': 'veryfast', 'crf': 23},
+    'archival': {'codec': 'libx265', 'preset': 'slow', 'crf': 20}
+}
+
+
+def get_ffmpeg_exe() -> str:
+    """Путь к ffmpeg (из imageio-ffmpeg, иначе из PATH)"""
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except (ImportError, RuntimeError):
+        return 'ffmpeg'
+
+
+def resolve_encode_options(
+    profile: Optional[str] = None,
+    codec: Optional[str] = None,
+    preset: Optional[str] = None,
+    crf: Optional[int] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Параметры кодирования из профиля и явных значений запроса
+
+    Returns:
+        dict с codec/preset/crf или None, если ничего не задано
+        (тогда используется кодирование по умолчанию через imageio)
+
+    Raises:
+        ValueError: неизвестный профиль, кодек, пресет или CRF вне диапазона
+    """
+    if profile is None and codec is None and preset is None and crf is None:
+        return None
+
+    if profile is not None and profile not in ENCODE_PROFILES:
+        raise ValueError(f"Неизвестный профиль кодирования: {profile}")
+    options = dict(ENCODE_PROFILES[profile or 'balanced'])
+
+    if codec is not None:
+        if codec not in SUPPORTED_CODECS:
+            raise ValueError(f"Неподдерживаемый кодек: {codec}")
+        options['codec'] = codec
+    if preset is not None:
+        if preset not in CODEC_PRESETS:
+            raise ValueError(f"Неизвестный пресет: {preset}")
+        options['preset'] = preset
+    if crf is not None:
+        try:
+            crf = int(crf)
+        except (TypeError, ValueError):
+            raise ValueError("CRF должен быть в диапазоне 0-51")
+        if not 0 <= crf <= 51:
+            raise ValueError("CRF должен быть в диапазоне 0-51")
+        options['crf'] = crf
+    return options
+
+
+def _codec_args(codec: str, preset: str, crf: int, gop: int, threads: Optional[int] = None) -> List[str]:
+    """Аргументы ffmpeg для кодека с фиксированным закрытым GOP"""
+    args = [
+        '-c:v', codec, '-preset', preset, '-crf', str(crf),
+        '-pix_fmt', 'yuv420p', '-g', str(gop)
+    ]
+    if codec == 'libx265':
+        args += ['-x265-params', f'keyint={gop}:min-keyint={gop}:scenecut=0:log-level=error', '-tag:v', 'hvc1']
+    else:
+        args += ['-keyint_min', str(gop), '-sc_threshold', '0']
+    if threads:
+        args += ['-threads', str(threads)]
+    return args
+
+
+def extract_video(outputs):
+    """
+    Тензор видео из результата HunyuanVideoSampler.predict
+
+    predict возвращает словарь с ключом 'samples' (b, c, t, h, w);
+    тензор передается как есть.
+    """
+    if isinstance(outputs, dict):
+        return outputs['samples']
+    return outputs
+
+
+class FrameConverter:
+    """
+    Перевод чанков кадров в uint8 через ограниченные буферы
+
+    Арифметика повторяет save_videos_grid (clamp, * 255, усечение
+    до uint8), поэтому результат совпадает побитово.
+    """
+
+    def __init__(self, channels: int, height: int, width: int, dtype, chunk_frames: int = DEFAULT_CHUNK_FRAMES):
+        import torch
+
+        self.chunk_frames = chunk_frames
+        self._scratch = torch.empty((chunk_frames, height, width, channels), dtype=dtype)
+        self._out = np.empty((chunk_frames, height, width, channels), dtype=np.uint8)
+
+    @property
+    def buffer_bytes(self) -> int:
+        """Объем буферов конвертера в байтах"""
+        return self._scratch.element_size() * self._scratch.nelement() + self._out.nbytes
+
+    def convert(self, chunk, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Конвертация чанка (c, t, h, w) в кадры (t, h, w, c) uint8
+
+        Args:
+            chunk: Чанк кадров
+            out: Куда записать результат; по умолчанию во внутренний буфер,
+                который перезаписывается следующим вызовом
+        """
+        count = chunk.shape[1]
+        scratch = self._scratch[:count]
+        scratch.copy_(chunk.permute(1, 2, 3, 0))
+        scratch.clamp_(0, 1).mul_(255)
+        if out is None:
+            out = self._out[:count]
+        np.copyto(out, scratch.numpy(), casting='unsafe')
+        return out
+
+
+def iter_frame_chunks(video, chunk_frames: int = DEFAULT_CHUNK_FRAMES) -> Iterator[np.ndarray]:
+    """
+    Нарезка видео на временные чанки uint8 кадров
+
+    Args:
+        video: Тензор (b, c, t, h, w) или (c, t, h, w) со значениями в [0, 1]
+        chunk_frames: Кадров в чанке
+
+    Yields:
+        np.ndarray формы (t, h, w, c) dtype uint8 (буфер переиспользуется)
+    """
+    if video.dim() == 5:
+        if video.shape[0] != 1:
+            raise ValueError("Потоковая запись поддерживает только одно видео в батче")
+        video = video[0]
+    channels, total, height, width = video.shape
+    converter = FrameConverter(channels, height, width, video.dtype, min(chunk_frames, total))
+    for start in range(0, total, chunk_frames):
+        yield converter.convert(video[:, start:start + chunk_frames])
+
+
+def video_to_uint8(video, out: np.ndarray, chunk_frames: int = DEFAULT_CHUNK_FRAMES) -> np.ndarray:
+    """
+    Конвертация всего видео в готовый массив (t, h, w, c) uint8 по чанкам
+
+    Используется, когда кадры нужно передать дальше целиком (например,
+    в разделяемую память для процесса-кодировщика).
+    """
+    if video.dim() == 5:
+        video = video[0]
+    channels, total, height, width = video.shape
+    converter = FrameConverter(channels, height, width, video.dtype, min(chunk_frames, total))
+    for start in range(0, total, chunk_frames):
+        converter.convert(video[:, start:start + chunk_frames], out=out[start:start + chunk_frames])
+    return out
+
+
+def write_frames(frames, path: str, fps: int = 24) -> int:
+    """
+    Запись последовательности кадров uint8 через imageio-ffmpeg
+
+    Порядок и способ передачи кадров те же, что в imageio.mimsave.
+
+    Args:
+        frames: Итерируемые кадры (h, w, c) или чанки (t, h, w, c)
+        path: Путь к файлу
+        fps: Частота кадров
+
+    Returns:
+        int: количество записанных кадров
+    """
+    import imageio
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    count = 0
+    with imageio.get_writer(path, fps=fps) as writer:
+        for item in frames:
+            batch = item if item.ndim == 4 else item[None]
+            for frame in batch:
+                writer.append_data(frame)
+            count += len(batch)
+    return count
+
+
+def save_video_streaming(
+    video,
+    path: str,
+    fps: int = 24,
+    chunk_frames: int = DEFAULT_CHUNK_FRAMES
+) -> Dict[str, Any]:
+    """
+    Замена save_videos_grid для одного видео с ограниченным буфером
+
+    Кадры передаются в тот же writer imageio-ffmpeg и в том же порядке,
+    что и в imageio.mimsave, поэтому файл совпадает побитово.
+
+    Args:
+        video: Тензор (1, c, t, h, w) со значениями в [0, 1]
+        path: Путь к файлу
+        fps: Частота кадров
+        chunk_frames: Кадров в чанке
+
+    Returns:
+        Статистика: число кадров, объем буферов и пиковый RSS процесса
+    """
+    channels, total, height, width = video.shape[-4:]
+    frames = write_frames(iter_frame_chunks(video, chunk_frames), path, fps=fps)
+    buffer_frames = min(chunk_frames, total)
+
+    stats = {
+        'frames': frames,
+        'chunk_frames': chunk_frames,
+        'buffer_bytes': buffer_frames * height * width * channels * (1 + video.element_size()),
+        'full_uint8_bytes': frames * height * width * channels,
+        'peak_rss_mb': _peak_rss_mb()
+    }
+    logger.info(
+        f"Видео записано потоково: {frames} кадров, буферы {stats['buffer_bytes'] / 1024**2:.1f} MB "
+        f"(вместо {stats['full_uint8_bytes'] / 1024**2:.1f} MB), пиковый RSS {stats['peak_rss_mb']:.0f} MB"
+    )
+    return stats
+
+
+def _peak_rss_mb() -> float:
+    """Пиковый RSS процесса в мегабайтах (ru_maxrss в KB на Linux)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class FragmentedMP4Writer:
+    """
+    Запись кадров во фрагментированный MP4 через ffmpeg
+
+    Файл начинается с пустого moov, а каждый фрагмент (по ключевому кадру,
+    раз в секунду) дописывается сразу после кодирования, поэтому файл
+    можно проигрывать и отдавать клиенту, пока запись еще идет.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        width: int,
+        height: int,
+        fps: int = 24,
+        codec: str = 'libx264',
+        preset: str = 'veryfast',
+        crf: int = 23
+    ):
+        self.path = path
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.frames_written = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        command = [
+            get_ffmpeg_exe(), '-y', '-loglevel', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+            '-s', f'{width}x{height}', '-r', str(fps),
+            '-i', '-',
+            *_codec_args(codec, preset, crf, gop=fps),
+            '-movflags', 'frag_keyframe+empty_moov+default_base_moof',
+            '-f', 'mp4', path
+        ]
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def write(self, frames: np.ndarray) -> None:
+        """Запись чанка кадров (t, h, w, 3) uint8"""
+        if frames.shape[1:] != (self.height, self.width, 3):
+            raise ValueError(f"Неверный размер кадров: {frames.shape[1:]}")
+        try:
+            self._process.stdin.write(np.ascontiguousarray(frames).data)
+            self._process.stdin.flush()
+        except BrokenPipeError:
+            raise RuntimeError(f"ffmpeg завершился с ошибкой: {self._read_error()}")
+        self.frames_written += len(frames)
+
+    def close(self) -> None:
+        """Завершение записи"""
+        if self._process.stdin and not self._process.stdin.closed:
+            self._process.stdin.close()
+        code = self._process.wait()
+        if code != 0:
+            raise RuntimeError(f"ffmpeg завершился с кодом {code}: {self._read_error()}")
+
+    def abort(self) -> None:
+        """Прерывание записи"""
+        self._process.kill()
+        self._process.wait()
+
+    def _read_error(self) -> str:
+        try:
+            return self._process.stderr.read().decode(errors='replace').strip()
+        except Exception:
+            return ''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def write_fragmented_mp4(
+    video,
+    path: str,
+    fps: int = 24,
+    chunk_frames: int = DEFAULT_CHUNK_FRAMES,
+    encode_options: Optional[Dict[str, Any]] = None
+) -> str:
+    """
+    Кодирование видео во фрагментированный MP4 по чанкам
+
+    Args:
+        video: Тензор (b, c, t, h, w) со значениями в [0, 1]
+        path: Путь к файлу
+        fps: Частота кадров
+        chunk_frames: Кадров в чанке
+        encode_options: codec/preset/crf (см. resolve_encode_options)
+
+    Returns:
+        str: путь к файлу
+    """
+    height, width = video.shape[-2], video.shape[-1]
+    with FragmentedMP4Writer(path, width, height, fps=fps, **(encode_options or {})) as writer:
+        for frames in iter_frame_chunks(video, chunk_frames):
+            writer.write(frames)
+    return path
+
+
+def encode_segments_parallel(
+    frames: np.ndarray,
+    path: str,
+    fps: int = 24,
+    codec: str = 'libx264',
+    preset: str = 'veryfast',
+    crf: int = 23,
+    max_workers: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Параллельное кодирование видео сегментами с последующей склейкой
+
+    Видео режется на сегменты, кратные GOP (одна секунда), каждый
+    сегмент начинается с ключевого кадра и кодируется отдельным ffmpeg.
+    Готовые сегменты склеиваются concat demuxer'ом без перекодирования.
+
+    Args:
+        frames: Кадры (t, h, w, 3) uint8
+        path: Путь к итоговому файлу
+        fps: Частота кадров
+        codec, preset, crf: Параметры кодека
+        max_workers: Число параллельных сегментов (по умолчанию - число ядер)
+
+    Returns:
+        Статистика кодирования
+    """
+    started = time.time()
+    total, height, width = frames.shape[:3]
+    cores = os.cpu_count() or 1
+    workers = max(1, min(max_workers or cores, cores))
+
+    gop = fps
+    segment_frames = max(gop, math.ceil(math.ceil(total / workers) / gop) * gop)
+    bounds = [(start, min(start + segment_frames, total)) for start in range(0, total, segment_frames)]
+    workers = min(workers, len(bounds))
+    threads_per_segment = max(1, cores // workers)
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    segment_dir = tempfile.mkdtemp(prefix='.segments_', dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        segment_paths = [os.path.join(segment_dir, f'{i:04d}.mp4') for i in range(len(bounds))]
+
+        def encode_segment(index):
+            start, end = bounds[index]
+            command = [
+                get_ffmpeg_exe(), '-y', '-loglevel', 'error',
+                '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+                '-s', f'{width}x{height}', '-r', str(fps),
+                '-i', '-',
+                *_codec_args(codec, preset, crf, gop=gop, threads=threads_per_segment),
+                segment_paths[index]
+            ]
+            result = subprocess.run(
+                command,
+                input=np.ascontiguousarray(frames[start:end]).data,
+                stderr=subprocess.PIPE
+            )
+            if result.returncode != 0:
+                raise RuntimeError(
+                    f"ffmpeg (сегмент {index}) завершился с кодом {result.returncode}: "
+                    f"{result.stderr.decode(errors='replace').strip()}"
+                )
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(encode_segment, range(len(bounds))))
+
+        list_path = os.path.join(segment_dir, 'segments.txt')
+        with open(list_path, 'w') as f:
+            for segment_path in segment_paths:
+                f.write(f"file '{segment_path}'\n")
+
+        result = subprocess.run(
+            [
+                get_ffmpeg_exe(), '-y', '-loglevel', 'error',
+                '-f', 'concat', '-safe', '0', '-i', list_path,
+                '-c', 'copy', '-movflags', '+faststart', path
+            ],
+            stderr=subprocess.PIPE
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"Ошибка склейки сегментов: {result.stderr.decode(errors='replace').strip()}")
+    finally:
+        shutil.rmtree(segment_dir, ignore_errors=True)
+
+    stats = {
+        'frames': total,
+        'segments': len(bounds),
+        'workers': workers,
+        'codec': codec,
+        'preset': preset,
+        'crf': crf,
+        'encode_time': round(time.time() - started, 3)
+    }
+    logger.info(
+        f"Видео закодировано сегментами: {len(bounds)} x {segment_frames} кадров, "
+        f"{workers} параллельно, {stats['encode_time']:.1f} с"
+    )
+    return stats
+
+
+def encode_video(video, path: str, fps: int = 24, encode_options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Кодирование тензора видео в MP4
+
+    Без encode_options файл пишется как раньше (save_video_streaming),
+    иначе - параллельно сегментами с заданным кодеком.
+    """
+    if not encode_options:
+        return save_video_streaming(video, path, fps=fps)
+
+    channels, total, height, width = video.shape[-4:]
+    frames = video_to_uint8(video, np.empty((total, height, width, channels), dtype=np.uint8))
+    return encode_segments_parallel(frames, path, fps=fps, **encode_options)
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Daur MedIA - Video Previews
+Постер (JPEG) и анимированное превью (WebP, при отсутствии - GIF) для готовых видео
+
+Превью строятся один раз после завершения задачи и хранятся на диске,
+поэтому списки задач загружают килобайты вместо целых MP4.
+"""
+
+import os
+import shutil
+import subprocess
+import threading
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Optional
+
+from video_encoder import get_ffmpeg_exe
+
+logger = logging.getLogger(__name__)
+
+POSTER_WIDTH = 480
+# Постер выбирается фильтром thumbnail среди первых кадров (~1 с при 24 fps);
+# короткие ролики он обрабатывает до конца, в отличие от -ss
+POSTER_FRAMES = 24
+ANIMATED_WIDTH = 320
+ANIMATED_FPS = 8
+ANIMATED_SECONDS = 4
+
+PREVIEW_KINDS = ('poster', 'animated')
+PREVIEW_MIMETYPES = {
+    'poster.jpg': 'image/jpeg',
+    'preview.webp': 'image/webp',
+    'preview.gif': 'image/gif'
+}
+
+
+class PreviewCache:
+    """Дисковый кеш превью: <cache_dir>/<task_id>/poster.jpg, preview.webp"""
+
+    def __init__(self, cache_dir: str, max_workers: int = 1):
+        """
+        Args:
+            cache_dir: Директория кеша
+            max_workers: Сколько превью строится параллельно
+        """
+        self.cache_dir = cache_dir
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='preview')
+        self._pending: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._webp_supported: Optional[bool] = None
+
+    def task_dir(self, task_id: str) -> str:
+        return os.path.join(self.cache_dir, task_id)
+
+    def get(self, task_id: str, kind: str = 'poster') -> Optional[str]:
+        """Путь к готовому превью или None"""
+        names = ('poster.jpg',) if kind == 'poster' else ('preview.webp', 'preview.gif')
+        for name in names:
+            path = os.path.join(self.task_dir(task_id), name)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def submit(self, task_id: str, video_path: str) -> Future:
+        """Фоновое построение превью (повторный вызов возвращает ту же задачу)"""
+        with self._lock:
+            future = self._pending.get(task_id)
+            if future is not None:
+                return future
+            future = self._executor.submit(self.build, task_id, video_path)
+            self._pending[task_id] = future
+
+        def _done(_future):
+            with self._lock:
+                self._pending.pop(task_id, None)
+            if _future.exception() is not None:
+                logger.warning(f"Превью задачи {task_id} не построены: {_future.exception()}")
+
+        future.add_done_callback(_done)
+        return future
+
+    def ensure(self, task_id: str, video_path: str, kind: str = 'poster') -> Optional[str]:
+        """Превью из кеша, при промахе - построение с ожиданием"""
+        path = self.get(task_id, kind)
+        if path is None:
+            self.submit(task_id, video_path).result()
+            path = self.get(task_id, kind)
+        return path
+
+    def remove(self, task_id: str) -> None:
+        """Удаление превью задачи"""
+        shutil.rmtree(self.task_dir(task_id), ignore_errors=True)
+
+    def build(self, task_id: str, video_path: str) -> Dict[str, str]:
+        """
+        Построение постера и анимированного превью
+
+        Файлы пишутся во временные имена и переименовываются атомарно,
+        чтобы читатели не получили недописанное изображение. Ошибка
+        постера не мешает построить анимированное превью; исключение
+        поднимается после него.
+        """
+        task_dir = self.task_dir(task_id)
+        os.makedirs(task_dir, exist_ok=True)
+        result = {}
+        poster_error = None
+
+        poster = os.path.join(task_dir, 'poster.jpg')
+        try:
+            if not os.path.exists(poster):
+                # Характерный кадр первой секунды: самый первый часто почти пустой
+                self._run_ffmpeg([
+                    '-i', video_path,
+                    '-frames:v', '1', '-vf', f'thumbnail=n={POSTER_FRAMES},scale={POSTER_WIDTH}:-2',
+                    '-q:v', '4', '-f', 'image2'
+                ], poster)
+            result['poster'] = poster
+        except RuntimeError as e:
+            poster_error = e
+
+        animated = self.get(task_id, 'animated')
+        if animated is None:
+            if self._supports_webp():
+                animated = os.path.join(task_dir, 'preview.webp')
+                self._run_ffmpeg([
+                    '-t', str(ANIMATED_SECONDS), '-i', video_path,
+                    '-vf', f'fps={ANIMATED_FPS},scale={ANIMATED_WIDTH}:-2',
+                    '-c:v', 'libwebp_anim', '-quality', '60', '-loop', '0', '-an',
+                    '-f', 'webp'
+                ], animated)
+            else:
+                animated = os.path.join(task_dir, 'preview.gif')
+                self._run_ffmpeg([
+                    '-t', str(ANIMATED_SECONDS), '-i', video_path,
+                    '-vf', (
+                        f'fps={ANIMATED_FPS},scale={ANIMATED_WIDTH}:-2:flags=lanczos,'
+                        'split[a][b];[a]palettegen=max_colors=128[p];[b][p]paletteuse'
+                    ),
+                    '-loop', '0', '-f', 'gif'
+                ], animated)
+        result['animated'] = animated
+
+        if poster_error is not None:
+            raise poster_error
+        logger.info(f"Превью задачи {task_id} готовы")
+        return result
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
+
+    def _run_ffmpeg(self, args, output_path: str) -> None:
+        tmp_path = output_path + '.tmp'
+        command = [get_ffmpeg_exe(), '-y', '-loglevel', 'error', *args, tmp_path]
+        result = subprocess.run(command, stderr=subprocess.PIPE)
+        if result.returncode != 0 or not os.path.exists(tmp_path):
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise RuntimeError(f"Ошибка построения превью: {result.stderr.decode(errors='replace').strip()}")
+        os.replace(tmp_path, output_path)
+
+    def _supports_webp(self) -> bool:
+        """Есть ли в сборке ffmpeg кодировщик анимированного WebP"""
+        if self._webp_supported is None:
+            try:
+                encoders = subprocess.run(
+                    [get_ffmpeg_exe(), '-hide_banner', '-encoders'],
+                    capture_output=True, text=True
+                ).stdout
+                self._webp_supported = 'libwebp_anim' in encoders
+            except OSError:
+                self._webp_supported = False
+        return self._webp_supported
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+Daur MedIA - Video Renditions
+Лестница HLS-рендиций с перекодированием по запросу и LRU-кешем на диске
+
+Мастер-плейлист строится из параметров задачи без перекодирования.
+Рендиция перекодируется при первом запросе ее плейлиста, затем хранится
+в кеше, размер которого ограничен: при переполнении удаляются давно не
+запрошенные рендиции.
+"""
+
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+import uuid
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from video_encoder import get_ffmpeg_exe
+
+logger = logging.getLogger(__name__)
+
+# (имя, высота, битрейт видео в кбит/с)
+RENDITION_LADDER = (
+    ('720p', 720, 2800),
+    ('540p', 540, 1800),
+    ('360p', 360, 800),
+    ('240p', 240, 400)
+)
+
+SEGMENT_SECONDS = 2
+PLAYLIST_NAME = 'index.m3u8'
+SEGMENT_PATTERN = re.compile(r'^seg_\d{3,}\.ts$')
+PLAYLIST_MIMETYPE = 'application/vnd.apple.mpegurl'
+SEGMENT_MIMETYPE = 'video/mp2t'
+# Суффикс каталогов вытесненных рендиций, ожидающих удаления
+TRASH_SUFFIX = '.trash-'
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for entry in os.scandir(path):
+        if entry.is_file():
+            total += entry.stat().st_size
+    return total
+
+
+def _even(value: float) -> int:
+    """Ближайшее четное (yuv420p требует четных размеров)"""
+    return max(2, int(round(value / 2)) * 2)
+
+
+class TranscodeCache:
+    """Кеш рендиций: <cache_dir>/<task_id>/<rendition>/index.m3u8 + seg_NNN.ts"""
+
+    def __init__(self, cache_dir: str, max_bytes: int, fps: int = 24):
+        """
+        Args:
+            cache_dir: Директория кеша
+            max_bytes: Предельный суммарный размер рендиций
+            fps: Частота кадров исходных видео (для выравнивания GOP по сегментам)
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.fps = fps
+        self._entries: 'OrderedDict[Tuple[str, str], int]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._build_locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'transcode_time': 0.0
+        }
+        self._load_existing()
+
+    @classmethod
+    def from_env(cls, cache_dir: str) -> 'TranscodeCache':
+        """Кеш с пределом из DAUR_MEDIA_TRANSCODE_CACHE_GB (по умолчанию 5 ГБ)"""
+        max_gb = float(os.environ.get('DAUR_MEDIA_TRANSCODE_CACHE_GB', '5'))
+        return cls(cache_dir, int(max_gb * 1024**3))
+
+    def renditions_for(self, width: int, height: int) -> List[Dict[str, Any]]:
+        """Ступени лестницы не выше исходного разрешения"""
+        renditions = []
+        for name, rung_height, bitrate in RENDITION_LADDER:
+            if rung_height > height:
+                continue
+            renditions.append({
+                'name': name,
+                'width': _even(width * rung_height / height),
+                'height': rung_height,
+                'bitrate': bitrate
+            })
+        if not renditions:
+            # Исходник меньше нижней ступени - одна рендиция в исходном размере
+            name, _, bitrate = RENDITION_LADDER[-1]
+            renditions.append({'name': name, 'width': _even(width), 'height': _even(height), 'bitrate': bitrate})
+        return renditions
+
+    def master_playlist(self, width: int, height: int) -> str:
+        """Мастер-плейлист HLS со ссылками на плейлисты рендиций"""
+        lines = ['#EXTM3U', '#EXT-X-VERSION:3']
+        for rendition in self.renditions_for(width, height):
+            # BANDWIDTH - пиковый битрейт с учетом maxrate и контейнера
+            bandwidth = int(rendition['bitrate'] * 1000 * 1.2)
+            lines.append(
+                f"#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},"
+                f"RESOLUTION={rendition['width']}x{rendition['height']},"
+                f'CODECS="avc1.4d401f"'
+            )
+            lines.append(f"renditions/{rendition['name']}/{PLAYLIST_NAME}")
+        return '\n'.join(lines) + '\n'
+
+    def get_file(
+        self,
+        task_id: str,
+        rendition_name: str,
+        filename: str,
+        source_path: str,
+        width: int,
+        height: int
+    ) -> Optional[str]:
+        """
+        Путь к файлу рендиции (плейлисту или сегменту)
+
+        Запрос плейлиста отсутствующей рендиции запускает перекодирование
+        и ждет его завершения; сегменты отдаются только из кеша.
+
+        Returns:
+            Путь к файлу или None, если такого файла нет
+        """
+        if filename != PLAYLIST_NAME and not SEGMENT_PATTERN.match(filename):
+            return None
+        rendition = next(
+            (r for r in self.renditions_for(width, height) if r['name'] == rendition_name),
+            None
+        )
+        if rendition is None:
+            return None
+
+        key = (task_id, rendition_name)
+        if filename == PLAYLIST_NAME:
+            self._ensure(key, rendition, source_path)
+        else:
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+
+        path = os.path.join(self._rendition_dir(key), filename)
+        return path if os.path.exists(path) else None
+
+    def remove(self, task_id: str) -> None:
+        """Удаление всех рендиций задачи"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == task_id]:
+                del self._entries[key]
+        shutil.rmtree(os.path.join(self.cache_dir, task_id), ignore_errors=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.stats,
+                'transcode_time': round(self.stats['transcode_time'], 3),
+                'entries': len(self._entries),
+                'size_bytes': sum(self._entries.values()),
+                'max_bytes': self.max_bytes
+            }
+
+    def _rendition_dir(self, key: Tuple[str, str]) -> str:
+        return os.path.join(self.cache_dir, *key)
+
+    def _ensure(self, key: Tuple[str, str], rendition: Dict[str, Any], source_path: str) -> None:
+        """Рендиция в кеше (перекодирование при промахе, одно на ключ)"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+
+        with build_lock:
+            with self._lock:
+                if key in self._entries:
+                    # Рендицию успел построить параллельный запрос
+                    self._entries.move_to_end(key)
+                    self.stats['hits'] += 1
+                    return
+                self.stats['misses'] += 1
+
+            started = time.time()
+            try:
+                size = self._transcode(key, rendition, source_path)
+            except Exception:
+                # Блокировка сборки не нужна и после неудачной попытки
+                with self._lock:
+                    self._build_locks.pop(key, None)
+                raise
+            # Запись и снятие блокировки сборки - один шаг: запрос между
+            # ними запустил бы второе перекодирование того же ключа
+            with self._lock:
+                self._entries[key] = size
+                self._build_locks.pop(key, None)
+                self.stats['transcode_time'] += time.time() - started
+                trash = self._evict(keep=key)
+
+        for path in trash:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def _transcode(self, key: Tuple[str, str], rendition: Dict[str, Any], source_path: str) -> int:
+        """Перекодирование исходника в HLS-рендицию, возвращает размер на диске"""
+        target_dir = self._rendition_dir(key)
+        tmp_dir = target_dir + '.tmp'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        bitrate = rendition['bitrate']
+        gop = self.fps * SEGMENT_SECONDS
+        command = [
+            get_ffmpeg_exe(), '-y', '-loglevel', 'error',
+            '-i', source_path,
+            '-vf', f"scale={rendition['width']}:{rendition['height']}",
+            '-c:v', 'libx264', '-preset', 'veryfast', '-profile:v', 'main',
+            '-pix_fmt', 'yuv420p',
+            '-b:v', f'{bitrate}k', '-maxrate', f'{int(bitrate * 1.07)}k', '-bufsize', f'{bitrate * 2}k',
+            # Ключевой кадр в начале каждого сегмента для переключения рендиций
+            '-g', str(gop), '-keyint_min', str(gop), '-sc_threshold', '0',
+            '-an',
+            '-f', 'hls', '-hls_time', str(SEGMENT_SECONDS), '-hls_playlist_type', 'vod',
+            '-hls_segment_filename', os.path.join(tmp_dir, 'seg_%03d.ts'),
+            os.path.join(tmp_dir, PLAYLIST_NAME)
+        ]
+        result = subprocess.run(command, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise RuntimeError(f"Ошибка перекодирования: {result.stderr.decode(errors='replace').strip()}")
+
+        shutil.rmtree(target_dir, ignore_errors=True)
+        os.replace(tmp_dir, target_dir)
+        logger.info(f"Рендиция {key[1]} задачи {key[0]} готова")
+        return _dir_size(target_dir)
+
+    def _evict(self, keep: Tuple[str, str]) -> List[str]:
+        """
+        Вытеснение давно не запрошенных рендиций (вызывается под _lock)
+
+        Каталоги вытесненных переименовываются тут же, под _lock, и
+        удаляются вызывающим кодом вне блокировки: рендиция, запрошенная
+        снова до удаления, перестраивается в новый каталог, а не теряет его.
+
+        Returns:
+            Пути переименованных каталогов для удаления
+        """
+        trash = []
+        total = sum(self._entries.values())
+        for key in list(self._entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep or key in self._build_locks:
+                continue
+            total -= self._entries.pop(key)
+            path = f"{self._rendition_dir(key)}{TRASH_SUFFIX}{uuid.uuid4().hex}"
+            try:
+                os.rename(self._rendition_dir(key), path)
+                trash.append(path)
+            except FileNotFoundError:
+                pass
+            self.stats['evictions'] += 1
+        return trash
+
+    def _load_existing(self) -> None:
+        """Учет рендиций, оставшихся с прошлого запуска (старые первыми)"""
+        if not os.path.isdir(self.cache_dir):
+            return
+        found = []
+        for task_entry in os.scandir(self.cache_dir):
+            if not task_entry.is_dir():
+                continue
+            for entry in os.scandir(task_entry.path):
+                if entry.name.endswith('.tmp') or TRASH_SUFFIX in entry.name:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                    continue
+                if entry.is_dir() and os.path.exists(os.path.join(entry.path, PLAYLIST_NAME)):
+                    found.append((entry.stat().st_mtime, (task_entry.name, entry.name), _dir_size(entry.path)))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
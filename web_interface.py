@@ -9,14 +9,16 @@ import json
 import threading
 import time
 from datetime import datetime
-from flask import Flask, render_template_string, request, jsonify, send_file
+from flask import Flask, render_template_string, request, jsonify
 from werkzeug.utils import secure_filename
 import uuid
 
 from hunyuan_video_interface import HunyuanVideoGenerator
+from video_delivery import configure_video_delivery, send_video
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'daur-media-secret-key'
+configure_video_delivery(app)
 
 # Глобальные переменные
 generator = None
@@ -642,7 +644,7 @@ def get_tasks():
 
 @app.route('/api/download/<task_id>')
 def download_video(task_id):
-    """Скачивание сгенерированного видео"""
+    """Скачивание сгенерированного видео (?inline=1 - просмотр в браузере)"""
     global tasks
     
     with task_lock:
@@ -657,11 +659,7 @@ def download_video(task_id):
     if 'output_path' not in task or not os.path.exists(task['output_path']):
         return jsonify({'error': 'Файл не найден'}), 404
     
-    return send_file(
-        task['output_path'],
-        as_attachment=True,
-        download_name=f"video_{task_id}.mp4"
-    )
+    return send_video(task['output_path'], download_name=f"video_{task_id}.mp4")
 
 if __name__ == '__main__':
     # Создание директории для результатов
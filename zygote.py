@@ -0,0 +1,483 @@
+#!/usr/bin/env python3
+"""
+Daur MedIA - Zygote
+Процесс-зигота с загруженными моделями и воркеры, порождаемые через fork
+
+Зигота запускается отдельным процессом (spawn), один раз импортирует
+torch и HunyuanVideo и загружает веса. Воркеры генерации - ее потомки,
+созданные os.fork(): импорт и загрузка им не нужны, а веса делятся с
+зиготой copy-on-write, поэтому новый воркер готов за доли секунды.
+Падение воркера (segfault, OOM killer) завершает только его задачу,
+следующий воркер снова порождается из зиготы.
+
+Ограничения fork:
+- только CPU: CUDA после инициализации в родителе в потомке не работает
+- зигота считает в один поток: пул потоков OpenMP, созданный до fork,
+  в потомке зависает; число потоков воркер задает сам после fork
+- параллелизм по последовательности (группа gloo) в зиготе не поддерживается
+- прогрев скомпилированных корзин выполняет каждый воркер (графы грузятся
+  из кеша на диске), а не однопоточная зигота
+
+Воркеру можно передать слот ядер (cpu_placement): после fork он
+привязывается к ядрам слота и берет потоков по их числу.
+
+Веб-сервер torch не импортирует: с зиготой и воркерами он общается
+через каналы multiprocessing, канал воркера передается зиготе для fork.
+"""
+
+import os
+import time
+import signal
+import logging
+import threading
+import multiprocessing
+from typing import Any, Callable, Dict, Optional
+
+import psutil
+
+from cpu_placement import apply_placement
+
+logger = logging.getLogger(__name__)
+
+# Проверка завершившихся воркеров, пока зигота ждет команд
+REAP_INTERVAL = 1.0
+
+# Предел ожидания результата задачи от воркера (секунды), после
+# которого зависший воркер убивается
+DEFAULT_JOB_TIMEOUT = 4 * 3600
+
+
+class ZygoteUnavailable(RuntimeError):
+    """Зигота не запущена или ее процесс завершился"""
+
+
+def zygote_enabled() -> bool:
+    """Режим зиготы включен (DAUR_MEDIA_ZYGOTE=1)"""
+    return os.environ.get('DAUR_MEDIA_ZYGOTE', '0').lower() in ('1', 'true', 'yes')
+
+
+def create_hunyuan_generator(spec: Dict[str, Any]):
+    """Генератор HunyuanVideo для зиготы (вызывается в процессе зиготы)"""
+    from hunyuan_video_interface import HunyuanVideoGenerator
+    from sequence_parallel import ParallelConfig
+
+    if ParallelConfig.from_env().enabled:
+        logger.warning("Параллелизм по последовательности в режиме зиготы не поддерживается, отключен")
+    return HunyuanVideoGenerator(
+        model_path=spec.get('model_base'),
+        dit_weight=spec.get('dit_weight'),
+        parallel=ParallelConfig()
+    )
+
+
+def _set_threads(threads: int) -> None:
+    import torch
+    torch.set_num_threads(threads)
+
+
+def _worker_main(generator, conn, threads: Optional[int], placement: Optional[Dict[str, Any]] = None) -> None:
+    """Цикл воркера после fork: задачи из канала до его закрытия"""
+    if placement is not None:
+        apply_placement(placement)
+    elif threads:
+        _set_threads(threads)
+    if hasattr(generator, 'warmup_compiled'):
+        generator.warmup_compiled()
+    while True:
+        try:
+            kwargs = conn.recv()
+        except (EOFError, OSError):
+            break
+        if kwargs is None:
+            break
+        try:
+            result = generator.generate_video(**kwargs)
+        except Exception as e:
+            result = {'success': False, 'error': str(e)}
+        conn.send(result)
+
+
+def _fork_worker(generator, conn, control, placement: Optional[Dict[str, Any]] = None) -> int:
+    """fork воркера; в потомке не возвращается"""
+    pid = os.fork()
+    if pid:
+        return pid
+    # Потомок: канал управления зиготы ему не нужен
+    control.close()
+    code = 0
+    try:
+        cpu_config = getattr(generator, 'cpu_config', None)
+        _worker_main(generator, conn, cpu_config.intra_op_threads if cpu_config is not None else None, placement)
+    except BaseException:
+        logger.exception("Ошибка воркера зиготы")
+        code = 1
+    finally:
+        os._exit(code)
+
+
+def _zygote_main(control, factory: Callable[[Dict[str, Any]], Any]) -> None:
+    """
+    Цикл зиготы: команды из канала управления
+
+    Команды - кортежи (имя, аргументы...), ответ - (успех, данные):
+    - ('load', spec): загрузка модели (повторная - только счетчик ссылок)
+    - ('release', name): снятие ссылки; модель без ссылок выгружается
+    - ('fork', name, conn, placement): воркер модели с каналом conn
+      и слотом ядер (или None), ответ - pid
+    - ('stats',): загруженные модели и живые воркеры
+    """
+    # Задачи генерации считают воркеры; зигота не создает пулов потоков
+    _set_threads(1)
+    process = psutil.Process()
+    models: Dict[str, Dict[str, Any]] = {}
+    workers: Dict[int, str] = {}
+    forks = 0
+
+    def reap():
+        while workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                workers.clear()
+                return
+            if not pid:
+                return
+            name = workers.pop(pid, None)
+            if status:
+                logger.warning(f"Воркер {pid} модели {name} завершился с кодом {status}")
+
+    while True:
+        if not control.poll(REAP_INTERVAL):
+            reap()
+            continue
+        try:
+            command = control.recv()
+        except EOFError:
+            break
+        reap()
+        if command is None:
+            break
+        name = command[0]
+        try:
+            if name == 'load':
+                spec = command[1]
+                entry = models.get(spec['name'])
+                if entry is None:
+                    generator = factory(spec)
+                    _set_threads(1)
+                    memory_before = process.memory_info().rss
+                    started = time.time()
+                    if not generator.initialize(warmup=False):
+                        raise RuntimeError(f"Не удалось загрузить модель {spec['name']}")
+                    entry = models[spec['name']] = {
+                        'generator': generator,
+                        'refs': 0,
+                        'memory_bytes': max(0, process.memory_info().rss - memory_before),
+                        'load_seconds': round(time.time() - started, 1)
+                    }
+                    shared = False
+                else:
+                    shared = True
+                entry['refs'] += 1
+                control.send((True, {
+                    'info': entry['generator'].get_model_info(),
+                    # Память учитывается один раз: остальные ссылки делят веса
+                    'memory_bytes': 0 if shared else entry['memory_bytes'],
+                    'load_seconds': entry['load_seconds']
+                }))
+            elif name == 'release':
+                entry = models.get(command[1])
+                if entry is not None:
+                    entry['refs'] -= 1
+                    if entry['refs'] <= 0:
+                        models.pop(command[1])['generator'].unload()
+                control.send((True, None))
+            elif name == 'fork':
+                model_name, conn, placement = command[1], command[2], command[3]
+                if model_name not in models:
+                    raise RuntimeError(f"Модель {model_name} не загружена в зиготе")
+                pid = _fork_worker(models[model_name]['generator'], conn, control, placement)
+                conn.close()
+                workers[pid] = model_name
+                forks += 1
+                control.send((True, pid))
+            elif name == 'stats':
+                control.send((True, {
+                    'pid': os.getpid(),
+                    'models': {
+                        model_name: {key: value for key, value in entry.items() if key != 'generator'}
+                        for model_name, entry in models.items()
+                    },
+                    'workers': dict(workers),
+                    'forks': forks,
+                    'rss_bytes': process.memory_info().rss
+                }))
+            else:
+                raise ValueError(f"Неизвестная команда зиготы: {name}")
+        except Exception as e:
+            control.send((False, str(e)))
+
+    for pid in list(workers):
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+
+class Zygote:
+    """Клиент зиготы в процессе веб-сервера"""
+
+    def __init__(self, factory: Callable[[Dict[str, Any]], Any] = create_hunyuan_generator):
+        """
+        Args:
+            factory: Создание генератора по описанию модели (выполняется
+                в зиготе; должна импортироваться по имени - для spawn)
+        """
+        self.factory = factory
+        self._context = multiprocessing.get_context('spawn')
+        self._process = None
+        self._control = None
+        # Номер запуска: модели, загруженные в прежнюю зиготу, в новой не загружены
+        self.generation = 0
+        # Канал управления один: команды от потоков воркеров по очереди
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._process is not None and self._process.is_alive()
+
+    def start(self) -> None:
+        """Запуск зиготы (если еще не запущена или завершилась)"""
+        with self._lock:
+            if self.running:
+                return
+            control, child_control = self._context.Pipe()
+            self._process = self._context.Process(
+                target=_zygote_main, args=(child_control, self.factory), name='daur-media-zygote', daemon=True
+            )
+            self._process.start()
+            child_control.close()
+            self._control = control
+            self.generation += 1
+            logger.info(f"Зигота запущена: pid {self._process.pid}")
+
+    def stop(self) -> None:
+        with self._lock:
+            if self._process is None:
+                return
+            try:
+                self._control.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            self._process.join(timeout=30)
+            if self._process.is_alive():
+                self._process.terminate()
+            self._control.close()
+            self._process = None
+            self._control = None
+
+    def load(self, spec: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Загрузка модели в зиготу (или ссылка на уже загруженную)
+
+        Raises:
+            RuntimeError: зигота не смогла загрузить модель
+        """
+        self.start()
+        return self._request('load', spec)
+
+    def release(self, name: str) -> None:
+        if self.running:
+            self._request('release', name)
+
+    def fork_worker(self, name: str, placement: Optional[Dict[str, Any]] = None):
+        """
+        Новый воркер модели
+
+        Args:
+            name: Модель
+            placement: Слот ядер воркера (CorePlacer.acquire) или None
+
+        Returns:
+            (канал к воркеру, pid воркера)
+        """
+        conn, child_conn = self._context.Pipe()
+        try:
+            pid = self._request('fork', name, child_conn, placement)
+        finally:
+            child_conn.close()
+        return conn, pid
+
+    def get_stats(self) -> Optional[Dict[str, Any]]:
+        """Состояние зиготы; пока она загружает модель - только отметка занятости"""
+        if not self.running:
+            return None
+        if not self._lock.acquire(blocking=False):
+            return {'pid': self._process.pid, 'busy': True}
+        try:
+            return self._exchange(('stats',))
+        finally:
+            self._lock.release()
+
+    def _request(self, *command):
+        with self._lock:
+            return self._exchange(command)
+
+    def _exchange(self, command):
+        if self._control is None:
+            raise ZygoteUnavailable("Зигота не запущена")
+        try:
+            self._control.send(command)
+            ok, payload = self._control.recv()
+        except (EOFError, BrokenPipeError, OSError) as e:
+            # Процесс зиготы погиб (OOM killer, падение): следующий load()
+            # запустит новую
+            self._reset()
+            raise ZygoteUnavailable(f"Зигота недоступна: {e}")
+        if not ok:
+            raise RuntimeError(payload)
+        return payload
+
+    def _reset(self) -> None:
+        """Сброс погибшей зиготы (под _lock)"""
+        logger.error(f"Зигота (pid {self._process.pid if self._process else None}) недоступна, будет перезапущена")
+        self._control.close()
+        if self._process.is_alive():
+            self._process.kill()
+        self._process.join(timeout=10)
+        self._process = None
+        self._control = None
+
+
+class ZygoteGenerator:
+    """
+    Генератор модели, работающий в воркере, порожденном зиготой
+
+    Повторяет интерфейс HunyuanVideoGenerator для пула моделей и
+    потока генерации. Кодирование видео выполняет сам воркер: пул
+    кодировщиков веб-сервера в другой процесс не передается.
+
+    Если зигота погибла, модель один раз загружается в новой до отказа
+    задачи; воркер, не вернувший результат за job_timeout, убивается.
+    """
+
+    def __init__(
+        self,
+        zygote: Zygote,
+        spec: Dict[str, Any],
+        placement: Optional[Dict[str, Any]] = None,
+        job_timeout: Optional[float] = None
+    ):
+        """
+        Args:
+            zygote: Клиент зиготы
+            spec: Описание модели
+            placement: Слот ядер для воркеров этого генератора
+            job_timeout: Предел задачи в секундах (по умолчанию -
+                DAUR_MEDIA_ZYGOTE_JOB_TIMEOUT или 4 часа)
+        """
+        self.zygote = zygote
+        self.spec = spec
+        self.placement = placement
+        self.job_timeout = job_timeout or float(os.environ.get('DAUR_MEDIA_ZYGOTE_JOB_TIMEOUT', DEFAULT_JOB_TIMEOUT))
+        self.initialized = False
+        self.memory_bytes: Optional[float] = None
+        self._info: Dict[str, Any] = {}
+        self._conn = None
+        self._pid: Optional[int] = None
+        self._generation = 0
+        self.metrics = {'forks': 0, 'crashes': 0, 'timeouts': 0, 'zygote_restarts': 0, 'fork_seconds': 0.0}
+
+    def initialize(self) -> bool:
+        try:
+            reply = self.zygote.load(self.spec)
+        except RuntimeError as e:
+            logger.error(f"Зигота не загрузила модель {self.spec['name']}: {e}")
+            return False
+        self._info = reply['info']
+        self.memory_bytes = reply['memory_bytes']
+        self._generation = self.zygote.generation
+        self.initialized = True
+        return True
+
+    def unload(self) -> None:
+        self._stop_worker()
+        if self.initialized and self._generation == self.zygote.generation:
+            self.zygote.release(self.spec['name'])
+        self.initialized = False
+
+    def generate_video(self, encode_pool=None, **kwargs) -> Dict[str, Any]:
+        if not self.initialized and not self.initialize():
+            return {'success': False, 'error': 'Не удалось инициализировать HunyuanVideo'}
+        try:
+            try:
+                if self._generation != self.zygote.generation:
+                    raise ZygoteUnavailable("зигота перезапущена")
+                self._ensure_worker()
+            except ZygoteUnavailable as e:
+                # Зигота погибла вместе с моделью: загрузка в новой, один раз
+                logger.warning(f"Модель {self.spec['name']} загружается заново: {e}")
+                self._stop_worker()
+                self.initialized = False
+                self.metrics['zygote_restarts'] += 1
+                if not self.initialize():
+                    return {'success': False, 'error': f"Зигота недоступна: {e}"}
+                self._ensure_worker()
+            self._conn.send(kwargs)
+            if not self._conn.poll(self.job_timeout):
+                pid = self._pid
+                self._kill_worker()
+                self.metrics['timeouts'] += 1
+                return {'success': False, 'error': f"Воркер {pid} не завершил задачу за {self.job_timeout:g} с"}
+            return self._conn.recv()
+        except (EOFError, BrokenPipeError, OSError):
+            # Воркер упал: задача завершается ошибкой, следующая получит новый воркер
+            pid = self._pid
+            self._stop_worker()
+            self.metrics['crashes'] += 1
+            return {'success': False, 'error': f"Процесс воркера {pid} завершился аварийно"}
+        except RuntimeError as e:
+            return {'success': False, 'error': str(e)}
+
+    def get_model_info(self) -> Dict[str, Any]:
+        info = dict(self._info) if self._info else {
+            'model_path': self.spec.get('model_base'),
+            'dit_weight': self.spec.get('dit_weight')
+        }
+        info['initialized'] = self.initialized
+        info['zygote'] = {
+            'worker_pid': self._pid,
+            'placement': self.placement,
+            'memory_bytes': self.memory_bytes,
+            'metrics': dict(self.metrics, fork_seconds=round(self.metrics['fork_seconds'], 3))
+        }
+        return info
+
+    def _ensure_worker(self) -> None:
+        if self._conn is not None:
+            return
+        started = time.time()
+        self._conn, self._pid = self.zygote.fork_worker(self.spec['name'], self.placement)
+        self.metrics['forks'] += 1
+        self.metrics['fork_seconds'] += time.time() - started
+
+    def _kill_worker(self) -> None:
+        """Остановка зависшего воркера (его завершение обработает зигота)"""
+        try:
+            os.kill(self._pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        self._conn.close()
+        self._conn = None
+        self._pid = None
+
+    def _stop_worker(self) -> None:
+        if self._conn is None:
+            return
+        try:
+            self._conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self._conn.close()
+        self._conn = None
+        self._pid = None